@@ -1,16 +1,37 @@
 # src/analysis/__init__.py
-from .performance_metrics import PerformanceAnalyzer
-from .customer_insights import CustomerInsights
+from typing import TYPE_CHECKING
+from ..utils.lazy import lazy_exports
+
+_EXPORTS = {
+    'PerformanceAnalyzer': 'performance_metrics',
+    'CustomerInsights': 'customer_insights',
+    'FusedAggregator': 'fused_aggregates',
+    'ScenarioScorer': 'scenarios'
+}
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
+
+if TYPE_CHECKING:
+    from .performance_metrics import PerformanceAnalyzer
+    from .customer_insights import CustomerInsights
+    from .fused_aggregates import FusedAggregator
+    from .scenarios import ScenarioScorer
 
 # src/analysis/performance_metrics.py
+import json
 import pandas as pd
-from typing import Dict, Any
+from collections import deque
+from typing import Dict, Any, Optional
 import numpy as np
 from datetime import datetime
+from pathlib import Path
+from ..utils import profiling
+from ..utils.profiling import StageRecorder
 
 class PerformanceAnalyzer:
-    def __init__(self):
-        self.metrics_history = []
+    def __init__(self, history_size: int = 100, recorder: Optional[StageRecorder] = None):
+        self.metrics_history = deque(maxlen=history_size)
+        self.recorder = recorder
     
     def calculate_metrics(self, data: pd.DataFrame) -> Dict[str, float]:
         """Calculate key performance metrics."""
@@ -30,8 +51,28 @@ class PerformanceAnalyzer:
         return 0.0
     
     def _calculate_processing_time(self, data: pd.DataFrame) -> float:
-        """Calculate average processing time per 1000 records."""
-        return len(data) / 1000 * 2.3  # 2.3s baseline per 1000 records
+        """Calculate measured processing time per 1000 records across recorded stages."""
+        records = [r for r in self._recorder().records if r['rows']]
+        rows = sum(r['rows'] for r in records)
+        if not rows:
+            return 0.0
+        return sum(r['wall_seconds'] for r in records) / rows * 1000
+    
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Percentile summary of recorded wall time, CPU, RSS growth and throughput per stage."""
+        return self._recorder().summary()
+    
+    def export_metrics(self, path: str = 'results/stage_metrics.jsonl') -> str:
+        """Append stage measurements and the metrics history to a JSON-lines file."""
+        self._recorder().export(path)
+        with open(path, 'a') as f:
+            for metrics in self.metrics_history:
+                f.write(json.dumps({'stage': 'performance_metrics', **metrics}, default=str) + '\n')
+        return str(path)
+    
+    def _recorder(self) -> StageRecorder:
+        # Resolved lazily so the process-wide recorder can be swapped out
+        return self.recorder if self.recorder is not None else profiling.recorder
     
     def _calculate_prediction_accuracy(self, data: pd.DataFrame) -> float:
         """Calculate prediction model accuracy."""
@@ -47,6 +88,8 @@ class PerformanceAnalyzer:
         
         prev_metrics = self.metrics_history[-2]
         current_metrics = self.metrics_history[-1]
+        if not prev_metrics['allocation_accuracy']:
+            return 0.0
         
         improvement = (
             (current_metrics['allocation_accuracy'] - prev_metrics['allocation_accuracy']) / 
@@ -57,29 +100,114 @@ class PerformanceAnalyzer:
 # src/analysis/customer_insights.py
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterable, Optional
 from datetime import datetime
+from ..models.approximate import (
+    stratified_sample, progressive_estimate, estimate_mean, estimate_quantile, estimate_variance
+)
+from ..utils.profiling import profiled
+from .fused_aggregates import FusedAggregator
 
 class CustomerInsights:
-    def __init__(self):
+    def __init__(self, fused: bool = False):
         self.insights = {}
+        self.fused = fused
     
-    def generate_insights(self, data: pd.DataFrame) -> Dict[str, Any]:
-        """Generate comprehensive customer insights."""
+    @profiled()
+    def generate_insights(self, data: pd.DataFrame,
+                          transaction_chunks: Optional[Iterable[pd.DataFrame]] = None) -> Dict[str, Any]:
+        """Generate comprehensive customer insights.
+        
+        When `transaction_chunks` is given, category and channel behavior is
+        computed from the streamed transactions instead of `data`. In fused
+        mode all aggregates are planned up front and evaluated over the column
+        arrays in a minimal number of passes, with the same result structure.
+        """
+        if self.fused:
+            insights = self._generate_fused(data)
+        else:
+            insights = {
+                'segmentation': self._analyze_segments(data),
+                'behavior': self._analyze_behavior(data),
+                'value': self._analyze_customer_value(data)
+            }
+        if transaction_chunks is not None:
+            insights['behavior'].update(self.analyze_transaction_chunks(transaction_chunks))
+        return insights
+    
+    def _generate_fused(self, data: pd.DataFrame) -> Dict[str, Any]:
+        """Compute all insights from one FusedAggregator plan."""
+        plan = (FusedAggregator()
+                .group('segment', 'customer_id', 'count')
+                .group('segment', 'total_spent', 'mean')
+                .group('segment', 'purchase_frequency', 'mean')
+                .column('purchase_frequency', 'mean')
+                .column('avg_transaction', 'mean')
+                .column('lifetime_value', 'mean', 'median', 'var'))
+        if 'product_category' in data.columns:
+            plan.group('product_category', 'amount', 'sum')
+        if 'channel' in data.columns:
+            plan.group('channel', 'transaction_id', 'count')
+        if 'days_between_purchases' in data.columns:
+            plan.column('days_between_purchases', 'mean', 'std')
+        result = plan.evaluate(data)
+        groups, columns = result['groups'], result['columns']
+        
+        categories = groups.get('product_category')
+        channels = groups.get('channel')
+        regularity = 0.0
+        if 'days_between_purchases' in columns:
+            intervals = columns['days_between_purchases']
+            regularity = 1 - intervals['std'] / intervals['mean']
         return {
-            'segmentation': self._analyze_segments(data),
-            'behavior': self._analyze_behavior(data),
-            'value': self._analyze_customer_value(data)
+            'segmentation': self._summarize_segments(groups['segment'].droplevel(1, axis=1)),
+            'behavior': {
+                'purchase_patterns': {
+                    'avg_purchase_frequency': columns['purchase_frequency']['mean'],
+                    'avg_basket_size': columns['avg_transaction']['mean'],
+                    'purchase_regularity': regularity
+                },
+                'category_preferences': {} if categories is None else self._summarize_categories(
+                    categories[('amount', 'sum')].rename('amount')
+                ),
+                'channel_usage': {} if channels is None else self._summarize_channels(
+                    channels[('transaction_id', 'count')].rename('transaction_id')
+                )
+            },
+            'value': {
+                'average_customer_value': columns['lifetime_value']['mean'],
+                'median_customer_value': columns['lifetime_value']['median'],
+                'value_variance': columns['lifetime_value']['var']
+            }
+        }
+    
+    def analyze_transaction_chunks(self, chunks: Iterable[pd.DataFrame]) -> Dict[str, Any]:
+        """Analyze category and channel usage over streamed transaction chunks."""
+        categories, channels = None, None
+        for chunk in chunks:
+            if 'product_category' in chunk.columns:
+                part = chunk.groupby('product_category', observed=True)['amount'].sum()
+                categories = part if categories is None else categories.add(part, fill_value=0)
+            if 'channel' in chunk.columns:
+                part = chunk.groupby('channel', observed=True)['transaction_id'].count()
+                channels = part if channels is None else channels.add(part, fill_value=0)
+        return {
+            'category_preferences': self._summarize_categories(categories),
+            'channel_usage': self._summarize_channels(channels)
         }
     
     def _analyze_segments(self, data: pd.DataFrame) -> Dict[str, Any]:
         """Analyze customer segments."""
-        segment_analysis = data.groupby('segment').agg({
+        segment_analysis = data.groupby('segment', observed=True).agg({
             'customer_id': 'count',
             'total_spent': 'mean',
             'purchase_frequency': 'mean'
-        }).round(2)
-        
+        })
+        return self._summarize_segments(segment_analysis)
+    
+    def _summarize_segments(self, segment_analysis: pd.DataFrame) -> Dict[str, Any]:
+        """Summarize per-segment count, spend and frequency."""
+        segment_analysis = segment_analysis.round(2)
         return {
             'segment_distribution': segment_analysis.to_dict(),
             'dominant_segment': segment_analysis['customer_id'].idxmax(),
@@ -102,6 +230,33 @@ class CustomerInsights:
             'value_variance': data['lifetime_value'].var()
         }
     
+    def estimate_customer_value(self, data: Optional[pd.DataFrame] = None, feature_store=None,
+                                target_error: Optional[float] = 0.01,
+                                time_budget: Optional[float] = None,
+                                confidence: float = 0.95,
+                                initial_fraction: float = 0.01,
+                                seed: int = 42) -> Dict[str, Any]:
+        """Estimate `_analyze_customer_value` from samples stratified by segment.
+        
+        Customers come from `data` or are read from a FeatureStore. The
+        sample grows until every interval is within `target_error` or
+        `time_budget` seconds are spent.
+        """
+        if data is None:
+            if feature_store is None:
+                raise ValueError("Pass either data or a feature_store to sample from")
+            data = feature_store.read(columns=['customer_id', 'segment', 'lifetime_value'])
+        by = 'segment' if 'segment' in data.columns else None
+        return progressive_estimate(
+            lambda fraction: stratified_sample(data, by, fraction, seed),
+            lambda sample, population: {
+                'average_customer_value': estimate_mean(sample, 'lifetime_value', population, confidence),
+                'median_customer_value': estimate_quantile(sample, 'lifetime_value', 0.5, confidence),
+                'value_variance': estimate_variance(sample, 'lifetime_value', population, confidence)
+            },
+            target_error, time_budget, initial_fraction
+        )
+    
     def _get_purchase_patterns(self, data: pd.DataFrame) -> Dict[str, float]:
         """Analyze purchase patterns."""
         return {
@@ -113,25 +268,280 @@ class CustomerInsights:
     def _get_category_preferences(self, data: pd.DataFrame) -> Dict[str, str]:
         """Analyze category preferences."""
         if 'product_category' in data.columns:
-            categories = data.groupby('product_category')['amount'].sum()
-            return {
-                'top_category': categories.idxmax(),
-                'category_concentration': (categories.max() / categories.sum() * 100)
-            }
+            return self._summarize_categories(data.groupby('product_category', observed=True)['amount'].sum())
         return {}
     
     def _get_channel_usage(self, data: pd.DataFrame) -> Dict[str, float]:
         """Analyze channel usage."""
         if 'channel' in data.columns:
-            channel_usage = data.groupby('channel')['transaction_id'].count()
-            return {
-                'primary_channel': channel_usage.idxmax(),
-                'channel_diversity': len(channel_usage)
-            }
+            return self._summarize_channels(data.groupby('channel', observed=True)['transaction_id'].count())
         return {}
     
+    def _summarize_categories(self, categories: Optional[pd.Series]) -> Dict[str, Any]:
+        """Summarize total spend per category."""
+        if categories is None or categories.empty:
+            return {}
+        return {
+            'top_category': categories.idxmax(),
+            'category_concentration': (categories.max() / categories.sum() * 100)
+        }
+    
+    def _summarize_channels(self, channel_usage: Optional[pd.Series]) -> Dict[str, Any]:
+        """Summarize transaction counts per channel."""
+        if channel_usage is None or channel_usage.empty:
+            return {}
+        return {
+            'primary_channel': channel_usage.idxmax(),
+            'channel_diversity': len(channel_usage)
+        }
+    
     def _calculate_regularity(self, data: pd.DataFrame) -> float:
         """Calculate purchase regularity score."""
         if 'days_between_purchases' in data.columns:
             return 1 - data['days_between_purchases'].std() / data['days_between_purchases'].mean()
-        return 0.0
\ No newline at end of file
+        return 0.0
+
+# src/analysis/fused_aggregates.py
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, List
+
+class FusedAggregator:
+    """Plan grouped and column aggregates, then evaluate them over NumPy arrays.
+    
+    Each group key is factorized once and every grouped count/sum/mean is a
+    `bincount` over those codes. Column moments are read straight from the
+    column buffers: one pass for the sum and, only when a variance is
+    requested, one dot product over the centered values.
+    """
+    
+    GROUP_AGGS = ('count', 'sum', 'mean')
+    COLUMN_AGGS = ('mean', 'median', 'var', 'std')
+    
+    def __init__(self):
+        self.group_plan: Dict[str, Dict[str, List[str]]] = {}
+        self.column_plan: Dict[str, List[str]] = {}
+    
+    def group(self, key: str, column: str, *aggs: str) -> 'FusedAggregator':
+        """Request `aggs` of `column` grouped by `key`."""
+        unknown = set(aggs) - set(self.GROUP_AGGS)
+        if unknown:
+            raise ValueError(f"Unsupported group aggregates: {sorted(unknown)}")
+        requested = self.group_plan.setdefault(key, {}).setdefault(column, [])
+        requested.extend(a for a in aggs if a not in requested)
+        return self
+    
+    def column(self, column: str, *aggs: str) -> 'FusedAggregator':
+        """Request whole-column `aggs` of `column`."""
+        unknown = set(aggs) - set(self.COLUMN_AGGS)
+        if unknown:
+            raise ValueError(f"Unsupported column aggregates: {sorted(unknown)}")
+        requested = self.column_plan.setdefault(column, [])
+        requested.extend(a for a in aggs if a not in requested)
+        return self
+    
+    def evaluate(self, data: pd.DataFrame) -> Dict[str, Any]:
+        """Evaluate the plan.
+        
+        Returns {'groups': {key: DataFrame with (column, agg) columns indexed
+        by sorted key values}, 'columns': {column: {agg: value}}}.
+        """
+        return {
+            'groups': {key: self._evaluate_group(data, key, columns) for key, columns in self.group_plan.items()},
+            'columns': self._evaluate_columns(data)
+        }
+    
+    def _evaluate_group(self, data: pd.DataFrame, key: str,
+                        columns: Dict[str, List[str]]) -> pd.DataFrame:
+        keys = data[key]
+        if isinstance(keys.dtype, pd.CategoricalDtype):
+            # Categorical keys are already factorized
+            codes, uniques = keys.cat.codes.to_numpy(), keys.cat.categories
+        else:
+            codes, uniques = pd.factorize(keys, sort=True)
+        valid = codes >= 0
+        all_valid = valid.all()
+        if not all_valid:
+            codes = codes[valid]
+        n_groups = len(uniques)
+        group_sizes = np.bincount(codes, minlength=n_groups)
+        
+        result = {}
+        for column, aggs in columns.items():
+            present = data[column].notna().to_numpy()
+            present = present if all_valid else present[valid]
+            complete = present.all()
+            counts = group_sizes if complete else np.bincount(codes, weights=present, minlength=n_groups)
+            if 'count' in aggs:
+                result[(column, 'count')] = counts.astype(np.int64)
+            if 'sum' in aggs or 'mean' in aggs:
+                values = data[column].to_numpy(dtype=np.float64, na_value=np.nan)
+                values = values if all_valid else values[valid]
+                weights = values if complete else np.where(present, values, 0.0)
+                sums = np.bincount(codes, weights=weights, minlength=n_groups)
+                if 'sum' in aggs:
+                    result[(column, 'sum')] = sums
+                if 'mean' in aggs:
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        result[(column, 'mean')] = sums / counts
+        frame = pd.DataFrame(result, index=pd.Index(uniques, name=key))
+        frame.columns = pd.MultiIndex.from_tuples(list(result))
+        # Only observed groups, as groupby reports them
+        return frame[group_sizes > 0]
+    
+    def _evaluate_columns(self, data: pd.DataFrame) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for name, aggs in self.column_plan.items():
+            values = data[name].to_numpy(dtype=np.float64, na_value=np.nan)
+            missing = np.isnan(values)
+            if missing.any():
+                values = values[~missing]
+            count = len(values)
+            mean = values.sum() / count if count else np.nan
+            variance = np.nan
+            if count > 1 and ('var' in aggs or 'std' in aggs):
+                centered = values - mean
+                variance = centered @ centered / (count - 1)
+            
+            column_stats = {}
+            if 'mean' in aggs:
+                column_stats['mean'] = mean
+            if 'var' in aggs:
+                column_stats['var'] = variance
+            if 'std' in aggs:
+                column_stats['std'] = np.sqrt(variance)
+            if 'median' in aggs:
+                column_stats['median'] = np.median(values) if count else np.nan
+            stats[name] = column_stats
+        return stats
+
+# src/analysis/scenarios.py
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, List, Optional, Union
+from ..models.streaming_segmentation import nearest_centroid
+from ..utils.profiling import profiled
+
+class ScenarioScorer:
+    """Score behavior scenarios against fixed segmentation centroids and a compiled forest.
+    
+    Each scenario is a set of deltas on the raw customer features, added
+    (or, with `relative=True`, applied as fractional changes). Features are
+    filled and scaled with the fitted preprocessor's statistics, so nothing
+    is refitted. Customers are processed in chunks and every scenario in a
+    chunk is scored in one stacked (scenarios x customers) batch.
+    """
+    
+    def __init__(self, segmentation, model, preprocessor=None, chunksize: int = 50_000):
+        if segmentation.centroids is None:
+            raise ValueError("CustomerSegmentation has not been fitted or loaded")
+        self.segmentation = segmentation
+        self.forest = model.compiled if model.compiled is not None else model.compile()
+        self.model_features = list(model.features)
+        self.columns = list(dict.fromkeys(segmentation.feature_columns + self.model_features))
+        self.chunksize = chunksize
+        
+        n = len(self.columns)
+        self.fill = np.full(n, np.nan)
+        self.mean, self.scale = np.zeros(n), np.ones(n)
+        if preprocessor is not None:
+            for i, column in enumerate(self.columns):
+                self.fill[i] = preprocessor.numeric_fill_.get(column, np.nan)
+            for column, mean, scale in zip(preprocessor.scaled_features_, preprocessor.scaler.mean_,
+                                           preprocessor.scaler.scale_):
+                if column in self.columns:
+                    self.mean[self.columns.index(column)] = mean
+                    self.scale[self.columns.index(column)] = scale
+        self._segment_index = [self.columns.index(c) for c in segmentation.feature_columns]
+        self._model_index = [self.columns.index(c) for c in self.model_features]
+    
+    @profiled()
+    def score(self, base: pd.DataFrame,
+              scenarios: Union[pd.DataFrame, Dict[str, Dict[str, float]]],
+              relative: bool = False) -> Dict[str, Any]:
+        """Compare every scenario with the base customers.
+        
+        `scenarios` is a frame with one row per scenario and one column per
+        feature delta, or a dict of such rows. Returns the base segments and
+        predictions, a per-scenario summary of migrations and LTV shifts, and
+        one from-segment x to-segment migration count matrix per scenario.
+        """
+        deltas = self._deltas(scenarios)
+        missing = [c for c in self.columns if c not in base.columns]
+        if missing:
+            raise ValueError(f"Base features are missing columns: {missing}")
+        
+        k = self.segmentation.n_clusters
+        n_scenarios = len(deltas)
+        delta = deltas.to_numpy(dtype=np.float64)
+        migrations = np.zeros(n_scenarios * k * k, dtype=np.int64)
+        ltv_shift = np.zeros(n_scenarios)
+        base_codes = np.empty(len(base), dtype=np.int64)
+        base_ltv = np.empty(len(base))
+        
+        # Customers per chunk, so a stacked block stays within `chunksize` rows
+        step = max(self.chunksize // max(n_scenarios, 1), 1)
+        for start in range(0, len(base), step):
+            raw = self._fill(base[self.columns].iloc[start:start + step].to_numpy(dtype=np.float64))
+            codes, ltv = self._score_rows(self._scale(raw))
+            base_codes[start:start + len(raw)] = codes
+            base_ltv[start:start + len(raw)] = ltv
+            
+            # The four behavior features are counts, amounts and days: never negative
+            shifted = raw[None] * (1 + delta[:, None]) if relative else raw[None] + delta[:, None]
+            scenario_codes, scenario_ltv = self._score_rows(self._scale(np.maximum(shifted, 0)).reshape(-1, len(self.columns)))
+            scenario_codes = scenario_codes.reshape(n_scenarios, len(raw))
+            
+            cells = np.arange(n_scenarios)[:, None] * k * k + codes[None] * k + scenario_codes
+            migrations += np.bincount(cells.ravel(), minlength=n_scenarios * k * k)
+            ltv_shift += (scenario_ltv.reshape(n_scenarios, len(raw)) - ltv[None]).sum(axis=1)
+        
+        migrations = migrations.reshape(n_scenarios, k, k)
+        labels = [f'Segment_{i + 1}' for i in range(k)]
+        stayed = np.trace(migrations, axis1=1, axis2=2)
+        base_total = base_ltv.sum()
+        summary = pd.DataFrame({
+            'migrated': len(base) - stayed,
+            'migrated_share': (len(base) - stayed) / len(base) if len(base) else np.nan,
+            'ltv_shift_total': ltv_shift,
+            'ltv_shift_mean': ltv_shift / len(base) if len(base) else np.nan,
+            'ltv_shift_pct': ltv_shift / base_total * 100 if base_total else np.nan
+        }, index=deltas.index)
+        return {
+            'base': pd.DataFrame({
+                'segment': pd.Categorical.from_codes(base_codes, labels),
+                'predicted_value': base_ltv
+            }, index=base.index),
+            'summary': summary,
+            'migrations': {
+                scenario: pd.DataFrame(matrix, index=pd.Index(labels, name='from'),
+                                       columns=pd.Index(labels, name='to'))
+                for scenario, matrix in zip(deltas.index, migrations)
+            }
+        }
+    
+    def _deltas(self, scenarios: Union[pd.DataFrame, Dict[str, Dict[str, float]]]) -> pd.DataFrame:
+        """Align scenario deltas to the scored feature columns, zero where unset."""
+        if isinstance(scenarios, dict):
+            # Built row by row so scenarios without deltas, e.g. a control, are kept
+            deltas = pd.DataFrame(list(scenarios.values()), index=list(scenarios))
+        else:
+            deltas = scenarios
+        unknown = [c for c in deltas.columns if c not in self.columns]
+        if unknown:
+            raise ValueError(f"Scenario deltas for unscored features: {unknown}")
+        return deltas.reindex(columns=self.columns).fillna(0.0)
+    
+    def _fill(self, raw: np.ndarray) -> np.ndarray:
+        missing = np.isnan(raw)
+        if missing.any():
+            raw = np.where(missing, self.fill, raw)
+        return raw
+    
+    def _scale(self, raw: np.ndarray) -> np.ndarray:
+        return (raw - self.mean) / self.scale
+    
+    def _score_rows(self, features: np.ndarray):
+        """Nearest-centroid segment codes and forest predictions for feature rows."""
+        codes = nearest_centroid(features[..., self._segment_index], self.segmentation.centroids)
+        return codes, self.forest.predict(features[..., self._model_index])
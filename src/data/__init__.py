@@ -1,50 +1,309 @@
 # src/data/__init__.py
-from .data_loader import DataLoader
-from .data_preprocessor import DataPreprocessor
+from typing import TYPE_CHECKING
+from ..utils.lazy import lazy_exports
+
+_EXPORTS = {
+    'DataLoader': 'data_loader',
+    'DataPreprocessor': 'data_preprocessor',
+    'FeatureStore': 'feature_store',
+    'SyntheticDataGenerator': 'synthetic'
+}
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
+
+if TYPE_CHECKING:
+    from .data_loader import DataLoader
+    from .data_preprocessor import DataPreprocessor
+    from .feature_store import FeatureStore
+    from .synthetic import SyntheticDataGenerator
 
 # src/data/data_loader.py
+import asyncio
+import numpy as np
 import pandas as pd
 import sqlalchemy as db
-from typing import Dict, Any
-import yaml
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta
 from pathlib import Path
+from ..utils.database import DatabaseConnection
+from ..utils.query_cache import QueryCache
+from .schema import SchemaTypes, schema_types
+from ..utils.profiling import profiled
+
+TRANSACTION_COLUMNS = [
+    'transaction_id',
+    'customer_id',
+    'date',
+    'amount',
+    'product_category',
+    'channel'
+]
+
+CUSTOMER_FEATURES_QUERY = """
+SELECT
+    c.customer_id,
+    c.segment,
+    c.lifetime_value,
+    COALESCE(SUM(t.amount), 0) AS total_spent,
+    COUNT(t.transaction_id) AS purchase_frequency,
+    AVG(t.amount) AS avg_transaction,
+    MAX(t.date) AS last_purchase
+FROM customers c
+LEFT JOIN transactions t ON c.customer_id = t.customer_id
+{where}
+GROUP BY c.customer_id, c.segment, c.lifetime_value
+"""
+
+CUSTOMER_SEGMENTS_VIEW_QUERY = """
+SELECT
+    s.customer_id,
+    c.segment,
+    c.lifetime_value,
+    s.total_spent,
+    s.total_transactions AS purchase_frequency,
+    s.avg_transaction,
+    s.last_purchase
+FROM customer_segments s
+JOIN customers c ON c.customer_id = s.customer_id
+{where}
+"""
+
+def derive_recency(df: pd.DataFrame, as_of: Optional[datetime] = None) -> pd.DataFrame:
+    """Replace `last_purchase` with `days_since_last_purchase` relative to `as_of`."""
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now()
+    last_purchase = pd.to_datetime(df.pop('last_purchase'))
+    df['days_since_last_purchase'] = (as_of - last_purchase).dt.days
+    return df
 
 class DataLoader:
-    def __init__(self, config_path: str = 'config/database.yaml'):
-        self.config = self._load_config(config_path)
-        self.engine = self._create_engine()
-    
-    def _load_config(self, config_path: str) -> Dict[str, Any]:
-        with open(config_path, 'r') as f:
-            return yaml.safe_load(f)['development']
-    
-    def _create_engine(self) -> db.Engine:
-        conn_str = f"postgresql://{self.config['user']}:{self.config['password']}@" \
-                  f"{self.config['host']}:{self.config['port']}/{self.config['database']}"
-        return db.create_engine(conn_str)
+    def __init__(self, config_path: str = 'config/database.yaml',
+                 engine: Optional[db.Engine] = None,
+                 feature_store: Optional['FeatureStore'] = None,
+                 connection: Optional[DatabaseConnection] = None,
+                 cache: Optional[QueryCache] = None,
+                 schema: Optional[SchemaTypes] = None):
+        self.connection = connection or DatabaseConnection(config_path, engine=engine, cache=cache)
+        self.config = self.connection.config
+        self.engine = self.connection.engine
+        self.feature_store = feature_store
+        self.schema = schema or schema_types()
     
+    @profiled()
     def load_customer_data(self) -> pd.DataFrame:
         query = """
         SELECT * FROM customers 
         LEFT JOIN customer_patterns ON customers.customer_id = customer_patterns.customer_id
         """
-        return pd.read_sql(query, self.engine)
+        return self.schema.apply(self.connection.query_frame(query), 'customers', 'customer_patterns')
+    
+    async def load_tables_async(self, days: int = 365,
+                                columns: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """Load customers, customer_patterns and recent transactions concurrently.
+        
+        Each load runs on its own pooled connection.
+        """
+        customers, patterns, transactions = await asyncio.gather(
+            self.connection.query_frame_async("SELECT * FROM customers"),
+            self.connection.query_frame_async("SELECT * FROM customer_patterns"),
+            asyncio.to_thread(self.load_transactions, days, columns)
+        )
+        return {
+            'customers': self.schema.apply(customers, 'customers'),
+            'customer_patterns': self.schema.apply(patterns, 'customer_patterns'),
+            'transactions': transactions
+        }
+    
+    def load_tables(self, days: int = 365, columns: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """Synchronous wrapper around `load_tables_async`."""
+        return asyncio.run(self.load_tables_async(days, columns))
+    
+    @profiled()
+    def load_customer_features(self, as_of: Optional[datetime] = None,
+                               use_view: bool = False) -> pd.DataFrame:
+        """Load one pre-aggregated feature row per customer.
+        
+        `total_spent`, `purchase_frequency` and `avg_transaction` are computed
+        inside the database, either by a generated GROUP BY or by the
+        `customer_segments` view, so raw transactions never leave the server.
+        If a feature store is attached and up to date it is read instead.
+        """
+        if self.feature_store is not None and self.feature_store.is_fresh(self.transaction_high_water_mark()):
+            return self.feature_store.read(as_of=as_of)
+        # Date arithmetic differs between backends, so it is done on the compact result
+        return derive_recency(self.query_customer_features(use_view=use_view), as_of)
+    
+    def query_customer_features(self, customer_ids: Optional[List[int]] = None,
+                                use_view: bool = False,
+                                batch_size: int = 10_000,
+                                partition: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+        """Run the push-down feature query, optionally for a subset of customers.
+        
+        `partition=(index, count)` restricts the query to customers with
+        `customer_id % count == index`. Returns the raw `last_purchase`
+        timestamp rather than a recency in days.
+        """
+        template = CUSTOMER_SEGMENTS_VIEW_QUERY if use_view else CUSTOMER_FEATURES_QUERY
+        conditions, params = self._partition_filter('c.customer_id', partition)
+        if customer_ids is None:
+            where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+            df = self.connection.query_frame(template.format(where=where), params)
+        else:
+            where = 'WHERE ' + ' AND '.join(conditions + ['c.customer_id IN :customer_ids'])
+            query = db.text(template.format(where=where)).bindparams(
+                db.bindparam('customer_ids', expanding=True)
+            )
+            ids = [int(i) for i in customer_ids]
+            frames = [
+                self.connection.query_frame(query, {**params, 'customer_ids': ids[i:i + batch_size]})
+                for i in range(0, len(ids), batch_size)
+            ]
+            df = pd.concat(frames, ignore_index=True) if frames else self.connection.query_frame(
+                template.format(where='WHERE 1 = 0')
+            )
+        
+        df['total_spent'] = df['total_spent'].fillna(0).astype('float64')
+        df['purchase_frequency'] = df['purchase_frequency'].fillna(0).astype('int32')
+        df['avg_transaction'] = df['avg_transaction'].astype('float64')
+        df['last_purchase'] = pd.to_datetime(df['last_purchase'])
+        return self.schema.apply(df, 'customers')
+    
+    def transaction_high_water_mark(self) -> int:
+        """Return the largest transaction_id loaded so far (0 for an empty table)."""
+        return self.connection.transaction_high_water_mark()
+    
+    def customers_with_transactions_since(self, high_water_mark: int) -> List[int]:
+        """Return customers that have transactions newer than `high_water_mark`."""
+        query = db.text("SELECT DISTINCT customer_id FROM transactions WHERE transaction_id > :hwm")
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.execute(query, {'hwm': high_water_mark})]
+    
+    @profiled()
+    def load_transactions(self, days: int = 365,
+                          columns: Optional[List[str]] = None) -> pd.DataFrame:
+        start_date = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=days)
+        query, params = self._transaction_query(columns, start_date, None)
+        return self._cast_transactions(self.connection.query_frame(query, params))
+    
+    def stream_transactions(self, columns: Optional[List[str]] = None,
+                            start_date: Optional[datetime] = None,
+                            end_date: Optional[datetime] = None,
+                            chunksize: int = 100_000,
+                            partition: Optional[Tuple[int, int]] = None,
+                            after_id: Optional[int] = None,
+                            through_id: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Yield typed transaction chunks of at most `chunksize` rows.
+        
+        Rows are fetched through a server-side cursor, so only one chunk is
+        held in memory at a time. Date bounds are half-open: [start_date, end_date).
+        `partition=(index, count)` limits the stream to one customer partition.
+        `after_id` and `through_id` limit it to the transaction_id range
+        (after_id, through_id], streamed in transaction_id order.
+        """
+        query, params = self._transaction_query(columns, start_date, end_date, partition, after_id, through_id)
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+            for chunk in pd.read_sql(query, conn, params=params, chunksize=chunksize):
+                yield self._cast_transactions(chunk)
     
-    def load_transactions(self, days: int = 365) -> pd.DataFrame:
-        query = f"""
-        SELECT * FROM transactions 
-        WHERE date >= CURRENT_DATE - INTERVAL '{days} days'
+    def sample_transactions(self, fraction: float, seed: int = 42,
+                            columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Return a repeatable random sample of about `fraction` of all transactions.
+        
+        On Postgres this is `TABLESAMPLE BERNOULLI ... REPEATABLE`, so rows
+        are skipped inside the scan. Other backends keep rows whose hashed
+        transaction_id falls under a threshold. With the same seed, a larger
+        fraction returns a superset of a smaller one.
         """
-        return pd.read_sql(query, self.engine)
+        columns = self._check_columns(columns)
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1], got {fraction}")
+        if self.engine.dialect.name == 'postgresql':
+            query = f"SELECT {', '.join(columns)} FROM transactions TABLESAMPLE BERNOULLI (:percent) REPEATABLE (:seed)"
+            params = {'percent': fraction * 100, 'seed': seed}
+        else:
+            # Fibonacci hashing spreads consecutive ids evenly over the range
+            query = f"SELECT {', '.join(columns)} FROM transactions " \
+                    f"WHERE ((transaction_id % 1000003) * 618034 + :seed) % 1000003 < :threshold"
+            params = {'seed': seed % 1000003, 'threshold': int(np.ceil(fraction * 1000003))}
+        return self._cast_transactions(self.connection.query_frame(query, params))
+    
+    def transaction_counts(self, by: str) -> pd.Series:
+        """Count transactions per value of `by`, e.g. the strata sizes for sampling."""
+        self._check_columns([by])
+        counts = self.connection.query_frame(f"SELECT {by}, COUNT(*) AS n FROM transactions GROUP BY {by}")
+        return counts.set_index(by)['n'].astype('int64')
+    
+    def _check_columns(self, columns: Optional[List[str]]) -> List[str]:
+        columns = columns or TRANSACTION_COLUMNS
+        unknown = [c for c in columns if c not in TRANSACTION_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown transaction columns: {unknown}")
+        return columns
+    
+    def _transaction_query(self, columns: Optional[List[str]],
+                           start_date: Optional[datetime],
+                           end_date: Optional[datetime],
+                           partition: Optional[Tuple[int, int]] = None,
+                           after_id: Optional[int] = None,
+                           through_id: Optional[int] = None):
+        """Build a projected, parameterized transactions query."""
+        columns = self._check_columns(columns)
+        
+        conditions, params = self._partition_filter('customer_id', partition)
+        if after_id is not None:
+            conditions.append('transaction_id > :after_id')
+            params['after_id'] = after_id
+        if through_id is not None:
+            conditions.append('transaction_id <= :through_id')
+            params['through_id'] = through_id
+        binds = []
+        if start_date is not None:
+            conditions.append('date >= :start_date')
+            params['start_date'] = start_date
+            binds.append(db.bindparam('start_date', type_=db.DateTime))
+        if end_date is not None:
+            conditions.append('date < :end_date')
+            params['end_date'] = end_date
+            binds.append(db.bindparam('end_date', type_=db.DateTime))
+        
+        query = f"SELECT {', '.join(columns)} FROM transactions"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if after_id is not None or through_id is not None:
+            query += " ORDER BY transaction_id"
+        return db.text(query).bindparams(*binds), params
+    
+    def _partition_filter(self, column: str, partition: Optional[Tuple[int, int]]):
+        """Return the WHERE conditions and parameters selecting one customer partition."""
+        if partition is None:
+            return [], {}
+        index, count = partition
+        if not 0 <= index < count:
+            raise ValueError(f"Partition index {index} is outside 0..{count - 1}")
+        return [f'{column} % :n_partitions = :partition'], {'n_partitions': count, 'partition': index}
+    
+    def _cast_transactions(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Apply the schema dtypes to a freshly loaded transactions frame.
+        
+        Each frame gets categories from its own values, so streamed chunks
+        may differ; combine them with `pd.api.types.union_categoricals`.
+        """
+        return self.schema.apply(df, 'transactions')
 
 # src/data/data_preprocessor.py
+import json
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
-from typing import Tuple, List
+from typing import Dict, Any, Iterable, Iterator, Tuple, List, Optional
+from pathlib import Path
+from ..utils.profiling import profiled
 
 class DataPreprocessor:
-    def __init__(self):
+    def __init__(self, feature_store: Optional['FeatureStore'] = None,
+                 loader: Optional['DataLoader'] = None):
+        self.feature_store = feature_store
+        self.loader = loader
         self.scaler = StandardScaler()
         self.numeric_features = [
             'total_spent', 
@@ -52,29 +311,152 @@ class DataPreprocessor:
             'avg_transaction',
             'days_since_last_purchase'
         ]
+        self.numeric_fill_: Dict[str, float] = {}
+        self.categorical_fill_: Dict[str, Any] = {}
+        self.scaled_features_: List[str] = []
     
     def preprocess_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Main preprocessing pipeline."""
-        df = self._handle_missing_values(df)
-        df = self._create_features(df)
-        df = self._scale_numeric_features(df)
-        return df
+        """Main preprocessing pipeline: fit on `df`, then transform it."""
+        return self.fit(df).transform(df, refresh_store=False)
     
-    def _handle_missing_values(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
-        # Handle numeric columns
+    @profiled()
+    def fit(self, df: pd.DataFrame) -> 'DataPreprocessor':
+        """Learn fill values and scaler parameters from training data."""
+        df = self._attach_stored_features(df)
         numeric_cols = df.select_dtypes(include=[np.number]).columns
-        df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())
+        self.numeric_fill_ = df[numeric_cols].median().to_dict()
+        cat_cols = df.select_dtypes(include=['object', 'string', 'category']).columns
+        modes = df[cat_cols].mode()
+        self.categorical_fill_ = modes.iloc[0].to_dict() if len(modes) else {}
         
-        # Handle categorical columns
-        cat_cols = df.select_dtypes(include=['object']).columns
-        df[cat_cols] = df[cat_cols].fillna(df[cat_cols].mode().iloc[0])
+        # The scaler sees features as they look after filling and derivation
+        features = self._fill_and_derive(df)
+        self.scaled_features_ = [f for f in self.numeric_features if f in features.columns]
+        if self.scaled_features_:
+            self.scaler.fit(features[self.scaled_features_])
+        return self
+    
+    @profiled()
+    def transform(self, df: pd.DataFrame, refresh_store: bool = True) -> pd.DataFrame:
+        """Apply the learned statistics in one pass per column.
+        
+        Each touched column is read into a single NumPy buffer that is
+        filled and scaled in place; untouched columns share memory with
+        the input, which is never modified. `refresh_store=False` skips
+        the feature store freshness check, for callers that just did it.
+        """
+        df = self._attach_stored_features(df, refresh_store)
+        return self._fill_and_derive(df, scale=True)
+    
+    def transform_chunks(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """Transform streamed chunks with the statistics learned by `fit`.
+        
+        The feature store is brought up to date once, with the first chunk.
+        """
+        for i, chunk in enumerate(chunks):
+            yield self.transform(chunk, refresh_store=i == 0)
+    
+    def _fill_and_derive(self, df: pd.DataFrame, scale: bool = False) -> pd.DataFrame:
+        """Fill missing values and derive features on a shallow copy of `df`.
         
+        Categorical fills feed the derived features; numeric columns are
+        filled after derivation and, with `scale`, standardized in the
+        same buffer.
+        """
+        df = df.copy(deep=False)
+        for column, fill in self.categorical_fill_.items():
+            if column in df.columns and df[column].isna().any():
+                values = df[column]
+                if isinstance(values.dtype, pd.CategoricalDtype) and fill not in values.cat.categories:
+                    values = values.cat.add_categories([fill])
+                df[column] = values.fillna(fill)
+        df = self._create_features(df)
+        
+        scaling = {}
+        if scale and self.scaled_features_:
+            scaling = dict(zip(self.scaled_features_, zip(self.scaler.mean_, self.scaler.scale_)))
+        for column in dict.fromkeys([*self.numeric_fill_, *scaling]):
+            if column not in df.columns:
+                continue
+            missing = column in self.numeric_fill_ and df[column].isna().any()
+            if not missing and column not in scaling:
+                continue
+            values = df[column].to_numpy(dtype=np.float64, copy=True)
+            if missing:
+                values[np.isnan(values)] = self.numeric_fill_[column]
+            if column in scaling:
+                mean, std = scaling[column]
+                values -= mean
+                values /= std
+            df[column] = values
         return df
     
-    def _create_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
+    def get_state(self) -> Dict[str, Any]:
+        """Return the fitted statistics as plain Python values."""
+        scaler = {}
+        if self.scaled_features_:
+            scaler = {
+                'mean': self.scaler.mean_.tolist(),
+                'scale': self.scaler.scale_.tolist(),
+                'var': self.scaler.var_.tolist(),
+                'n_samples_seen': np.asarray(self.scaler.n_samples_seen_).tolist()
+            }
+        return {
+            'numeric_fill': self.numeric_fill_,
+            'categorical_fill': self.categorical_fill_,
+            'scaled_features': self.scaled_features_,
+            'scaler': scaler
+        }
+    
+    def set_state(self, state: Dict[str, Any]) -> 'DataPreprocessor':
+        """Restore statistics produced by `get_state`."""
+        self.numeric_fill_ = dict(state['numeric_fill'])
+        self.categorical_fill_ = dict(state['categorical_fill'])
+        self.scaled_features_ = list(state['scaled_features'])
+        if self.scaled_features_:
+            self.scaler = StandardScaler()
+            self.scaler.mean_ = np.array(state['scaler']['mean'])
+            self.scaler.scale_ = np.array(state['scaler']['scale'])
+            self.scaler.var_ = np.array(state['scaler']['var'])
+            n_samples_seen = state['scaler']['n_samples_seen']
+            self.scaler.n_samples_seen_ = np.array(n_samples_seen) if isinstance(n_samples_seen, list) else n_samples_seen
+            self.scaler.n_features_in_ = len(self.scaled_features_)
+            self.scaler.feature_names_in_ = np.array(self.scaled_features_, dtype=object)
+        return self
+    
+    def save(self, path: str) -> str:
+        """Persist the fitted statistics as JSON."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.get_state(), f, indent=4, default=str)
+        return str(path)
+    
+    @classmethod
+    def load(cls, path: str, feature_store: Optional['FeatureStore'] = None,
+             loader: Optional['DataLoader'] = None) -> 'DataPreprocessor':
+        with open(path, 'r') as f:
+            return cls(feature_store=feature_store, loader=loader).set_state(json.load(f))
+    
+    def _attach_stored_features(self, df: pd.DataFrame, refresh: bool = True) -> pd.DataFrame:
+        """Join features missing from `df` from the feature store instead of deriving them.
         
+        With `refresh` the store is first brought up to the loader's
+        high-water mark, so joined totals and recency are never older than
+        the database. Without a loader its freshness is unknown and nothing
+        is joined. Only the rows of the customers in `df` are read.
+        """
+        if self.feature_store is None or self.loader is None or 'customer_id' not in df.columns:
+            return df
+        missing = [f for f in self.numeric_features if f not in df.columns]
+        if not missing:
+            return df
+        if refresh:
+            self.feature_store.refresh(self.loader)
+        stored = self.feature_store.read(columns=['customer_id'] + missing,
+                                         customer_ids=df['customer_id'].unique())
+        return df.merge(stored, on='customer_id', how='left')
+    
+    def _create_features(self, df: pd.DataFrame) -> pd.DataFrame:
         # Calculate days since last purchase
         if 'last_purchase_date' in df.columns:
             df['days_since_last_purchase'] = (
@@ -86,10 +468,302 @@ class DataPreprocessor:
             df['purchase_frequency'] = df.groupby('customer_id')['transaction_id'].transform('count')
         
         return df
+
+# src/data/feature_store.py
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Iterable, List, Optional
+from datetime import datetime
+from pathlib import Path
+from .data_loader import DataLoader, derive_recency
+
+class FeatureStore:
+    """Persistent per-customer feature table stored as an Arrow IPC file.
+    
+    The file is memory-mapped on read. Its schema metadata records the
+    `transactions.transaction_id` high-water mark it was built from, so a
+    refresh only recomputes customers with newer transactions. Changes to
+    the customers table alone are not tracked; use `refresh(full=True)`.
+    """
+    
+    def __init__(self, directory: str = 'feature_store'):
+        self.directory = Path(directory)
+        self.path = self.directory / 'customer_features.arrow'
+    
+    def exists(self) -> bool:
+        return self.path.exists()
+    
+    @property
+    def high_water_mark(self) -> Optional[int]:
+        """High-water mark of the stored features, or None if nothing is stored."""
+        if not self.exists():
+            return None
+        with pa.memory_map(str(self.path)) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        return int(metadata.get(b'high_water_mark', 0))
+    
+    def is_fresh(self, high_water_mark: int) -> bool:
+        """Whether the store already covers transactions up to `high_water_mark`."""
+        stored = self.high_water_mark
+        return stored is not None and stored >= high_water_mark
+    
+    def read(self, as_of: Optional[datetime] = None,
+             columns: Optional[List[str]] = None,
+             customer_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """Read stored features through a memory map.
+        
+        Columns are projected and `customer_ids` filtered on the mapped
+        Arrow table, so only the selected cells are converted to pandas.
+        `days_since_last_purchase` is derived at read time so it stays
+        correct as the store ages.
+        """
+        with pa.memory_map(str(self.path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+            if columns is not None:
+                wanted = [c if c != 'days_since_last_purchase' else 'last_purchase' for c in columns]
+                table = table.select(list(dict.fromkeys(wanted)))
+            if customer_ids is not None:
+                ids = pa.array(np.asarray(customer_ids, dtype=np.int64)).cast(table.schema.field('customer_id').type)
+                table = table.filter(pc.is_in(table['customer_id'], value_set=ids))
+            df = table.to_pandas()
+        if 'last_purchase' in df.columns:
+            df = derive_recency(df, as_of)
+        return df
+    
+    def write(self, features: pd.DataFrame, high_water_mark: int) -> str:
+        """Atomically replace the stored features."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(features.reset_index(drop=True), preserve_index=False)
+        # Keep the b'pandas' entry so dtypes such as categories round-trip
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            'high_water_mark': str(high_water_mark),
+            'refreshed_at': datetime.now().isoformat()
+        })
+        tmp_path = self.path.with_suffix('.arrow.tmp')
+        with pa.OSFile(str(tmp_path), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self.path)
+        return str(self.path)
+    
+    def refresh(self, loader: DataLoader, full: bool = False) -> int:
+        """Bring the store up to date and return the number of customers recomputed."""
+        high_water_mark = loader.transaction_high_water_mark()
+        stored = self.high_water_mark
+        if full or stored is None:
+            features = loader.query_customer_features()
+            self.write(features, high_water_mark)
+            return len(features)
+        if stored >= high_water_mark:
+            return 0
+        
+        changed = loader.customers_with_transactions_since(stored)
+        updated = loader.query_customer_features(customer_ids=changed)
+        with pa.memory_map(str(self.path)) as source:
+            current = pa.ipc.open_file(source).read_all().to_pandas()
+        current = current[~current['customer_id'].isin(updated['customer_id'])]
+        features = pd.concat([current, updated], ignore_index=True).sort_values('customer_id')
+        self.write(features, high_water_mark)
+        return len(updated)
+
+# src/data/synthetic.py
+import pandas as pd
+import numpy as np
+import sqlalchemy as db
+from typing import Dict, Iterator, Optional
+
+PRODUCT_CATEGORIES = ['Electronics', 'Clothing', 'Groceries', 'Home', 'Beauty', 'Sports', 'Toys', 'Books']
+CHANNELS = ['online', 'store', 'mobile']
+SEGMENTS = ['High Value', 'Medium Value', 'Low Value', 'New Customers', 'Churned']
+
+class SyntheticDataGenerator:
+    """Seeded generator for the customers, transactions and customer_patterns tables.
+    
+    Customers get a latent purchase rate, basket size and favourite category;
+    transactions are drawn from those in fixed-size chunks so histories far
+    larger than memory can be produced. Output only depends on the seed and
+    the constructor arguments.
+    """
+    
+    def __init__(self, n_customers: int = 5000, transactions_per_customer: int = 20,
+                 seed: int = 42, start_date: str = '2023-01-01', days: int = 365):
+        self.n_customers = n_customers
+        self.n_transactions = n_customers * transactions_per_customer
+        self.seed = seed
+        self.start_date = pd.Timestamp(start_date)
+        self.days = days
+        
+        rng = np.random.default_rng([seed, 0])
+        self._rate = rng.gamma(2.0, 1.0, n_customers)
+        self._rate /= self._rate.sum()
+        self._basket = rng.lognormal(3.5, 0.6, n_customers)
+        self._favourite = rng.integers(0, len(PRODUCT_CATEGORIES), n_customers)
+        self._join_offset = rng.integers(0, days, n_customers)
+    
+    def customers(self) -> pd.DataFrame:
+        rng = np.random.default_rng([self.seed, 1])
+        ids = np.arange(1, self.n_customers + 1)
+        expected_spend = self._rate * self.n_transactions * self._basket
+        return pd.DataFrame({
+            'customer_id': ids,
+            'name': [f'Customer {i}' for i in ids],
+            'email': [f'customer{i}@example.com' for i in ids],
+            'join_date': (self.start_date + pd.to_timedelta(self._join_offset, unit='D')).date,
+            'segment': np.array(SEGMENTS)[rng.integers(0, len(SEGMENTS), self.n_customers)],
+            'lifetime_value': np.round(expected_spend * rng.uniform(1.0, 1.5, self.n_customers), 2)
+        })
+    
+    def customer_patterns(self) -> pd.DataFrame:
+        ids = np.arange(1, self.n_customers + 1)
+        return pd.DataFrame({
+            'pattern_id': ids,
+            'customer_id': ids,
+            'purchase_frequency': np.round(self._rate * self.n_transactions).astype(np.int64),
+            'avg_basket_size': np.round(self._basket, 2),
+            'preferred_category': np.array(PRODUCT_CATEGORIES)[self._favourite],
+            'last_purchase_date': (self.start_date + pd.to_timedelta(self.days - 1, unit='D')).date()
+        })
+    
+    def transactions(self, chunksize: int = 1_000_000) -> Iterator[pd.DataFrame]:
+        """Yield the transactions table in chunks of at most `chunksize` rows."""
+        for chunk_index, start in enumerate(range(0, self.n_transactions, chunksize)):
+            size = min(chunksize, self.n_transactions - start)
+            rng = np.random.default_rng([self.seed, 2, chunk_index])
+            customers = rng.choice(self.n_customers, size=size, p=self._rate)
+            favourite = rng.random(size) < 0.6
+            categories = np.where(
+                favourite, self._favourite[customers], rng.integers(0, len(PRODUCT_CATEGORIES), size)
+            )
+            # Each chunk covers its own slice of the date range so ids and dates both increase
+            span = self.days * 86_400
+            low = start * span // self.n_transactions
+            high = (start + size) * span // self.n_transactions
+            seconds = rng.integers(low, max(high, low + 1), size)
+            yield pd.DataFrame({
+                'transaction_id': np.arange(start + 1, start + size + 1),
+                'customer_id': customers + 1,
+                'date': self.start_date + pd.to_timedelta(np.sort(seconds), unit='s'),
+                'amount': np.round(self._basket[customers] * rng.lognormal(0, 0.4, size), 2),
+                'product_category': np.array(PRODUCT_CATEGORIES)[categories],
+                'channel': np.array(CHANNELS)[rng.integers(0, len(CHANNELS), size)]
+            })
+    
+    def generate(self) -> Dict[str, pd.DataFrame]:
+        """Materialize all three tables in memory (small scales only)."""
+        return {
+            'customers': self.customers(),
+            'transactions': pd.concat(self.transactions(), ignore_index=True),
+            'customer_patterns': self.customer_patterns()
+        }
+    
+    def write_sql(self, engine: db.Engine, chunksize: int = 1_000_000) -> int:
+        """Populate the schema tables in `engine` and return the transaction count."""
+        self.customers().to_sql('customers', engine, index=False, if_exists='replace')
+        self.customer_patterns().to_sql('customer_patterns', engine, index=False, if_exists='replace')
+        written = 0
+        for i, chunk in enumerate(self.transactions(chunksize)):
+            chunk.to_sql('transactions', engine, index=False, if_exists='replace' if i == 0 else 'append',
+                         chunksize=50_000)
+            written += len(chunk)
+        return written
+
+# src/data/schema.py
+import re
+import functools
+import pandas as pd
+import numpy as np
+from typing import Dict, Optional
+from pathlib import Path
+
+DEFAULT_SCHEMA_PATH = Path(__file__).resolve().parents[2] / 'sql' / 'schema.sql'
+
+# Short VARCHAR columns hold labels (segment, category, channel) and load as
+# categoricals; longer ones (names, emails) are left as strings
+CATEGORY_MAX_LENGTH = 50
+
+_TABLE_PATTERN = re.compile(r'CREATE TABLE (\w+)\s*\((.*?)\);', re.S | re.I)
+_COLUMN_PATTERN = re.compile(r'^\s*(\w+)\s+([A-Z]+(?:\s+PRECISION)?)(?:\((\d+)(?:,\s*(\d+))?\))?', re.I)
+
+def parse_schema(path: str = DEFAULT_SCHEMA_PATH) -> Dict[str, Dict[str, str]]:
+    """Map each table in a CREATE TABLE script to its column dtypes."""
+    tables = {}
+    for table, body in _TABLE_PATTERN.findall(Path(path).read_text()):
+        columns = {}
+        for line in body.split('\n'):
+            match = _COLUMN_PATTERN.match(line)
+            if match and match.group(1).upper() not in ('PRIMARY', 'FOREIGN', 'CONSTRAINT', 'UNIQUE'):
+                dtype = sql_dtype(match.group(2), match.group(3))
+                if dtype is not None:
+                    columns[match.group(1)] = dtype
+        tables[table] = columns
+    return tables
+
+def sql_dtype(sql_type: str, precision: Optional[str] = None) -> Optional[str]:
+    """The compact pandas dtype for a SQL column type, or None to leave it as loaded."""
+    sql_type = sql_type.upper()
+    if sql_type in ('SERIAL', 'INTEGER', 'INT', 'INT4'):
+        return 'int32'
+    if sql_type in ('SMALLINT', 'INT2', 'SMALLSERIAL'):
+        return 'int16'
+    if sql_type in ('BIGINT', 'INT8', 'BIGSERIAL'):
+        return 'int64'
+    if sql_type in ('DECIMAL', 'NUMERIC'):
+        # float32 keeps ~7 significant digits; wider decimals need float64
+        return 'float32' if precision is not None and int(precision) <= 7 else 'float64'
+    if sql_type in ('REAL', 'FLOAT4'):
+        return 'float32'
+    if sql_type in ('DOUBLE PRECISION', 'FLOAT8', 'FLOAT'):
+        return 'float64'
+    if sql_type in ('DATE', 'TIMESTAMP', 'TIMESTAMPTZ'):
+        return 'datetime64[ns]'
+    if sql_type in ('VARCHAR', 'CHAR'):
+        return 'category' if precision is not None and int(precision) <= CATEGORY_MAX_LENGTH else None
+    return None
+
+class SchemaTypes:
+    """Applies the dtypes declared in `sql/schema.sql` to loaded frames.
     
-    def _scale_numeric_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Scale numeric features using StandardScaler."""
-        features_to_scale = [f for f in self.numeric_features if f in df.columns]
-        if features_to_scale:
-            df[features_to_scale] = self.scaler.fit_transform(df[features_to_scale])
-        return df
\ No newline at end of file
+    Integer keys become int32, short VARCHAR labels categoricals, dates
+    datetime64 and decimals the narrowest float that holds their
+    precision. Integer columns with missing values (e.g. from outer
+    joins) are left as floats.
+    """
+    
+    def __init__(self, schema_path: str = DEFAULT_SCHEMA_PATH):
+        self.tables = parse_schema(schema_path)
+    
+    def dtypes(self, *tables: str) -> Dict[str, str]:
+        """Column dtypes of `tables`; earlier tables win on shared column names."""
+        dtypes = {}
+        for table in reversed(tables):
+            dtypes.update(self.tables[table])
+        return dtypes
+    
+    def apply(self, df: pd.DataFrame, *tables: str) -> pd.DataFrame:
+        """Cast the columns of `df` declared in `tables`, in place, and return it."""
+        dtypes = self.dtypes(*tables)
+        for position, column in enumerate(df.columns):
+            if column in dtypes:
+                df.isetitem(position, cast_column(df.iloc[:, position], dtypes[column]))
+        return df
+
+def cast_column(values: pd.Series, dtype: str) -> pd.Series:
+    """Cast one column to a compact dtype, keeping integers with missing values as floats."""
+    if dtype.startswith('datetime64'):
+        return pd.to_datetime(values)
+    if dtype == 'category':
+        return values.astype('category')
+    if dtype.startswith('int'):
+        if values.isna().any():
+            return values.astype('float64')
+        return values.astype(dtype)
+    return values.astype(dtype)
+
+@functools.lru_cache(maxsize=None)
+def schema_types(schema_path: str = str(DEFAULT_SCHEMA_PATH)) -> SchemaTypes:
+    """Parsed schema shared by every loader in the process."""
+    return SchemaTypes(schema_path)
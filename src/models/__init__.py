@@ -1,19 +1,52 @@
 # src/models/__init__.py
-from .customer_segmentation import CustomerSegmentation
-from .pattern_analyzer import PatternAnalyzer
-from .prediction_model import PredictionModel
+from typing import TYPE_CHECKING
+from ..utils.lazy import lazy_exports
+
+_EXPORTS = {
+    'CustomerSegmentation': 'customer_segmentation',
+    'PatternAnalyzer': 'pattern_analyzer',
+    'PredictionModel': 'prediction_model',
+    'StreamingSegmentation': 'streaming_segmentation',
+    'SegmentationSearch': 'segmentation_search',
+    'CompiledForest': 'online_scoring',
+    'ScoringService': 'online_scoring',
+    'PatternState': 'aggregates',
+    'RunningStats': 'aggregates',
+    'QuantileSketch': 'aggregates',
+    'CardinalitySketch': 'aggregates',
+    'TemporalState': 'temporal'
+}
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
+
+if TYPE_CHECKING:
+    from .customer_segmentation import CustomerSegmentation
+    from .pattern_analyzer import PatternAnalyzer
+    from .prediction_model import PredictionModel
+    from .streaming_segmentation import StreamingSegmentation
+    from .segmentation_search import SegmentationSearch
+    from .online_scoring import CompiledForest, ScoringService
+    from .aggregates import PatternState, RunningStats, QuantileSketch, CardinalitySketch
+    from .temporal import TemporalState
 
 # src/models/customer_segmentation.py
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 import pandas as pd
 import numpy as np
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional
+from .persistence import save_artifact, load_artifact, preprocessor_metadata, restore_scaler
+from .streaming_segmentation import nearest_centroid, segment_labels
+from ..utils.profiling import profiled
+
+if TYPE_CHECKING:
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
 
 class CustomerSegmentation:
     def __init__(self, n_clusters: int = 5):
         self.n_clusters = n_clusters
-        self.model = KMeans(n_clusters=n_clusters, random_state=42)
+        self._model: Optional['KMeans'] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.scaler: Optional['StandardScaler'] = None
         self.feature_columns = [
             'total_spent',
             'purchase_frequency',
@@ -21,30 +54,334 @@ class CustomerSegmentation:
             'days_since_last_purchase'
         ]
     
+    @property
+    def model(self) -> 'KMeans':
+        """The KMeans estimator, created on first use so that scoring never imports sklearn."""
+        if self._model is None:
+            from sklearn.cluster import KMeans
+            self._model = KMeans(n_clusters=self.n_clusters, random_state=42)
+        return self._model
+    
+    @model.setter
+    def model(self, model: 'KMeans'):
+        self._model = model
+    
+    @profiled()
     def fit_predict(self, data: pd.DataFrame) -> pd.DataFrame:
         """Segment customers and return labeled data."""
         features = self._prepare_features(data)
-        data['segment'] = self.model.fit_predict(features)
-        data['segment'] = data['segment'].map(
-            lambda x: f'Segment_{x+1}'
-        )
+        data['segment'] = segment_labels(self.model.fit_predict(features), self.n_clusters)
+        self.centroids = self.model.cluster_centers_
         return data
     
+    def predict(self, data: pd.DataFrame) -> pd.Categorical:
+        """Label customers by their nearest fitted centroid without refitting."""
+        if self.centroids is None:
+            raise ValueError("CustomerSegmentation has not been fitted or loaded")
+        codes = nearest_centroid(self._prepare_features(data).astype(np.float64), self.centroids)
+        return segment_labels(codes, self.n_clusters)
+    
+    def save(self, directory: str, preprocessor=None) -> str:
+        """Save a new version of the fitted centroids and optional scaler state."""
+        if self.centroids is None:
+            raise ValueError("CustomerSegmentation has not been fitted or loaded")
+        scaler_arrays, scaler_meta = preprocessor_metadata(preprocessor)
+        return save_artifact(
+            directory, 'customer_segmentation',
+            arrays={'centroids': self.centroids, **scaler_arrays},
+            metadata={'features': self.feature_columns, 'n_clusters': self.n_clusters, **scaler_meta}
+        )
+    
+    @classmethod
+    def load(cls, directory: str, version: Optional[int] = None, mmap: bool = True,
+             config_path: Optional[str] = None) -> 'CustomerSegmentation':
+        """Load saved centroids; arrays are memory-mapped read-only by default."""
+        manifest, arrays = load_artifact(directory, 'customer_segmentation', version, mmap, config_path)
+        segmentation = cls(n_clusters=manifest['n_clusters'])
+        segmentation.feature_columns = manifest['features']
+        segmentation.centroids = arrays['centroids']
+        segmentation.scaler = restore_scaler(arrays)
+        segmentation.manifest = manifest
+        return segmentation
+    
     def _prepare_features(self, data: pd.DataFrame) -> np.ndarray:
         return data[self.feature_columns].values
 
+# src/models/aggregates.py
+import pickle
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, Optional
+from pathlib import Path
+
+class RunningStats:
+    """Mergeable count/sum/mean/variance using Welford's algorithm."""
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+    
+    def update(self, values) -> 'RunningStats':
+        """Fold a batch of values into the running moments."""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        batch = RunningStats()
+        batch.count = len(values)
+        batch.total = values.sum()
+        batch.mean = batch.total / batch.count
+        batch.m2 = ((values - batch.mean) ** 2).sum()
+        return self.merge(batch)
+    
+    def merge(self, other: 'RunningStats') -> 'RunningStats':
+        """Combine with another partial state (Chan et al. parallel update)."""
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.total += other.total
+        self.count = count
+        return self
+    
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+    
+    @property
+    def std(self) -> float:
+        return np.sqrt(self.variance)
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative accuracy (DDSketch-style log buckets)."""
+    
+    def __init__(self, relative_accuracy: float = 0.005):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+    
+    def update(self, values) -> 'QuantileSketch':
+        """Add a batch of values to the sketch."""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.zeros += int((values == 0).sum())
+        self._add_to(self.positive, values[values > 0])
+        self._add_to(self.negative, -values[values < 0])
+        self.count += len(values)
+        return self
+    
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Combine with another sketch built with the same accuracy."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+    
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile, interpolating between neighbouring ranks like pandas."""
+        if self.count == 0:
+            return np.nan
+        rank = q * (self.count - 1)
+        lower, upper = int(np.floor(rank)), int(np.ceil(rank))
+        low_value, high_value = self._value_at(lower), self._value_at(upper)
+        return low_value + (high_value - low_value) * (rank - lower)
+    
+    def _add_to(self, store: Dict[int, int], values: np.ndarray):
+        if len(values) == 0:
+            return
+        keys, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+    
+    def _value_at(self, rank: int) -> float:
+        """Return the representative value of the item at 0-based `rank`."""
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if rank < seen:
+                return -self._bucket_value(key)
+        seen += self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if rank < seen:
+                return self._bucket_value(key)
+        return self._bucket_value(max(self.positive))
+    
+    def _bucket_value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+class CardinalitySketch:
+    """Mergeable HyperLogLog estimate of distinct integer ids."""
+    
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+    
+    def update(self, ids) -> 'CardinalitySketch':
+        """Add a batch of integer ids to the sketch."""
+        ids = np.asarray(ids)
+        if len(ids) == 0:
+            return self
+        hashed = _mix64(ids.astype(np.int64).view(np.uint64))
+        index = (hashed >> np.uint64(64 - self.precision)).astype(np.int64)
+        remaining_bits = 64 - self.precision
+        rest = hashed & np.uint64((1 << remaining_bits) - 1)
+        rank = (remaining_bits - _bit_length(rest) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+    
+    def merge(self, other: 'CardinalitySketch') -> 'CardinalitySketch':
+        """Combine with another sketch of the same precision."""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+    
+    def estimate(self) -> float:
+        """Estimate the number of distinct ids seen."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        zeros = int((self.registers == 0).sum())
+        if raw <= 2.5 * m and zeros > 0:
+            return m * np.log(m / zeros)
+        return raw
+
+def combine_partials(total, part):
+    """Add a partial aggregate into a running total, aligning on index."""
+    return part if total is None else total.add(part, fill_value=0)
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """Vectorized splitmix64 finalizer."""
+    with np.errstate(over='ignore'):
+        z = values + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length for uint64 arrays."""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = values >= np.uint64(1 << shift)
+        length[mask] += shift
+        values[mask] >>= np.uint64(shift)
+    return length + (values > 0)
+
+class PatternState:
+    """Mergeable partial aggregates behind PatternAnalyzer's incremental mode.
+    
+    Folding a batch costs O(batch rows); the state size depends only on the
+    number of days and categories, not on the number of transactions.
+    """
+    
+    def __init__(self, relative_accuracy: float = 0.005, precision: int = 12):
+        self.relative_accuracy = relative_accuracy
+        self.precision = precision
+        self.daily: Optional[pd.DataFrame] = None
+        self.categories: Optional[pd.DataFrame] = None
+        self.category_customers: Dict[Any, CardinalitySketch] = {}
+        self.amount_stats = RunningStats()
+        self.amount_quantiles = QuantileSketch(relative_accuracy)
+    
+    def update(self, batch: pd.DataFrame) -> 'PatternState':
+        """Fold a batch of new transactions into the state."""
+        self.daily = combine_partials(self.daily, batch.groupby(
+            batch['date'].dt.floor('D')
+        )['amount'].agg(['count', 'sum']))
+        self.categories = combine_partials(
+            self.categories, batch.groupby('product_category', observed=True)['amount'].agg(['count', 'sum'])
+        )
+        for category, customers in batch.groupby('product_category', observed=True)['customer_id']:
+            sketch = self.category_customers.setdefault(category, CardinalitySketch(self.precision))
+            sketch.update(customers.to_numpy())
+        
+        amounts = batch['amount'].to_numpy(dtype=float)
+        self.amount_stats.update(amounts)
+        self.amount_quantiles.update(amounts)
+        return self
+    
+    def merge(self, other: 'PatternState') -> 'PatternState':
+        """Combine with a partial state built from a disjoint set of transactions."""
+        if other.daily is not None:
+            self.daily = combine_partials(self.daily, other.daily)
+        if other.categories is not None:
+            self.categories = combine_partials(self.categories, other.categories)
+        for category, sketch in other.category_customers.items():
+            own = self.category_customers.setdefault(category, CardinalitySketch(self.precision))
+            own.merge(sketch)
+        self.amount_stats.merge(other.amount_stats)
+        self.amount_quantiles.merge(other.amount_quantiles)
+        return self
+    
+    def category_cardinality(self) -> pd.Series:
+        """Estimated distinct customers per category."""
+        return pd.Series({
+            category: round(sketch.estimate())
+            for category, sketch in self.category_customers.items()
+        }, dtype='float64')
+    
+    def save(self, path: str) -> str:
+        """Persist the state so a later process can keep folding into it."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+        return str(path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'PatternState':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
 # src/models/pattern_analyzer.py
 import pandas as pd
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Optional
 from datetime import datetime
+from .aggregates import PatternState, combine_partials
+from .temporal import TemporalState
+from .approximate import (
+    STRATUM_COLUMN, stratified_sample, weight_sample, progressive_estimate,
+    estimate_mean, estimate_std, estimate_quantile, estimate_stratum_means
+)
+from ..utils.profiling import profiled
 
 class PatternAnalyzer:
-    def __init__(self):
+    def __init__(self, incremental: bool = False, state: Optional[PatternState] = None,
+                 temporal: Optional[TemporalState] = None):
         self.metrics = {}
+        self.incremental = incremental
+        self.state = state if state is not None else PatternState()
+        # Rolling-window state, folded alongside `state` when given
+        self.temporal = temporal
     
+    @profiled()
     def analyze_patterns(self, data: pd.DataFrame) -> Dict[str, Any]:
-        """Analyze customer consumption patterns."""
+        """Analyze customer consumption patterns.
+        
+        In incremental mode `data` only needs to contain the new transactions:
+        they are folded into the mergeable state and patterns over everything
+        seen so far are returned. Median and distinct customers are estimated
+        from sketches in this mode.
+        """
+        if self.incremental:
+            self.update(data)
+            return self.summarize_state()
         return {
             'temporal': self._analyze_temporal_patterns(data),
             'categorical': self._analyze_categorical_patterns(data),
@@ -65,7 +402,7 @@ class PatternAnalyzer:
     
     def _analyze_categorical_patterns(self, data: pd.DataFrame) -> Dict[str, Any]:
         """Analyze category-based patterns."""
-        category_stats = data.groupby('product_category').agg({
+        category_stats = data.groupby('product_category', observed=True).agg({
             'amount': ['count', 'sum', 'mean'],
             'customer_id': 'nunique'
         })
@@ -82,21 +419,219 @@ class PatternAnalyzer:
             'median_transaction_value': data['amount'].median(),
             'spending_std': data['amount'].std()
         }
+    
+    def analyze_patterns_approximate(self, data: Optional[pd.DataFrame] = None, loader=None,
+                                     target_error: Optional[float] = 0.01,
+                                     time_budget: Optional[float] = None,
+                                     confidence: float = 0.95,
+                                     population: Optional[pd.Series] = None,
+                                     initial_fraction: float = 0.01,
+                                     seed: int = 42) -> Dict[str, Any]:
+        """Estimate monetary and category patterns from samples stratified by product_category.
+        
+        Samples come from `data`, or from `loader.sample_transactions`
+        (TABLESAMPLE on Postgres) and are post-stratified with per-category
+        counts, taken from `population` or one GROUP BY query. The sample
+        grows until every confidence interval is within `target_error`
+        (relative half-width) or `time_budget` seconds are spent. Every
+        metric is returned as an interval dict.
+        """
+        if data is not None:
+            draw = lambda fraction: stratified_sample(data, 'product_category', fraction, seed)
+        elif loader is not None:
+            if population is None:
+                population = loader.transaction_counts('product_category')
+            
+            def draw(fraction):
+                sample = loader.sample_transactions(fraction, seed, ['amount', 'product_category'])
+                sample[STRATUM_COLUMN] = sample['product_category']
+                return weight_sample(sample, population)
+        else:
+            raise ValueError("Pass either data or a loader to sample from")
+        
+        return progressive_estimate(
+            draw,
+            lambda sample, strata: {
+                'categorical': self._estimate_categorical_patterns(sample, strata, confidence),
+                'monetary': self._estimate_monetary_patterns(sample, strata, confidence)
+            },
+            target_error, time_budget, initial_fraction
+        )
+    
+    def _estimate_monetary_patterns(self, sample: pd.DataFrame, population: pd.Series,
+                                    confidence: float) -> Dict[str, Dict[str, float]]:
+        """Sampled counterpart of `_analyze_monetary_patterns`."""
+        return {
+            'avg_transaction_value': estimate_mean(sample, 'amount', population, confidence),
+            'median_transaction_value': estimate_quantile(sample, 'amount', 0.5, confidence),
+            'spending_std': estimate_std(sample, 'amount', population, confidence)
+        }
+    
+    def _estimate_categorical_patterns(self, sample: pd.DataFrame, population: pd.Series,
+                                       confidence: float) -> Dict[str, pd.DataFrame]:
+        """Sampled counterpart of `_analyze_categorical_patterns`.
+        
+        Categories are the strata, so counts are exact and each category's
+        mean and sum carry their own interval. Distinct customers cannot be
+        estimated from a row sample and are not reported.
+        """
+        means = estimate_stratum_means(sample, 'amount', population, confidence)
+        category_stats = pd.DataFrame({
+            'count': means['N'].astype('int64'),
+            'sum': means['estimate'] * means['N'],
+            'sum_lower': means['lower'] * means['N'],
+            'sum_upper': means['upper'] * means['N'],
+            'mean': means['estimate'],
+            'mean_lower': means['lower'],
+            'mean_upper': means['upper'],
+            'relative_error': means['relative_error']
+        }).sort_index().rename_axis('product_category')
+        return {
+            'top_categories': category_stats.nlargest(3, 'count'),
+            'highest_value_categories': category_stats.nlargest(3, 'sum')
+        }
+    
+    def update(self, batch: pd.DataFrame) -> PatternState:
+        """Fold a batch of new transactions into the incremental state."""
+        if self.temporal is not None:
+            self.temporal.update(batch)
+        return self.state.update(batch)
+    
+    def merge(self, other: PatternState) -> PatternState:
+        """Combine a partial state computed by another worker."""
+        return self.state.merge(other)
+    
+    def summarize_state(self, state: Optional[PatternState] = None) -> Dict[str, Any]:
+        """Build the analyze_patterns result from a mergeable state."""
+        state = state if state is not None else self.state
+        stats = state.amount_stats
+        patterns = {
+            'temporal': self._summarize_daily(state.daily),
+            'categorical': self._summarize_categories(state.categories, state.category_cardinality()),
+            'monetary': {
+                'avg_transaction_value': stats.mean if stats.count else np.nan,
+                'median_transaction_value': state.amount_quantiles.quantile(0.5),
+                'spending_std': stats.std
+            }
+        }
+        if self.temporal is not None and self.temporal.end_day is not None:
+            patterns['rolling'] = self.temporal.summary()
+        return patterns
+    
+    @profiled()
+    def analyze_pattern_chunks(self, chunks: Iterable[pd.DataFrame]) -> Dict[str, Any]:
+        """Analyze patterns over streamed transaction chunks in bounded memory.
+        
+        Each chunk is reduced to partial aggregates (daily and per-category
+        counts/sums, distinct category/customer pairs and amount value counts)
+        before the next chunk is read, so memory does not grow with history.
+        """
+        daily, categories, pairs, amounts = None, None, None, None
+        for chunk in chunks:
+            daily = combine_partials(daily, chunk.groupby(
+                chunk['date'].dt.floor('D')
+            )['amount'].agg(['count', 'sum']))
+            categories = combine_partials(categories, chunk.groupby('product_category', observed=True)['amount'].agg(['count', 'sum']))
+            chunk_pairs = chunk[['product_category', 'customer_id']].drop_duplicates()
+            pairs = chunk_pairs if pairs is None else pd.concat([pairs, chunk_pairs]).drop_duplicates()
+            amounts = combine_partials(amounts, chunk['amount'].dropna().round(2).value_counts())
+        
+        return {
+            'temporal': self._summarize_daily(daily),
+            'categorical': self._summarize_categories(
+                categories, None if pairs is None else pairs.groupby('product_category', observed=True)['customer_id'].nunique()
+            ),
+            'monetary': self._summarize_amounts(amounts)
+        }
+    
+    def _summarize_daily(self, daily: Optional[pd.DataFrame]) -> Dict[str, float]:
+        """Summarize accumulated per-day count/sum, including empty days."""
+        if daily is None or daily.empty:
+            return {'avg_daily_transactions': np.nan, 'avg_daily_revenue': np.nan, 'peak_day_transactions': np.nan}
+        daily = daily.reindex(
+            pd.date_range(daily.index.min(), daily.index.max(), freq='D'), fill_value=0
+        )
+        return {
+            'avg_daily_transactions': daily['count'].mean(),
+            'avg_daily_revenue': daily['sum'].mean(),
+            'peak_day_transactions': daily['count'].max()
+        }
+    
+    def _summarize_categories(self, categories: Optional[pd.DataFrame],
+                              customers: Optional[pd.Series]) -> Dict[str, Any]:
+        """Rebuild the per-category stats frame from accumulated partials."""
+        if categories is None:
+            categories = pd.DataFrame(columns=['count', 'sum'], dtype='float64')
+            customers = pd.Series(dtype='float64')
+        category_stats = pd.DataFrame({
+            ('amount', 'count'): categories['count'].astype('int64'),
+            ('amount', 'sum'): categories['sum'],
+            ('amount', 'mean'): categories['sum'] / categories['count'],
+            ('customer_id', 'nunique'): customers.astype('int64')
+        }).sort_index().rename_axis('product_category')
+        
+        return {
+            'top_categories': category_stats.nlargest(3, ('amount', 'count')),
+            'highest_value_categories': category_stats.nlargest(3, ('amount', 'sum'))
+        }
+    
+    def _summarize_amounts(self, amounts: Optional[pd.Series]) -> Dict[str, float]:
+        """Compute mean, median and std from accumulated amount value counts."""
+        if amounts is None or amounts.sum() == 0:
+            return {'avg_transaction_value': np.nan, 'median_transaction_value': np.nan, 'spending_std': np.nan}
+        amounts = amounts.sort_index()
+        values, counts = amounts.index.to_numpy(dtype=float), amounts.to_numpy(dtype=float)
+        n = counts.sum()
+        mean = (values * counts).sum() / n
+        std = np.sqrt((counts * (values - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+        
+        # Median from the cumulative distribution of distinct amounts
+        cumulative = np.cumsum(counts)
+        lower = values[np.searchsorted(cumulative, (n - 1) // 2, side='right')]
+        upper = values[np.searchsorted(cumulative, n // 2, side='right')]
+        return {
+            'avg_transaction_value': mean,
+            'median_transaction_value': (lower + upper) / 2,
+            'spending_std': std
+        }
 
 # src/models/prediction_model.py
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
+from collections import deque
 import pandas as pd
 import numpy as np
-from typing import Dict, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Tuple, Optional
+from .online_scoring import CompiledForest
+from .persistence import save_artifact, load_artifact, preprocessor_metadata, restore_scaler
+from ..utils.profiling import profiled
+
+if TYPE_CHECKING:
+    from sklearn.ensemble import RandomForestRegressor
+
+FOREST_ARRAYS = ['feature', 'threshold', 'children', 'value', 'roots', 'missing_go_to_left']
+BACKENDS = ('random_forest', 'hist_gradient_boosting')
 
 class PredictionModel:
-    def __init__(self):
-        self.model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            random_state=42
-        )
+    """Customer lifetime value regressor.
+    
+    The default backend is a random forest fitted on all cores, which can be
+    refreshed incrementally with `update`. The `hist_gradient_boosting`
+    backend bins features into histograms and suits large tables, but it
+    is only retrained in full.
+    """
+    
+    def __init__(self, backend: str = 'random_forest', n_jobs: int = -1,
+                 max_trees: int = 100, holdout_batches: int = 7):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+        self.backend = backend
+        self.n_jobs = n_jobs
+        self.max_trees = max_trees
+        self.compiled: Optional[CompiledForest] = None
+        self.scaler = None
+        self._model: Optional[Any] = None
+        # (X, y) held out from the latest training batches
+        self.holdout: deque = deque(maxlen=holdout_batches)
+        self.n_updates = 0
         self.features = [
             'purchase_frequency',
             'avg_transaction',
@@ -104,22 +639,1220 @@ class PredictionModel:
             'total_spent'
         ]
     
+    @property
+    def model(self) -> Any:
+        """The estimator, created on first use; a loaded model scores without it."""
+        if self._model is None:
+            if self.backend == 'hist_gradient_boosting':
+                from sklearn.ensemble import HistGradientBoostingRegressor
+                self._model = HistGradientBoostingRegressor(
+                    max_iter=200,
+                    max_depth=10,
+                    random_state=42
+                )
+            else:
+                from sklearn.ensemble import RandomForestRegressor
+                self._model = RandomForestRegressor(
+                    n_estimators=self.max_trees,
+                    max_depth=10,
+                    n_jobs=self.n_jobs,
+                    random_state=42
+                )
+        return self._model
+    
+    @model.setter
+    def model(self, model: Any):
+        self._model = model
+    
+    @profiled()
     def train(self, data: pd.DataFrame) -> Dict[str, float]:
         """Train the model and return performance metrics."""
-        X = data[self.features]
-        y = data['lifetime_value']
-        
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
+        X_train, X_test, y_train, y_test = self._split(data)
         
         self.model.fit(X_train, y_train)
+        self.compiled = None
+        self.holdout.clear()
+        self.holdout.append((X_test, y_test))
+        self.n_updates = 0
         
         return {
             'train_score': self.model.score(X_train, y_train),
             'test_score': self.model.score(X_test, y_test)
         }
     
+    @profiled()
+    def update(self, data: pd.DataFrame, n_new_trees: int = 10) -> Dict[str, Any]:
+        """Refresh a trained forest with trees fitted only on recent customers.
+        
+        `n_new_trees` trees are grown on `data` with warm start and the oldest
+        trees are retired so the forest keeps at most `max_trees`, so a refresh
+        costs time in proportion to `data`, not to the full history. A fifth of
+        each batch is held out; the holdout of the last `holdout_batches`
+        batches scores the refreshed forest.
+        """
+        if self.backend != 'random_forest':
+            raise ValueError(f"Incremental updates need the random_forest backend, not {self.backend!r}")
+        forest = self.model
+        if not hasattr(forest, 'estimators_'):
+            raise ValueError("PredictionModel must be trained before it can be updated")
+        X_train, X_test, y_train, y_test = self._split(data)
+        
+        self.n_updates += 1
+        forest.set_params(
+            warm_start=True,
+            n_estimators=len(forest.estimators_) + n_new_trees,
+            # New trees draw fresh bootstrap seeds on every refresh
+            random_state=42 + self.n_updates
+        )
+        forest.fit(X_train, y_train)
+        retired = max(len(forest.estimators_) - self.max_trees, 0)
+        forest.estimators_ = forest.estimators_[retired:]
+        forest.set_params(warm_start=False, n_estimators=len(forest.estimators_))
+        self.compiled = None
+        
+        self.holdout.append((X_test, y_test))
+        X_holdout = pd.concat([X for X, _ in self.holdout])
+        y_holdout = pd.concat([y for _, y in self.holdout])
+        return {
+            'train_score': forest.score(X_train, y_train),
+            'holdout_score': forest.score(X_holdout, y_holdout),
+            'holdout_rows': len(X_holdout),
+            'trees_added': n_new_trees,
+            'trees_retired': retired,
+            'n_trees': len(forest.estimators_)
+        }
+    
+    def _split(self, data: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]:
+        from sklearn.model_selection import train_test_split
+        return train_test_split(
+            data[self.features], data['lifetime_value'], test_size=0.2, random_state=42
+        )
+    
+    @profiled()
     def predict(self, data: pd.DataFrame) -> np.ndarray:
         """Make predictions for new data."""
-        return self.model.predict(data[self.features])
\ No newline at end of file
+        if self.compiled is not None:
+            return self.compiled.predict(data[self.features].to_numpy())
+        return self.model.predict(data[self.features])
+    
+    def compile(self) -> CompiledForest:
+        """Flatten the trained forest into array tables for low-latency scoring."""
+        return CompiledForest.from_model(self.model, self.features)
+    
+    def save(self, directory: str, preprocessor=None) -> str:
+        """Save a new version of the trained forest and optional scaler state.
+        
+        The forest is stored in its compiled array form so that loading is a
+        file open and several processes can share one memory-mapped copy.
+        """
+        forest = self.compiled if self.compiled is not None else self.compile()
+        scaler_arrays, scaler_meta = preprocessor_metadata(preprocessor)
+        return save_artifact(
+            directory, 'prediction_model',
+            arrays={
+                **{name: getattr(forest, name) for name in FOREST_ARRAYS if getattr(forest, name) is not None},
+                **scaler_arrays
+            },
+            metadata={
+                'features': self.features,
+                'backend': self.backend,
+                'max_depth': forest.max_depth,
+                'average': forest.average,
+                'baseline': forest.baseline,
+                'dtype': forest.dtype,
+                'params': {k: v for k, v in self.model.get_params().items() if isinstance(v, (int, float, str, type(None)))},
+                **scaler_meta
+            }
+        )
+    
+    @classmethod
+    def load(cls, directory: str, version: Optional[int] = None, mmap: bool = True,
+             config_path: Optional[str] = None) -> 'PredictionModel':
+        """Load a saved forest for scoring; arrays are memory-mapped read-only by default."""
+        manifest, arrays = load_artifact(directory, 'prediction_model', version, mmap, config_path)
+        model = cls(backend=manifest.get('backend', 'random_forest'))
+        model.features = manifest['features']
+        if 'children' in arrays:
+            children = arrays['children']
+            children_left, children_right = children[0::2], children[1::2]
+        else:
+            # Artifacts written before the interleaved child table
+            children = None
+            children_left, children_right = arrays['children_left'], arrays['children_right']
+        model.compiled = CompiledForest(
+            feature=arrays['feature'],
+            threshold=arrays['threshold'],
+            children_left=children_left,
+            children_right=children_right,
+            value=arrays['value'],
+            roots=arrays['roots'],
+            children=children,
+            missing_go_to_left=arrays.get('missing_go_to_left'),
+            max_depth=manifest['max_depth'],
+            feature_names=manifest['features'],
+            average=manifest.get('average', True),
+            baseline=manifest.get('baseline', 0.0),
+            dtype=manifest.get('dtype', 'float32')
+        )
+        model.scaler = restore_scaler(arrays)
+        model.manifest = manifest
+        return model
+
+# src/models/streaming_segmentation.py
+import pandas as pd
+import numpy as np
+from typing import TYPE_CHECKING, Iterable, List, Optional
+from pathlib import Path
+
+if TYPE_CHECKING:
+    from sklearn.cluster import MiniBatchKMeans
+
+def segment_labels(codes: np.ndarray, n_clusters: int) -> pd.Categorical:
+    """Turn cluster indices into categorical 'Segment_<n>' labels."""
+    categories = [f'Segment_{i+1}' for i in range(n_clusters)]
+    return pd.Categorical.from_codes(np.asarray(codes, dtype=np.int64), categories=categories)
+
+def nearest_centroid(features: np.ndarray, centroids: np.ndarray,
+                     chunksize: int = 100_000) -> np.ndarray:
+    """Return the index of the nearest centroid for each row, in chunks."""
+    centroids = np.asarray(centroids)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    codes = np.empty(len(features), dtype=np.int64)
+    for start in range(0, len(features), chunksize):
+        block = features[start:start + chunksize]
+        # ||x - c||^2 up to the per-row constant ||x||^2
+        distances = centroid_norms - 2 * block @ centroids.T
+        codes[start:start + chunksize] = distances.argmin(axis=1)
+    return codes
+
+class StreamingSegmentation:
+    """Mini-batch k-means segmentation trained over streamed feature chunks.
+    
+    Training only ever holds one chunk in memory. Centroids can be persisted
+    and used to warm-start the next run, and new customers are labelled by
+    nearest-centroid assignment without refitting.
+    """
+    
+    def __init__(self, n_clusters: int = 5, batch_size: int = 10_000,
+                 random_state: int = 42, centroids_path: Optional[str] = None):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.random_state = random_state
+        self.feature_columns = [
+            'total_spent',
+            'purchase_frequency',
+            'avg_transaction',
+            'days_since_last_purchase'
+        ]
+        self.initial_centroids = None
+        if centroids_path is not None and Path(centroids_path).exists():
+            self.initial_centroids = self._read_centroids(centroids_path)
+        self.model = self._build_model(
+            self.initial_centroids if self.initial_centroids is not None else 'k-means++'
+        )
+    
+    def partial_fit(self, chunk: pd.DataFrame) -> 'StreamingSegmentation':
+        """Update centroids with one chunk of customer features."""
+        self.model.partial_fit(self._prepare_features(chunk))
+        return self
+    
+    def fit(self, chunks: Iterable[pd.DataFrame]) -> 'StreamingSegmentation':
+        """Train over an iterable of feature chunks."""
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self
+    
+    @property
+    def centroids(self) -> np.ndarray:
+        """Current centroids, falling back to the persisted ones before any training."""
+        if hasattr(self.model, 'cluster_centers_'):
+            return self.model.cluster_centers_
+        if self.initial_centroids is None:
+            raise ValueError("Segmentation has not been trained and no centroids were loaded")
+        return self.initial_centroids
+    
+    def predict(self, data: pd.DataFrame, chunksize: int = 100_000) -> pd.Categorical:
+        """Assign each row to its nearest centroid."""
+        codes = nearest_centroid(self._prepare_features(data), self.centroids, chunksize)
+        return segment_labels(codes, self.n_clusters)
+    
+    def assign(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Return a copy of `data` with a categorical `segment` column."""
+        result = data.copy()
+        result['segment'] = self.predict(data)
+        return result
+    
+    def save_centroids(self, path: str) -> str:
+        """Persist centroids for warm-starting and scoring in later runs."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, self.centroids)
+        return str(path)
+    
+    def _read_centroids(self, path: str) -> np.ndarray:
+        centroids = np.load(path)
+        if centroids.shape != (self.n_clusters, len(self.feature_columns)):
+            raise ValueError(
+                f"Persisted centroids have shape {centroids.shape}, expected "
+                f"({self.n_clusters}, {len(self.feature_columns)})"
+            )
+        return centroids
+    
+    def _build_model(self, init) -> 'MiniBatchKMeans':
+        from sklearn.cluster import MiniBatchKMeans
+        return MiniBatchKMeans(
+            n_clusters=self.n_clusters,
+            init=init,
+            n_init=1 if isinstance(init, np.ndarray) else 3,
+            batch_size=self.batch_size,
+            random_state=self.random_state
+        )
+    
+    def _prepare_features(self, data: pd.DataFrame) -> np.ndarray:
+        return data[self.feature_columns].to_numpy(dtype=np.float64)
+
+# src/models/segmentation_search.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, Iterable, List, Optional
+from .customer_segmentation import CustomerSegmentation
+
+# Feature matrix attached from shared memory in each worker process
+_shared_features = None
+
+def _attach_features(name: str, shape: tuple, dtype: str):
+    global _shared_features
+    shm = shared_memory.SharedMemory(name=name)
+    _shared_features = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+def _evaluate_candidate(k: int, seed: int, sample_size: int) -> Dict[str, Any]:
+    """Fit one k-means candidate on the shared matrix and score it."""
+    features = _shared_features[1]
+    model = KMeans(n_clusters=k, random_state=seed, n_init=1).fit(features)
+    silhouette = silhouette_score(
+        features, model.labels_,
+        sample_size=min(sample_size, len(features)),
+        random_state=seed
+    )
+    return {
+        'n_clusters': k,
+        'seed': seed,
+        'inertia': model.inertia_,
+        'silhouette': silhouette,
+        'n_iter': model.n_iter_,
+        'centroids': model.cluster_centers_
+    }
+
+class SegmentationSearch:
+    """Parallel, reproducible sweep over cluster counts and initialization seeds.
+    
+    The feature matrix is placed in shared memory once and attached by every
+    worker, so tasks only carry `(k, seed)`. Candidates are ranked by
+    subsampled silhouette; inertia is reported alongside.
+    """
+    
+    def __init__(self, k_values: Iterable[int] = range(2, 11),
+                 seeds: Iterable[int] = (0, 1, 2),
+                 n_jobs: Optional[int] = None,
+                 silhouette_sample_size: int = 10_000):
+        self.k_values = list(k_values)
+        self.seeds = list(seeds)
+        self.n_jobs = n_jobs or os.cpu_count()
+        self.silhouette_sample_size = silhouette_sample_size
+        self.feature_columns = CustomerSegmentation().feature_columns
+    
+    def search(self, data: pd.DataFrame) -> Dict[str, Any]:
+        """Evaluate every (k, seed) pair and return the best model and a score table."""
+        features = np.ascontiguousarray(data[self.feature_columns].to_numpy(dtype=np.float64))
+        shm = shared_memory.SharedMemory(create=True, size=max(features.nbytes, 1))
+        try:
+            np.ndarray(features.shape, dtype=features.dtype, buffer=shm.buf)[:] = features
+            with ProcessPoolExecutor(
+                max_workers=self.n_jobs,
+                initializer=_attach_features,
+                initargs=(shm.name, features.shape, features.dtype.str)
+            ) as executor:
+                futures = [
+                    executor.submit(_evaluate_candidate, k, seed, self.silhouette_sample_size)
+                    for k in self.k_values for seed in self.seeds
+                ]
+                candidates = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+        
+        scores = pd.DataFrame(candidates).drop(columns='centroids')
+        scores = scores.sort_values(['silhouette', 'n_clusters', 'seed'], ascending=[False, True, True])
+        best = max(candidates, key=lambda c: (c['silhouette'], -c['n_clusters'], -c['seed']))
+        return {
+            'best_model': self._build_model(best, features),
+            'best_params': {'n_clusters': best['n_clusters'], 'seed': best['seed']},
+            'scores': scores.reset_index(drop=True)
+        }
+    
+    def _build_model(self, candidate: Dict[str, Any], features: np.ndarray) -> CustomerSegmentation:
+        """Rebuild the winning candidate from its centroids without another full search."""
+        segmentation = CustomerSegmentation(n_clusters=candidate['n_clusters'])
+        segmentation.model = KMeans(
+            n_clusters=candidate['n_clusters'],
+            init=candidate['centroids'],
+            n_init=1,
+            random_state=candidate['seed']
+        ).fit(features)
+        # The same fitted state fit_predict leaves, so predict and save work
+        segmentation.feature_columns = list(self.feature_columns)
+        segmentation.centroids = segmentation.model.cluster_centers_
+        return segmentation
+
+# src/models/online_scoring.py
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence
+
+class CompiledForest:
+    """A fitted tree ensemble flattened into contiguous node arrays.
+    
+    All trees are concatenated into one node table, and leaves point to
+    themselves, so a batch is scored by walking every (row, tree) pair one
+    level per step with plain NumPy indexing — no sklearn validation and
+    no DataFrame on the hot path.
+    """
+    
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray,
+                 children_left: np.ndarray, children_right: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, max_depth: int,
+                 feature_names: Optional[List[str]] = None,
+                 average: bool = True, baseline: float = 0.0,
+                 dtype: str = 'float32',
+                 children: Optional[np.ndarray] = None,
+                 missing_go_to_left: Optional[np.ndarray] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.feature_names = feature_names
+        # Forests average their trees; boosted ensembles add them to a baseline
+        self.average = average
+        self.baseline = baseline
+        self.dtype = dtype
+        # Which child NaN features follow per node; without it NaN goes right
+        self.missing_go_to_left = missing_go_to_left
+        # Left and right child of node i at 2i and 2i + 1. Artifacts store
+        # this table, so a loaded forest keeps it memory-mapped and shared
+        if children is None:
+            children = np.stack([children_left, children_right], axis=1).ravel()
+        self.children = children
+    
+    @classmethod
+    def from_model(cls, model, feature_names: Optional[List[str]] = None) -> 'CompiledForest':
+        """Compile a fitted sklearn random forest or histogram gradient-boosting regressor."""
+        if hasattr(model, '_predictors'):
+            return cls._from_boosting(model, feature_names)
+        features, thresholds, lefts, rights, values, roots, missing = [], [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            values.append(tree.value[:, 0, 0])
+            # Trees from sklearn releases without missing-value support send NaN right
+            missing.append(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count)))
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children_left=np.concatenate(lefts).astype(np.int32),
+            children_right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            feature_names=feature_names,
+            missing_go_to_left=np.concatenate(missing).astype(bool)
+        )
+    
+    @classmethod
+    def _from_boosting(cls, model, feature_names: Optional[List[str]]) -> 'CompiledForest':
+        """Compile a fitted HistGradientBoostingRegressor from its tree predictors."""
+        features, thresholds, lefts, rights, values, roots, missing = [], [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for (predictor,) in model._predictors:
+            nodes = predictor.nodes
+            if nodes['is_categorical'].any():
+                raise ValueError("Boosted trees with categorical splits cannot be compiled")
+            index = np.arange(len(nodes))
+            is_leaf = nodes['is_leaf'].astype(bool)
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, nodes['feature_idx']))
+            thresholds.append(np.where(is_leaf, np.inf, nodes['num_threshold']))
+            lefts.append(np.where(is_leaf, index, nodes['left']) + offset)
+            rights.append(np.where(is_leaf, index, nodes['right']) + offset)
+            values.append(np.where(is_leaf, nodes['value'], 0.0))
+            missing.append(nodes['missing_go_to_left'])
+            offset += len(nodes)
+            max_depth = max(max_depth, int(nodes['depth'].max()))
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children_left=np.concatenate(lefts).astype(np.int32),
+            children_right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            feature_names=feature_names,
+            average=False,
+            baseline=float(np.ravel(model._baseline_prediction)[0]),
+            # Boosting thresholds are bin edges on float64 inputs
+            dtype='float64',
+            missing_go_to_left=np.concatenate(missing).astype(bool)
+        )
+    
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+    
+    def predict(self, X, block_size: int = 4096) -> np.ndarray:
+        """Score a single row or a 2-D batch of feature rows.
+        
+        Large batches are walked `block_size` rows at a time so the
+        (rows x trees) node arrays stay cache-sized.
+        """
+        # sklearn forests compare float32 features against float64 thresholds
+        X = np.ascontiguousarray(np.atleast_2d(np.asarray(X, dtype=self.dtype)))
+        if len(X) > block_size:
+            return np.concatenate([
+                self.predict(X[start:start + block_size], block_size)
+                for start in range(0, len(X), block_size)
+            ])
+        values = X.ravel()
+        offsets = (np.arange(len(X), dtype=np.int64) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        has_missing = self.missing_go_to_left is not None and np.isnan(values).any()
+        for _ in range(self.max_depth):
+            # NaN fails the comparison and goes right unless its node sends it left
+            x = values.take(offsets + self.feature.take(nodes))
+            go_right = ~(x <= self.threshold.take(nodes))
+            if has_missing:
+                missing = np.isnan(x)
+                go_right[missing] = ~self.missing_go_to_left.take(nodes[missing])
+            nodes = self.children.take(nodes * 2 + go_right)
+        leaves = self.value.take(nodes)
+        return leaves.mean(axis=1) if self.average else self.baseline + leaves.sum(axis=1)
+
+class ScoringService:
+    """In-process request batcher in front of a CompiledForest.
+    
+    Concurrent `submit` calls are coalesced by a background thread into
+    micro-batches of up to `max_batch_size` rows, waiting at most
+    `max_wait_ms` for a batch to fill, and scored in one vectorized call.
+    """
+    
+    def __init__(self, forest: CompiledForest, max_batch_size: int = 256,
+                 max_wait_ms: float = 0.5, latency_window: int = 10_000):
+        self.forest = forest
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.requests = 0
+        self.batches = 0
+        self.started_at: Optional[float] = None
+    
+    def start(self) -> 'ScoringService':
+        if not self._running:
+            self._running = True
+            self.started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name='scoring-service', daemon=True)
+            self._thread.start()
+        return self
+    
+    def stop(self):
+        if self._running:
+            self._running = False
+            self._queue.put(None)
+            self._thread.join()
+    
+    def __enter__(self) -> 'ScoringService':
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def submit(self, features: Sequence[float]) -> Future:
+        """Queue one customer's feature row and return a future for its score."""
+        if not self._running:
+            raise RuntimeError("ScoringService is not running; call start() first")
+        future = Future()
+        self._queue.put((np.asarray(features, dtype=np.float32), future, time.perf_counter()))
+        return future
+    
+    def score(self, features: Sequence[float], timeout: Optional[float] = None) -> float:
+        """Score one row and block until the result is ready."""
+        return self.submit(features).result(timeout)
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Return request, batch, throughput and latency statistics."""
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            requests, batches = self.requests, self.batches
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        metrics = {
+            'requests': requests,
+            'batches': batches,
+            'avg_batch_size': requests / batches if batches else 0.0,
+            'throughput_per_sec': requests / elapsed if elapsed else 0.0
+        }
+        for p in (50, 95, 99):
+            metrics[f'latency_p{p}_ms'] = float(np.percentile(latencies, p)) if len(latencies) else 0.0
+        return metrics
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._score_batch(batch)
+    
+    def _score_batch(self, batch: list):
+        try:
+            predictions = self.forest.predict(np.vstack([features for features, _, _ in batch]))
+        except Exception as exc:
+            for _, future, _ in batch:
+                future.set_exception(exc)
+            return
+        finished = time.perf_counter()
+        for (_, future, submitted), prediction in zip(batch, predictions):
+            future.set_result(float(prediction))
+        with self._lock:
+            self.requests += len(batch)
+            self.batches += 1
+            self._latencies.extend(finished - submitted for _, _, submitted in batch)
+
+# src/models/persistence.py
+import json
+import hashlib
+import numpy as np
+from typing import TYPE_CHECKING, Dict, Any, Optional, Tuple
+from datetime import datetime
+from pathlib import Path
+
+if TYPE_CHECKING:
+    from sklearn.preprocessing import StandardScaler
+
+ARTIFACT_FORMAT = 1
+
+def config_hash(config_path: str = 'config/config.yaml') -> Optional[str]:
+    """Hash the model configuration file, or None if it is missing."""
+    path = Path(config_path)
+    if not path.exists():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def save_artifact(directory: str, kind: str, arrays: Dict[str, np.ndarray],
+                  metadata: Dict[str, Any], config_path: str = 'config/config.yaml') -> str:
+    """Write a new version of an artifact and return its path.
+    
+    Each array is stored as its own .npy file so it can be memory-mapped on
+    load; everything else goes into manifest.json.
+    """
+    root = Path(directory)
+    root.mkdir(parents=True, exist_ok=True)
+    version = max((int(p.name[1:]) for p in root.glob('v*') if p.name[1:].isdigit()), default=0) + 1
+    path = root / f'v{version}'
+    path.mkdir()
+    
+    for name, array in arrays.items():
+        np.save(path / f'{name}.npy', np.ascontiguousarray(array))
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'kind': kind,
+        'version': version,
+        'created_at': datetime.now().isoformat(),
+        'config_hash': config_hash(config_path),
+        'arrays': sorted(arrays),
+        **metadata
+    }
+    with open(path / 'manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=4, default=str)
+    return str(path)
+
+def load_artifact(directory: str, kind: str, version: Optional[int] = None,
+                  mmap: bool = True,
+                  config_path: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """Load an artifact's manifest and arrays, memory-mapped read-only by default.
+    
+    `directory` may be the artifact root (latest or `version` is used) or a
+    specific version directory. If `config_path` is given, the stored
+    config hash must match it.
+    """
+    path = Path(directory)
+    if not (path / 'manifest.json').exists():
+        versions = sorted(int(p.name[1:]) for p in path.glob('v*') if p.name[1:].isdigit())
+        if not versions:
+            raise FileNotFoundError(f"No artifacts found in {directory}")
+        path = path / f'v{version if version is not None else versions[-1]}'
+    
+    with open(path / 'manifest.json', 'r') as f:
+        manifest = json.load(f)
+    if manifest['kind'] != kind:
+        raise ValueError(f"Artifact at {path} is a {manifest['kind']}, expected {kind}")
+    if config_path is not None and manifest['config_hash'] != config_hash(config_path):
+        raise ValueError(f"Artifact at {path} was built with a different configuration")
+    
+    arrays = {
+        name: np.load(path / f'{name}.npy', mmap_mode='r' if mmap else None)
+        for name in manifest['arrays']
+    }
+    return manifest, arrays
+
+def scaler_state(scaler: 'StandardScaler') -> Dict[str, np.ndarray]:
+    """Extract the fitted state of a StandardScaler as arrays."""
+    return {
+        'scaler_mean': scaler.mean_,
+        'scaler_scale': scaler.scale_,
+        'scaler_var': scaler.var_,
+        'scaler_n_samples_seen': np.atleast_1d(scaler.n_samples_seen_)
+    }
+
+def restore_scaler(arrays: Dict[str, np.ndarray]) -> Optional['StandardScaler']:
+    """Rebuild a fitted StandardScaler from stored arrays, if present."""
+    if 'scaler_mean' not in arrays:
+        return None
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler()
+    scaler.mean_ = np.array(arrays['scaler_mean'])
+    scaler.scale_ = np.array(arrays['scaler_scale'])
+    scaler.var_ = np.array(arrays['scaler_var'])
+    n_samples_seen = np.array(arrays['scaler_n_samples_seen'])
+    scaler.n_samples_seen_ = int(n_samples_seen[0]) if len(n_samples_seen) == 1 else n_samples_seen
+    scaler.n_features_in_ = len(scaler.mean_)
+    return scaler
+
+def preprocessor_metadata(preprocessor) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Collect the fitted scaler and fill statistics of a DataPreprocessor for an artifact."""
+    if preprocessor is None or not hasattr(preprocessor.scaler, 'mean_'):
+        return {}, {}
+    scaler = preprocessor.scaler
+    features = list(getattr(scaler, 'feature_names_in_', preprocessor.numeric_features))
+    metadata = {'scaler_features': features}
+    if hasattr(preprocessor, 'get_state'):
+        metadata['preprocessor'] = preprocessor.get_state()
+    return scaler_state(scaler), metadata
+
+# src/models/approximate.py
+import time
+from statistics import NormalDist
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, Callable, Optional, Tuple
+
+STRATUM_COLUMN = '_stratum'
+WEIGHT_COLUMN = '_weight'
+
+def stratified_sample(data: pd.DataFrame, by: Optional[str], fraction: float,
+                      seed: int = 42, min_per_stratum: int = 2) -> Tuple[pd.DataFrame, pd.Series]:
+    """Draw a stratified Bernoulli sample of `data` at about `fraction` per stratum.
+    
+    Small strata are sampled at a higher rate so they expect at least
+    `min_per_stratum` rows. Each row is kept when its seeded random key is
+    under its stratum's rate, so a larger fraction with the same seed
+    returns a superset of a smaller one. Returns the sample, with stratum
+    and weight columns, and the population size of each stratum.
+    """
+    if by is not None:
+        codes, strata = pd.factorize(data[by], use_na_sentinel=False)
+    else:
+        codes, strata = np.zeros(len(data), dtype=np.int64), pd.Index(['all'])
+    counts = np.bincount(codes, minlength=len(strata))
+    rates = np.minimum(np.maximum(fraction, min_per_stratum / np.maximum(counts, 1)), 1.0)
+    keys = np.random.default_rng(seed).random(len(data))
+    mask = keys < rates[codes]
+    sample = data[mask].copy()
+    sample[STRATUM_COLUMN] = strata.take(codes[mask]).to_numpy()
+    return weight_sample(sample, pd.Series(counts, index=strata))
+
+def weight_sample(sample: pd.DataFrame, population: pd.Series) -> Tuple[pd.DataFrame, pd.Series]:
+    """Attach N_h / n_h weights to a sample whose stratum column is already set.
+    
+    Strata with no sampled rows are dropped from `population`, so estimates
+    cover the observed strata only.
+    """
+    sampled = sample[STRATUM_COLUMN].value_counts()
+    population = population[population.index.isin(sampled.index)]
+    sample[WEIGHT_COLUMN] = sample[STRATUM_COLUMN].map(population / sampled).astype(np.float64)
+    return sample, population
+
+def _interval(estimate: float, std_error: float, confidence: float) -> Dict[str, float]:
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half_width = z * std_error
+    return {
+        'estimate': estimate,
+        'lower': estimate - half_width,
+        'upper': estimate + half_width,
+        'std_error': std_error,
+        'relative_error': half_width / abs(estimate) if estimate else np.inf
+    }
+
+def _stratum_moments(sample: pd.DataFrame, column: str, population: pd.Series) -> pd.DataFrame:
+    grouped = sample.groupby(STRATUM_COLUMN, observed=True)[column]
+    moments = pd.DataFrame({'n': grouped.count(), 'mean': grouped.mean(), 'var': grouped.var(ddof=1)})
+    moments['N'] = population.reindex(moments.index).astype(np.float64)
+    moments['var'] = moments['var'].fillna(0.0)
+    # Finite population correction: fully sampled strata contribute no error
+    moments['fpc'] = (1 - moments['n'] / moments['N']).clip(lower=0)
+    return moments[moments['n'] > 0]
+
+def estimate_mean(sample: pd.DataFrame, column: str, population: pd.Series,
+                  confidence: float = 0.95) -> Dict[str, float]:
+    """Stratified mean with its normal-approximation confidence interval."""
+    m = _stratum_moments(sample, column, population)
+    share = m['N'] / m['N'].sum()
+    mean = float((share * m['mean']).sum())
+    variance = float((share ** 2 * m['fpc'] * m['var'] / m['n']).sum())
+    return _interval(mean, np.sqrt(variance), confidence)
+
+def estimate_stratum_means(sample: pd.DataFrame, column: str, population: pd.Series,
+                           confidence: float = 0.95) -> pd.DataFrame:
+    """Per-stratum means with confidence intervals, one row per sampled stratum."""
+    m = _stratum_moments(sample, column, population)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half_width = z * np.sqrt(m['fpc'] * m['var'] / m['n'])
+    return pd.DataFrame({
+        'N': m['N'],
+        'estimate': m['mean'],
+        'lower': m['mean'] - half_width,
+        'upper': m['mean'] + half_width,
+        'relative_error': half_width / m['mean'].abs()
+    })
+
+def estimate_total(sample: pd.DataFrame, column: str, population: pd.Series,
+                   confidence: float = 0.95) -> Dict[str, float]:
+    """Stratified total (N times the stratified mean)."""
+    mean = estimate_mean(sample, column, population, confidence)
+    size = float(population.sum())
+    return _interval(mean['estimate'] * size, mean['std_error'] * size, confidence)
+
+def estimate_variance(sample: pd.DataFrame, column: str, population: pd.Series,
+                      confidence: float = 0.95) -> Dict[str, float]:
+    """Population variance, estimated as the stratified mean squared deviation.
+    
+    Treating (y - mean)^2 as the variable keeps the interval honest for
+    heavy-tailed values, where the normal-theory 2 s^4 / (n - 1) is too narrow.
+    """
+    mean = estimate_mean(sample, column, population, confidence)['estimate']
+    deviations = pd.DataFrame({
+        STRATUM_COLUMN: sample[STRATUM_COLUMN],
+        'squared_deviation': (sample[column] - mean) ** 2
+    })
+    return estimate_mean(deviations, 'squared_deviation', population, confidence)
+
+def estimate_std(sample: pd.DataFrame, column: str, population: pd.Series,
+                 confidence: float = 0.95) -> Dict[str, float]:
+    """Population standard deviation; the interval is the square root of the variance interval."""
+    variance = estimate_variance(sample, column, population, confidence)
+    std = np.sqrt(variance['estimate'])
+    lower, upper = np.sqrt(max(variance['lower'], 0.0)), np.sqrt(variance['upper'])
+    return {
+        'estimate': std,
+        'lower': lower,
+        'upper': upper,
+        'std_error': variance['std_error'] / (2 * std) if std else np.inf,
+        'relative_error': (upper - lower) / 2 / std if std else np.inf
+    }
+
+def estimate_quantile(sample: pd.DataFrame, column: str, q: float = 0.5,
+                      confidence: float = 0.95) -> Dict[str, float]:
+    """Weighted quantile with a Woodruff confidence interval.
+    
+    The interval maps q +/- z * se(q) through the weighted empirical CDF,
+    using the Kish effective sample size for se(q).
+    """
+    values = sample[column].to_numpy(dtype=np.float64)
+    weights = sample[WEIGHT_COLUMN].to_numpy(dtype=np.float64)
+    keep = ~np.isnan(values)
+    values, weights = values[keep], weights[keep]
+    if len(values) == 0:
+        return _interval(np.nan, np.nan, confidence)
+    order = np.argsort(values, kind='stable')
+    values, weights = values[order], weights[order]
+    cdf = np.cumsum(weights) / weights.sum()
+    
+    def at(p: float) -> float:
+        return float(values[min(np.searchsorted(cdf, min(max(p, 0.0), 1.0)), len(values) - 1)])
+    
+    n_eff = weights.sum() ** 2 / (weights ** 2).sum()
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    spread = z * np.sqrt(q * (1 - q) / n_eff)
+    estimate, lower, upper = at(q), at(q - spread), at(q + spread)
+    half_width = max(estimate - lower, upper - estimate)
+    return {
+        'estimate': estimate,
+        'lower': lower,
+        'upper': upper,
+        'std_error': half_width / z,
+        'relative_error': half_width / abs(estimate) if estimate else np.inf
+    }
+
+def progressive_estimate(draw: Callable[[float], Tuple[pd.DataFrame, pd.Series]],
+                         estimate: Callable[[pd.DataFrame, pd.Series], Dict[str, Any]],
+                         target_error: Optional[float] = 0.01,
+                         time_budget: Optional[float] = None,
+                         initial_fraction: float = 0.01) -> Dict[str, Any]:
+    """Grow a sample until every interval meets `target_error` or time runs out.
+    
+    `draw(fraction)` returns a weighted sample and its stratum population
+    sizes; `estimate` turns them into a nested dict of intervals. The next
+    fraction is sized from the worst relative error (error ~ 1/sqrt(n)),
+    and a round is skipped if it would not fit in the remaining budget.
+    """
+    start = time.perf_counter()
+    fraction, result, rounds = initial_fraction, None, 0
+    while True:
+        round_start = time.perf_counter()
+        sample, population = draw(fraction)
+        result = estimate(sample, population)
+        rounds += 1
+        round_seconds = time.perf_counter() - round_start
+        worst = _worst_error(result)
+        met = target_error is not None and worst <= target_error
+        if met or fraction >= 1:
+            break
+        growth = (worst / target_error) ** 2 * 1.2 if target_error is not None and np.isfinite(worst) else 4.0
+        next_fraction = min(1.0, fraction * min(max(growth, 2.0), 100.0))
+        if time_budget is not None:
+            elapsed = time.perf_counter() - start
+            if elapsed + round_seconds * next_fraction / fraction > time_budget:
+                break
+        fraction = next_fraction
+    
+    result['sampling'] = {
+        'fraction': fraction,
+        'rows': len(sample),
+        'rounds': rounds,
+        'seconds': time.perf_counter() - start,
+        'max_relative_error': _worst_error(result),
+        'target_met': target_error is not None and _worst_error(result) <= target_error
+    }
+    return result
+
+def _worst_error(result: Any) -> float:
+    """Largest relative error among the intervals nested in `result`."""
+    if isinstance(result, dict):
+        if 'relative_error' in result:
+            return float(result['relative_error'])
+        errors = [_worst_error(value) for value in result.values()]
+        return max(errors) if errors else 0.0
+    if isinstance(result, pd.DataFrame) and 'relative_error' in result.columns:
+        return float(result['relative_error'].max()) if len(result) else 0.0
+    return 0.0
+
+# src/models/temporal.py
+import pickle
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence
+from datetime import datetime
+from pathlib import Path
+
+WINDOWS = (7, 30, 90)
+# last_day of a customer with no purchases yet
+NO_DAY = np.iinfo(np.int32).min
+
+def _day_numbers(dates: pd.Series) -> np.ndarray:
+    """Calendar days since the epoch for a datetime column."""
+    return dates.to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+def _grouped_moments(groups: np.ndarray, values: np.ndarray, n_groups: int):
+    """Per-group count, mean and sum of squared deviations, without sorting."""
+    count = np.bincount(groups, minlength=n_groups)
+    total = np.bincount(groups, weights=values, minlength=n_groups)
+    mean = np.divide(total, count, out=np.zeros(n_groups), where=count > 0)
+    m2 = np.bincount(groups, weights=(values - mean[groups]) ** 2, minlength=n_groups)
+    return count, mean, m2
+
+class TemporalState:
+    """Rolling-window and purchase-interval state, folded in one batch at a time.
+    
+    Transactions from the last `max(windows)` days are kept in a ring of
+    per-day slots (slot = day % capacity) holding each day's customer
+    positions and amounts as arrays, so 7/30/90-day aggregates per day and
+    per customer are bincounts over the window's slots and expired days are
+    dropped by overwriting their slot. Per customer, flat arrays keep the
+    first and last purchase day and the count/mean/M2 of the gaps between
+    distinct purchase days, merged per batch with Chan's update.
+    
+    Folding a batch sorts only that batch. A transaction dated before its
+    customer's last purchase day still counts towards windows but not
+    towards intervals, and one older than the ring is dropped; both are
+    counted in `late_rows` and `expired_rows`.
+    """
+    
+    def __init__(self, windows: Sequence[int] = WINDOWS):
+        self.windows = tuple(sorted(windows))
+        self.capacity = self.windows[-1]
+        self.end_day: Optional[int] = None
+        self.day_transactions = np.zeros(self.capacity, dtype=np.int64)
+        self.day_revenue = np.zeros(self.capacity, dtype=np.float64)
+        self._slot_customers: List[np.ndarray] = [np.empty(0, dtype=np.int32)] * self.capacity
+        self._slot_amounts: List[np.ndarray] = [np.empty(0, dtype=np.float32)] * self.capacity
+        
+        self.customer_ids = np.empty(0, dtype=np.int64)
+        self._positions = pd.Index(self.customer_ids)
+        self.first_day = np.empty(0, dtype=np.int32)
+        self.last_day = np.empty(0, dtype=np.int32)
+        self.purchase_days = np.empty(0, dtype=np.int32)
+        self.interval_count = np.empty(0, dtype=np.int32)
+        self.interval_mean = np.empty(0, dtype=np.float64)
+        self.interval_m2 = np.empty(0, dtype=np.float64)
+        self.late_rows = 0
+        self.expired_rows = 0
+        self.high_water_mark: Optional[int] = None
+    
+    @property
+    def n_customers(self) -> int:
+        return len(self.customer_ids)
+    
+    def update(self, batch: pd.DataFrame) -> 'TemporalState':
+        """Fold a batch of transactions (customer_id, date, amount) into the state."""
+        if batch.empty:
+            return self
+        days = _day_numbers(batch['date'])
+        customers = self._customer_positions(batch['customer_id'].to_numpy(dtype=np.int64))
+        amounts = batch['amount'].to_numpy(dtype=np.float64)
+        
+        self._advance(int(days.max()))
+        self._fold_windows(days, customers, amounts)
+        self._fold_intervals(days, customers)
+        return self
+    
+    def refresh(self, loader, chunksize: int = 100_000) -> int:
+        """Fold transactions newer than the stored high-water mark and return the rows read.
+        
+        Only rows up to the mark read at the start are streamed, in
+        transaction_id order, and the stored mark advances after every
+        folded chunk, so rows inserted meanwhile or left over by a failed
+        refresh are folded exactly once by the next one.
+        """
+        high_water_mark = loader.transaction_high_water_mark()
+        rows = 0
+        for chunk in loader.stream_transactions(
+            columns=['transaction_id', 'customer_id', 'date', 'amount'], chunksize=chunksize,
+            after_id=self.high_water_mark, through_id=high_water_mark
+        ):
+            if chunk.empty:
+                continue
+            self.update(chunk)
+            self.high_water_mark = int(chunk['transaction_id'].max())
+            rows += len(chunk)
+        self.high_water_mark = max(self.high_water_mark or 0, high_water_mark)
+        return rows
+    
+    def _customer_positions(self, ids: np.ndarray) -> np.ndarray:
+        """Map customer ids to array positions, growing the per-customer arrays for new ids."""
+        positions = self._positions.get_indexer(ids)
+        new = positions < 0
+        if new.any():
+            new_ids = pd.unique(ids[new])
+            n_new = len(new_ids)
+            self.customer_ids = np.concatenate([self.customer_ids, new_ids])
+            self._positions = pd.Index(self.customer_ids)
+            self.first_day = np.concatenate([self.first_day, np.full(n_new, np.iinfo(np.int32).max, dtype=np.int32)])
+            self.last_day = np.concatenate([self.last_day, np.full(n_new, NO_DAY, dtype=np.int32)])
+            for name in ('purchase_days', 'interval_count', 'interval_mean', 'interval_m2'):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.zeros(n_new, dtype=array.dtype)]))
+            positions = self._positions.get_indexer(ids)
+        return positions.astype(np.int32)
+    
+    def _advance(self, day: int):
+        """Move the ring forward to `day`, clearing the slots of days that expire."""
+        if self.end_day is not None and day <= self.end_day:
+            return
+        start = day - self.capacity + 1 if self.end_day is None else max(self.end_day + 1, day - self.capacity + 1)
+        for slot in np.arange(start, day + 1) % self.capacity:
+            self.day_transactions[slot] = 0
+            self.day_revenue[slot] = 0.0
+            self._slot_customers[slot] = np.empty(0, dtype=np.int32)
+            self._slot_amounts[slot] = np.empty(0, dtype=np.float32)
+        self.end_day = day
+    
+    def _fold_windows(self, days: np.ndarray, customers: np.ndarray, amounts: np.ndarray):
+        """Append in-range transactions to their day slots."""
+        live = days > self.end_day - self.capacity
+        self.expired_rows += int((~live).sum())
+        slots = days[live] % self.capacity
+        customers, amounts = customers[live], amounts[live]
+        
+        self.day_transactions += np.bincount(slots, minlength=self.capacity)
+        self.day_revenue += np.bincount(slots, weights=amounts, minlength=self.capacity)
+        order = np.argsort(slots, kind='stable')
+        boundaries = np.flatnonzero(np.diff(slots[order])) + 1
+        for rows in np.split(order, boundaries):
+            if len(rows):
+                slot = slots[rows[0]]
+                self._slot_customers[slot] = np.concatenate([self._slot_customers[slot], customers[rows]])
+                self._slot_amounts[slot] = np.concatenate([self._slot_amounts[slot], amounts[rows].astype(np.float32)])
+    
+    def _fold_intervals(self, days: np.ndarray, customers: np.ndarray):
+        """Merge the gaps between each customer's new distinct purchase days."""
+        np.minimum.at(self.first_day, customers, days.astype(np.int32))
+        late = days < self.last_day[customers]
+        self.late_rows += int(late.sum())
+        
+        # Distinct (customer, day) purchases after the customer's last known
+        # day, sorted by customer then day through one packed int64 key
+        fresh = days > self.last_day[customers]
+        if not fresh.any():
+            return
+        base = days[fresh].min()
+        keys = np.unique(customers[fresh].astype(np.int64) << 32 | (days[fresh] - base))
+        customers, days = keys >> 32, (keys & 0xFFFFFFFF) + base
+        first = np.ones(len(days), dtype=bool)
+        first[1:] = customers[1:] != customers[:-1]
+        previous = np.where(first, self.last_day[customers], np.roll(days, 1))
+        has_gap = previous != NO_DAY
+        
+        n = self.n_customers
+        count, mean, m2 = _grouped_moments(customers[has_gap], (days - previous)[has_gap].astype(np.float64), n)
+        total = self.interval_count + count
+        delta = mean - self.interval_mean
+        ratio = np.divide(count, total, out=np.zeros(n), where=total > 0)
+        self.interval_m2 += m2 + delta ** 2 * self.interval_count * ratio
+        self.interval_mean += delta * ratio
+        self.interval_count = total.astype(np.int32)
+        
+        self.purchase_days += np.bincount(customers, minlength=n).astype(np.int32)
+        last = np.append(customers[1:] != customers[:-1], True)
+        self.last_day[customers[last]] = days[last]
+    
+    def _window_days(self, window: int, as_of_day: int) -> np.ndarray:
+        """Days in (as_of_day - window, as_of_day] not older than the ring."""
+        start = max(as_of_day - window + 1, self.end_day - self.capacity + 1)
+        return np.arange(start, as_of_day + 1)
+    
+    def _window_slots(self, window: int, as_of_day: int) -> np.ndarray:
+        """Ring slots of the days in (as_of_day - window, as_of_day] still held."""
+        days = self._window_days(window, as_of_day)
+        return days[days <= self.end_day] % self.capacity
+    
+    def _as_of_day(self, as_of: Optional[datetime]) -> int:
+        if self.end_day is None:
+            raise ValueError("TemporalState has no transactions yet")
+        if as_of is None:
+            return self.end_day
+        return int(np.datetime64(pd.Timestamp(as_of).floor('D'), 'D').astype(np.int64))
+    
+    def daily(self, as_of: Optional[datetime] = None) -> pd.DataFrame:
+        """Per-day transactions and revenue over the ring, with trailing window sums."""
+        as_of_day = self._as_of_day(as_of)
+        days = self._window_days(self.capacity, as_of_day)
+        slots = self._window_slots(self.capacity, as_of_day)
+        # Days after the last folded one have no transactions yet
+        transactions = np.zeros(len(days), dtype=np.int64)
+        revenue = np.zeros(len(days))
+        transactions[:len(slots)] = self.day_transactions[slots]
+        revenue[:len(slots)] = self.day_revenue[slots]
+        daily = pd.DataFrame({
+            'transactions': transactions,
+            'revenue': revenue
+        }, index=pd.DatetimeIndex(days.astype('datetime64[D]'), name='date'))
+        for window in self.windows:
+            rolling = daily[['transactions', 'revenue']].rolling(window, min_periods=1).sum()
+            daily[f'transactions_{window}d'] = rolling['transactions'].astype('int64')
+            daily[f'revenue_{window}d'] = rolling['revenue']
+        return daily
+    
+    def summary(self, as_of: Optional[datetime] = None) -> Dict[str, Dict[str, float]]:
+        """Daily averages and peak per trailing window, keyed like '7d'."""
+        as_of_day = self._as_of_day(as_of)
+        summary = {}
+        for window in self.windows:
+            slots = self._window_slots(window, as_of_day)
+            counts = np.zeros(window)
+            revenue = np.zeros(window)
+            counts[window - len(slots):] = self.day_transactions[slots]
+            revenue[window - len(slots):] = self.day_revenue[slots]
+            summary[f'{window}d'] = {
+                'avg_daily_transactions': counts.mean(),
+                'avg_daily_revenue': revenue.mean(),
+                'peak_day_transactions': counts.max(),
+                'active_customers': int(np.count_nonzero(self._window_totals(slots)[0]))
+            }
+        return summary
+    
+    def _window_totals(self, slots: np.ndarray):
+        """Transactions and spend per customer position over the given slots."""
+        n = self.n_customers
+        if len(slots) == 0:
+            return np.zeros(n, dtype=np.int64), np.zeros(n)
+        customers = np.concatenate([self._slot_customers[slot] for slot in slots])
+        amounts = np.concatenate([self._slot_amounts[slot] for slot in slots]).astype(np.float64)
+        return np.bincount(customers, minlength=n), np.bincount(customers, weights=amounts, minlength=n)
+    
+    def customer_features(self, as_of: Optional[datetime] = None) -> pd.DataFrame:
+        """One row per customer of recency, interval, regularity and window features.
+        
+        `days_between_purchases` is the mean gap between distinct purchase
+        days and `purchase_regularity` is 1 minus its coefficient of
+        variation; both are NaN until a customer has enough purchases.
+        """
+        as_of_day = self._as_of_day(as_of)
+        count = self.interval_count
+        std = np.sqrt(np.divide(self.interval_m2, count - 1, out=np.full(len(count), np.nan), where=count > 1))
+        mean = np.where(count > 0, self.interval_mean, np.nan)
+        features = pd.DataFrame({
+            'customer_id': self.customer_ids,
+            'days_since_last_purchase': (as_of_day - self.last_day).astype(np.int32),
+            'purchase_days': self.purchase_days,
+            'days_between_purchases': mean,
+            'interval_std': std,
+            'purchase_regularity': 1 - std / mean
+        })
+        for window in self.windows:
+            transactions, spend = self._window_totals(self._window_slots(window, as_of_day))
+            features[f'transactions_{window}d'] = transactions.astype(np.int32)
+            features[f'spend_{window}d'] = spend
+        return features
+    
+    def save(self, path: str) -> str:
+        """Persist the state so a later process can keep folding into it."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+        return str(path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'TemporalState':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,303 @@
+# src/pipeline/__init__.py
+from typing import TYPE_CHECKING
+from ..utils.lazy import lazy_exports
+
+_EXPORTS = {
+    'PipelineRunner': 'runner'
+}
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
+
+if TYPE_CHECKING:
+    from .runner import PipelineRunner
+
+# src/pipeline/runner.py
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.cluster import KMeans
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from pathlib import Path
+
+from ..data import DataLoader, DataPreprocessor
+from ..data.data_loader import derive_recency
+from ..models import CustomerSegmentation, PatternAnalyzer, PredictionModel
+from ..models.aggregates import PatternState, RunningStats, QuantileSketch
+from ..models.online_scoring import CompiledForest
+from ..analysis import CustomerInsights
+from ..utils.database import get_engine
+from ..utils.profiling import StageRecorder, profile_stage
+from ..utils.results import ResultsWriter
+
+# DataLoader opened once per worker process
+_worker_loader = None
+
+def _init_worker(engine_url: Optional[str], config_path: str):
+    global _worker_loader
+    if engine_url is not None:
+        _worker_loader = DataLoader(engine=get_engine(engine_url))
+    else:
+        _worker_loader = DataLoader(config_path)
+
+def _features_path(work_dir: str, partition: int) -> Path:
+    return Path(work_dir) / f'features_{partition:04d}.arrow'
+
+def _load_partition(partition: int, n_partitions: int, work_dir: str,
+                    as_of: datetime, analyze_patterns: bool,
+                    chunksize: int) -> Dict[str, Any]:
+    """Load one customer partition, spill it to disk and return its partial statistics."""
+    features = derive_recency(
+        _worker_loader.query_customer_features(partition=(partition, n_partitions)), as_of
+    )
+    features.to_feather(_features_path(work_dir, partition))
+    
+    # Statistics are taken before filling, as DataPreprocessor.fit sees them
+    features = DataPreprocessor()._create_features(features.copy(deep=False))
+    numeric = {}
+    for column in features.select_dtypes(include=[np.number]).columns:
+        values = features[column].to_numpy(dtype=np.float64)
+        numeric[column] = {
+            'stats': RunningStats().update(values),
+            'quantiles': QuantileSketch().update(values),
+            'missing': int(np.isnan(values).sum())
+        }
+    categorical = {
+        column: features[column].value_counts()
+        for column in features.select_dtypes(include=['object', 'string', 'category']).columns
+    }
+    
+    state = None
+    if analyze_patterns:
+        state = PatternState()
+        for chunk in _worker_loader.stream_transactions(
+            columns=['customer_id', 'date', 'amount', 'product_category'],
+            chunksize=chunksize, partition=(partition, n_partitions)
+        ):
+            state.update(chunk)
+    return {'rows': len(features), 'numeric': numeric, 'categorical': categorical, 'patterns': state}
+
+def _cluster_partition(partition: int, work_dir: str, preprocessor_state: Dict[str, Any],
+                       n_clusters: int, feature_columns: List[str],
+                       sample_size: int, seed: int) -> Dict[str, Any]:
+    """Summarize one partition as weighted local centroids plus a training sample."""
+    processed = DataPreprocessor().set_state(preprocessor_state).transform(
+        pd.read_feather(_features_path(work_dir, partition))
+    )
+    features = processed[feature_columns].to_numpy(dtype=np.float64)
+    if len(features) <= n_clusters:
+        centroids, weights = features, np.ones(len(features))
+    else:
+        local = KMeans(n_clusters=n_clusters, random_state=seed + partition, n_init=1).fit(features)
+        centroids = local.cluster_centers_
+        weights = np.bincount(local.labels_, minlength=n_clusters).astype(np.float64)
+    sample = processed.sample(n=min(sample_size, len(processed)), random_state=seed + partition)
+    return {'centroids': centroids, 'weights': weights, 'sample': sample}
+
+def _score_partition(partition: int, work_dir: str, preprocessor_state: Dict[str, Any],
+                     segmentation: CustomerSegmentation,
+                     forest: Optional[CompiledForest]) -> pd.DataFrame:
+    """Preprocess, segment and score one partition with the global models."""
+    processed = DataPreprocessor().set_state(preprocessor_state).transform(
+        pd.read_feather(_features_path(work_dir, partition))
+    )
+    processed['segment'] = segmentation.predict(processed)
+    if forest is not None:
+        processed['predicted_value'] = forest.predict(processed[forest.feature_names].to_numpy())
+    return processed
+
+class PipelineRunner:
+    """Run the end-to-end pipeline over hash-partitioned customers on a process pool.
+    
+    Customers are split by `customer_id % n_partitions`, a filter the
+    database evaluates, so every worker loads only its own partition.
+    Per-partition work (loading, preprocessing, pattern statistics,
+    segment assignment and scoring) runs in parallel; global state is
+    reduced on the driver between phases:
+    
+    - scaler mean/variance and fill values from merged RunningStats,
+      QuantileSketch and value counts,
+    - centroids by weighted k-means over every partition's local centroids,
+    - pattern statistics by merging PatternState partials.
+    
+    Loaded partitions are spilled to Arrow files in a scratch directory so
+    later phases do not query the database again. If a ResultsWriter is
+    passed to `run`, each stage's output is written as soon as it finishes
+    and scored partitions are appended as they complete.
+    """
+    
+    def __init__(self, config_path: str = 'config/database.yaml',
+                 engine_url: Optional[str] = None,
+                 n_jobs: Optional[int] = None,
+                 n_partitions: Optional[int] = None,
+                 n_clusters: int = 5,
+                 train_sample_size: int = 100_000,
+                 chunksize: int = 100_000,
+                 random_state: int = 42,
+                 recorder: Optional[StageRecorder] = None):
+        self.config_path = config_path
+        self.engine_url = engine_url
+        self.n_jobs = n_jobs or os.cpu_count()
+        self.n_partitions = n_partitions or self.n_jobs
+        self.n_clusters = n_clusters
+        self.train_sample_size = train_sample_size
+        self.chunksize = chunksize
+        self.random_state = random_state
+        self.recorder = recorder
+    
+    def run(self, as_of: Optional[datetime] = None, analyze_patterns: bool = True,
+            train_model: bool = True, work_dir: Optional[str] = None,
+            sink: Optional[ResultsWriter] = None) -> Dict[str, Any]:
+        """Run every stage and return the scored customers and fitted global state."""
+        as_of = as_of or datetime.now()
+        scratch = tempfile.mkdtemp(prefix='pipeline_', dir=work_dir)
+        partitions = range(self.n_partitions)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(self.n_jobs, self.n_partitions),
+                initializer=_init_worker,
+                initargs=(self.engine_url, self.config_path)
+            ) as executor:
+                with profile_stage('pipeline.load', stage_recorder=self.recorder) as measurement:
+                    partials = self._gather(
+                        executor.submit(_load_partition, p, self.n_partitions, scratch, as_of,
+                                        analyze_patterns, self.chunksize)
+                        for p in partitions
+                    )
+                    measurement['rows'] = sum(p['rows'] for p in partials)
+                if sink is not None:
+                    sink.write_stage('load', {'rows': measurement['rows'], 'partitions': self.n_partitions})
+                preprocessor = self._reduce_preprocessor(partials)
+                state = preprocessor.get_state()
+                
+                segmentation = CustomerSegmentation(n_clusters=self.n_clusters)
+                sample_size = -(-self.train_sample_size // self.n_partitions)
+                with profile_stage('pipeline.cluster', stage_recorder=self.recorder):
+                    clusters = self._gather(
+                        executor.submit(_cluster_partition, p, scratch, state, self.n_clusters,
+                                        segmentation.feature_columns, sample_size, self.random_state)
+                        for p in partitions
+                    )
+                    segmentation.centroids = self._reduce_centroids(clusters)
+                if sink is not None:
+                    sink.write_stage('cluster', {
+                        'centroids': pd.DataFrame(segmentation.centroids, columns=segmentation.feature_columns)
+                    })
+                
+                model, performance = None, None
+                if train_model:
+                    with profile_stage('pipeline.train', stage_recorder=self.recorder):
+                        model = PredictionModel()
+                        performance = model.train(pd.concat([c['sample'] for c in clusters], ignore_index=True))
+                        model.compiled = model.compile()
+                    if sink is not None:
+                        sink.write_stage('train', performance)
+                
+                with profile_stage('pipeline.score', stage_recorder=self.recorder) as measurement:
+                    # Only the compiled tables are shipped to the workers
+                    forest = model.compiled if model is not None else None
+                    futures = [
+                        executor.submit(_score_partition, p, scratch, state, segmentation, forest)
+                        for p in partitions
+                    ]
+                    scored = []
+                    for future in futures:
+                        scored.append(future.result())
+                        if sink is not None:
+                            sink.append('score', 'customers', scored[-1])
+                    customers = pd.concat(scored, ignore_index=True)
+                    measurement['rows'] = len(customers)
+                if sink is not None:
+                    sink.write_stage('score', {'rows': len(customers)})
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        
+        patterns = None
+        if analyze_patterns:
+            merged = PatternState()
+            for partial in partials:
+                merged.merge(partial['patterns'])
+            patterns = PatternAnalyzer(incremental=True, state=merged).summarize_state()
+            if sink is not None:
+                sink.write_stage('patterns', patterns)
+        
+        insights = CustomerInsights().generate_insights(customers)
+        if sink is not None:
+            sink.write_stage('insights', insights)
+        
+        return {
+            'customers': customers,
+            'preprocessor': preprocessor,
+            'segmentation': segmentation,
+            'model': model,
+            'model_performance': performance,
+            'patterns': patterns,
+            'insights': insights
+        }
+    
+    def _gather(self, futures) -> List[Any]:
+        """Wait for submitted partition tasks and return results in partition order."""
+        return [future.result() for future in list(futures)]
+    
+    def _reduce_preprocessor(self, partials: List[Dict[str, Any]]) -> DataPreprocessor:
+        """Combine partition statistics into one fitted DataPreprocessor.
+        
+        Filling n missing values with the global median m adds n copies of m,
+        so the post-fill scaler moments are exact given the fill value; the
+        median itself comes from the merged quantile sketches.
+        """
+        numeric: Dict[str, Dict[str, Any]] = {}
+        categorical: Dict[str, pd.Series] = {}
+        for partial in partials:
+            for column, part in partial['numeric'].items():
+                if column not in numeric:
+                    numeric[column] = {'stats': RunningStats(), 'quantiles': QuantileSketch(), 'missing': 0}
+                numeric[column]['stats'].merge(part['stats'])
+                numeric[column]['quantiles'].merge(part['quantiles'])
+                numeric[column]['missing'] += part['missing']
+            for column, counts in partial['categorical'].items():
+                categorical[column] = counts if column not in categorical else categorical[column].add(counts, fill_value=0)
+        
+        numeric_fill = {column: agg['quantiles'].quantile(0.5) for column, agg in numeric.items()}
+        categorical_fill = {
+            column: counts.sort_index().idxmax() for column, counts in categorical.items() if len(counts)
+        }
+        
+        preprocessor = DataPreprocessor()
+        scaled = [f for f in preprocessor.numeric_features if f in numeric]
+        moments = []
+        for column in scaled:
+            stats, missing = numeric[column]['stats'], numeric[column]['missing']
+            filled = RunningStats()
+            filled.count, filled.mean = missing, numeric_fill[column]
+            filled.total = missing * filled.mean
+            combined = RunningStats().merge(stats).merge(filled)
+            moments.append((combined.mean, combined.m2 / combined.count, combined.count))
+        
+        means = [m for m, _, _ in moments]
+        variances = [v for _, v, _ in moments]
+        return preprocessor.set_state({
+            'numeric_fill': numeric_fill,
+            'categorical_fill': categorical_fill,
+            'scaled_features': scaled,
+            'scaler': {
+                'mean': means,
+                'var': variances,
+                # StandardScaler leaves zero-variance features unscaled
+                'scale': [np.sqrt(v) if v > 0 else 1.0 for v in variances],
+                'n_samples_seen': moments[0][2] if moments else 0
+            }
+        })
+    
+    def _reduce_centroids(self, clusters: List[Dict[str, Any]]) -> np.ndarray:
+        """Cluster the weighted local centroids of every partition into global centroids."""
+        centroids = np.vstack([c['centroids'] for c in clusters])
+        weights = np.concatenate([c['weights'] for c in clusters])
+        if len(centroids) < self.n_clusters:
+            raise ValueError(f"Only {len(centroids)} customers loaded for {self.n_clusters} clusters")
+        return KMeans(n_clusters=self.n_clusters, random_state=self.random_state, n_init=10).fit(
+            centroids, sample_weight=weights
+        ).cluster_centers_
@@ -1,37 +1,225 @@
 # src/utils/__init__.py
-from .database import DatabaseConnection
-from .logger import setup_logger
-from .helpers import load_config, save_results
+from typing import TYPE_CHECKING
+from .lazy import lazy_exports
+
+# Public names and the submodule defining each; a submodule is only
+# imported when one of its names is first used
+_EXPORTS = {
+    'DatabaseConnection': 'database',
+    'get_engine': 'database',
+    'QueryCache': 'query_cache',
+    'setup_logger': 'logger',
+    'load_config': 'helpers',
+    'save_results': 'helpers',
+    'profile_stage': 'profiling',
+    'profiled': 'profiling',
+    'StageRecorder': 'profiling',
+    'ResultsWriter': 'results',
+    'read_metrics': 'results',
+    'read_table': 'results',
+    'diff_runs': 'results'
+}
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
+
+if TYPE_CHECKING:
+    from .database import DatabaseConnection, get_engine
+    from .query_cache import QueryCache
+    from .logger import setup_logger
+    from .helpers import load_config, save_results
+    from .profiling import profile_stage, profiled, StageRecorder
+    from .results import ResultsWriter, read_metrics, read_table, diff_runs
 
 # src/utils/database.py
+import asyncio
+import threading
+import time
 import sqlalchemy as db
-from typing import Dict
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, Mapping, Optional
 import yaml
 import os
 from dotenv import load_dotenv
+from .query_cache import QueryCache
+
+# Engines shared by every DataLoader and DatabaseConnection in the process,
+# keyed by URL and pool settings
+_engines: Dict[tuple, db.Engine] = {}
+_engines_lock = threading.Lock()
+
+def load_database_config(config_path: str = 'config/database.yaml',
+                         environment: Optional[str] = None) -> Dict[str, Any]:
+    """Read one environment's settings, expanding ${VAR} references from the environment."""
+    load_dotenv()
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    env = environment or os.getenv('ENVIRONMENT', 'development')
+    return {
+        key: os.path.expandvars(value) if isinstance(value, str) else value
+        for key, value in config[env].items()
+    }
+
+def database_url(config: Dict[str, Any]) -> str:
+    return f"postgresql://{config['user']}:{config['password']}@" \
+           f"{config['host']}:{config['port']}/{config['database']}"
+
+def get_engine(url: str, pool_size: int = 5, max_overflow: int = 10,
+               pool_timeout: float = 30, statement_timeout_ms: Optional[int] = None) -> db.Engine:
+    """Return the process-wide pooled engine for `url`, creating it on first use."""
+    key = (str(url), pool_size, max_overflow, pool_timeout, statement_timeout_ms)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = _create_pooled_engine(url, pool_size, max_overflow, pool_timeout, statement_timeout_ms)
+        return _engines[key]
+
+def dispose_engines():
+    """Close every shared pool and its connections."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+def _forget_engines_after_fork():
+    """Give a forked child its own pools, leaving the parent's connections open.
+    
+    Pooled connections must not be shared across processes, so the child
+    drops the inherited engines without closing their sockets and
+    `get_engine` creates fresh ones on first use.
+    """
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    for engine in _engines.values():
+        engine.dispose(close=False)
+    _engines.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_engines_after_fork)
+
+def _create_pooled_engine(url: str, pool_size: int, max_overflow: int,
+                          pool_timeout: float, statement_timeout_ms: Optional[int]) -> db.Engine:
+    url = db.make_url(url)
+    backend = url.get_backend_name()
+    kwargs: Dict[str, Any] = {'pool_pre_ping': True}
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory SQLite lives in a single connection and cannot be pooled
+        pass
+    else:
+        kwargs.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    if statement_timeout_ms is not None and backend == 'postgresql':
+        kwargs['connect_args'] = {'options': f'-c statement_timeout={int(statement_timeout_ms)}'}
+    engine = db.create_engine(url, **kwargs)
+    if statement_timeout_ms is not None and backend == 'sqlite':
+        _install_sqlite_timeout(engine, statement_timeout_ms / 1000)
+    return engine
+
+def _install_sqlite_timeout(engine: db.Engine, timeout: float):
+    """Abort SQLite statements that run longer than `timeout` seconds."""
+    
+    @db.event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        info = connection_record.info
+        dbapi_connection.set_progress_handler(
+            lambda: int(time.monotonic() > info.get('deadline', float('inf'))), 10_000
+        )
+    
+    @db.event.listens_for(engine, 'before_cursor_execute')
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['deadline'] = time.monotonic() + timeout
+
+def columnar(result) -> Dict[str, np.ndarray]:
+    """Turn a SQLAlchemy result into one NumPy array per column."""
+    columns = list(result.keys())
+    rows = result.fetchall()
+    if not rows:
+        return {column: np.array([]) for column in columns}
+    return {column: np.array(values) for column, values in zip(columns, zip(*rows))}
 
 class DatabaseConnection:
-    def __init__(self, config_path: str = 'config/database.yaml'):
-        load_dotenv()
-        self.config = self._load_config(config_path)
-        self.engine = self._create_engine()
+    """Pooled access to the insights database with a synchronous and an asyncio API.
+    
+    Connections come from a pool shared with every other DatabaseConnection
+    and DataLoader using the same URL and settings. The asyncio methods run
+    queries on worker threads, each with its own pooled connection, so
+    independent loads overlap instead of running back to back. With a
+    `cache`, query results are reused until the transactions high-water
+    mark moves or the cache TTL expires.
+    """
+    
+    def __init__(self, config_path: str = 'config/database.yaml',
+                 engine: Optional[db.Engine] = None,
+                 pool_size: Optional[int] = None,
+                 max_overflow: Optional[int] = None,
+                 statement_timeout_ms: Optional[int] = None,
+                 cache: Optional[QueryCache] = None):
+        if engine is None:
+            self.config = self._load_config(config_path)
+            engine = self._create_engine(pool_size, max_overflow, statement_timeout_ms)
+        else:
+            self.config = {}
+        self.engine = engine
+        self.cache = cache
     
     def _load_config(self, config_path: str) -> Dict:
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
-            env = os.getenv('ENVIRONMENT', 'development')
-            return config[env]
-    
-    def _create_engine(self) -> db.Engine:
-        conn_str = f"postgresql://{self.config['user']}:{self.config['password']}@" \
-                  f"{self.config['host']}:{self.config['port']}/{self.config['database']}"
-        return db.create_engine(conn_str)
-    
-    def execute_query(self, query: str) -> list:
-        """Execute SQL query and return results."""
+        return load_database_config(config_path)
+    
+    def _create_engine(self, pool_size: Optional[int] = None,
+                       max_overflow: Optional[int] = None,
+                       statement_timeout_ms: Optional[int] = None) -> db.Engine:
+        return get_engine(
+            database_url(self.config),
+            pool_size=pool_size or self.config.get('pool_size', 5),
+            max_overflow=max_overflow if max_overflow is not None else self.config.get('max_overflow', 10),
+            statement_timeout_ms=statement_timeout_ms or self.config.get('statement_timeout_ms')
+        )
+    
+    def execute_query(self, query: str, params: Optional[Mapping[str, Any]] = None) -> Dict[str, np.ndarray]:
+        """Execute SQL query and return results as one array per column."""
+        if self.cache is not None:
+            frame = self.query_frame(query, params)
+            return {column: frame[column].to_numpy() for column in frame.columns}
+        with self.engine.connect() as conn:
+            return columnar(conn.execute(db.text(query), dict(params or {})))
+    
+    def query_frame(self, query, params: Optional[Mapping[str, Any]] = None) -> pd.DataFrame:
+        """Execute a query (SQL string or SQLAlchemy text) and return a DataFrame."""
+        query = db.text(query) if isinstance(query, str) else query
+        if self.cache is not None:
+            namespace = self.engine.url.render_as_string(hide_password=True)
+            return self.cache.get_or_load(
+                query, params, self.cache.high_water_mark(self.transaction_high_water_mark, namespace),
+                lambda: self._read_frame(query, params), namespace
+            )
+        return self._read_frame(query, params)
+    
+    def _read_frame(self, query, params: Optional[Mapping[str, Any]]) -> pd.DataFrame:
+        with self.engine.connect() as conn:
+            return pd.read_sql(query, conn, params=params)
+    
+    def transaction_high_water_mark(self) -> int:
+        """Return the largest transaction_id loaded so far (0 for an empty table)."""
         with self.engine.connect() as conn:
-            result = conn.execute(db.text(query))
-            return [dict(row) for row in result]
+            value = conn.execute(db.text("SELECT MAX(transaction_id) FROM transactions")).scalar()
+        return int(value or 0)
+    
+    async def execute_query_async(self, query: str,
+                                  params: Optional[Mapping[str, Any]] = None) -> Dict[str, np.ndarray]:
+        return await asyncio.to_thread(self.execute_query, query, params)
+    
+    async def query_frame_async(self, query, params: Optional[Mapping[str, Any]] = None) -> pd.DataFrame:
+        return await asyncio.to_thread(self.query_frame, query, params)
+    
+    async def gather_frames(self, queries: Mapping[str, Any]) -> Dict[str, pd.DataFrame]:
+        """Run several named queries concurrently and return their frames by name.
+        
+        Values are a query, or a `(query, params)` tuple.
+        """
+        names = list(queries)
+        frames = await asyncio.gather(*(
+            self.query_frame_async(*q) if isinstance(q, tuple) else self.query_frame_async(q)
+            for q in queries.values()
+        ))
+        return dict(zip(names, frames))
 
 # src/utils/logger.py
 import logging
@@ -67,10 +255,8 @@ def setup_logger(name: str, log_file: str = None) -> logging.Logger:
 
 # src/utils/helpers.py
 import yaml
-import json
 from typing import Dict, Any
 from pathlib import Path
-from datetime import datetime
 
 def load_config(config_path: str) -> Dict[str, Any]:
     """Load configuration from YAML file."""
@@ -80,19 +266,18 @@ def load_config(config_path: str) -> Dict[str, Any]:
 def save_results(results: Dict[str, Any], 
                 filename: str = None,
                 directory: str = 'results') -> str:
-    """Save analysis results to JSON file."""
-    if filename is None:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'analysis_results_{timestamp}.json'
-    
-    # Create directory if it doesn't exist
-    Path(directory).mkdir(parents=True, exist_ok=True)
+    """Save analysis results as one ResultsWriter run and return its directory.
     
-    filepath = Path(directory) / filename
-    with open(filepath, 'w') as f:
-        json.dump(results, f, indent=4, default=str)
+    Each top-level key is written as a stage: DataFrames go to Parquet and
+    scalars to the shared metrics log. `filename`, if given, names the run.
+    """
+    from .results import ResultsWriter
     
-    return str(filepath)
+    run_id = Path(filename).stem if filename is not None else None
+    with ResultsWriter(directory, run_id=run_id) as writer:
+        for stage, value in results.items():
+            writer.write_stage(stage, value if isinstance(value, dict) else {stage: value})
+    return str(writer.run_dir)
 
 def format_currency(amount: float) -> str:
     """Format amount as currency string."""
@@ -100,4 +285,897 @@ def format_currency(amount: float) -> str:
 
 def format_percentage(value: float) -> str:
     """Format value as percentage string."""
-    return f"{value:.2f}%"
\ No newline at end of file
+    return f"{value:.2f}%"
+
+# src/utils/benchmark.py
+import asyncio
+import json
+import time
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from typing import Dict, Any, Callable, List, Optional, Sequence
+from datetime import datetime
+from pathlib import Path
+
+from ..data import DataLoader, DataPreprocessor, SyntheticDataGenerator
+from ..models import CustomerSegmentation, PatternAnalyzer, PredictionModel
+from ..analysis import CustomerInsights
+from .database import DatabaseConnection, get_engine
+from .profiling import StageRecorder, profile_stage
+
+# Named scales, as (n_customers, transactions_per_customer)
+SCALES = {
+    '5k': (500, 10),
+    '500k': (25_000, 20),
+    '5m': (100_000, 50),
+    '50m': (1_000_000, 50)
+}
+
+# Statements timed by run_import_benchmark, each in a fresh interpreter
+IMPORT_TARGETS = {
+    'packages': 'import src.data, src.models, src.analysis, src.utils, src.pipeline',
+    'scoring': 'from src.models import PredictionModel, CompiledForest',
+    'loading': 'from src.data import DataLoader',
+    'training': 'from src.models import PredictionModel; PredictionModel().model',
+    'everything': (
+        'import importlib\n'
+        'for name in ("data", "models", "analysis", "utils", "pipeline"):\n'
+        '    package = importlib.import_module("src." + name)\n'
+        '    [getattr(package, export) for export in package.__all__]'
+    )
+}
+HEAVY_MODULES = ('sklearn', 'sqlalchemy', 'pandas', 'pyarrow', 'yaml', 'dotenv')
+
+_IMPORT_PROBE = '''import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'modules': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+def _measure(stages: List[Dict[str, Any]], name: str, rows: int, func: Callable,
+             trace_memory: bool = True, trace: Optional[Callable] = None):
+    """Run `func`, recording wall/CPU time, peak memory and throughput.
+    
+    Times come from a run without tracemalloc, whose per-allocation hooks
+    would slow allocation-heavy stages. With `trace_memory` the stage runs
+    again under tracemalloc for its peak memory; `trace` replaces `func`
+    for that run when the stage's side effects must not repeat.
+    """
+    with profile_stage(name, rows, stage_recorder=StageRecorder()) as measurement:
+        result = func()
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            (trace or func)()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    stages.append({
+        'stage': name,
+        'rows': rows,
+        'seconds': round(measurement['wall_seconds'], 6),
+        'cpu_seconds': round(measurement['cpu_seconds'], 6),
+        'peak_memory_mb': round(peak / 2 ** 20, 3) if peak is not None else None,
+        'peak_rss_growth_mb': measurement['peak_rss_growth_mb'],
+        'process_peak_rss_mb': measurement['process_peak_rss_mb'],
+        'rows_per_sec': round(measurement['rows_per_sec'], 1) if measurement['rows_per_sec'] else None
+    })
+    return result
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(n_customers: int = 500, transactions_per_customer: int = 10,
+                   seed: int = 42, chunksize: int = 1_000_000,
+                   max_in_memory_rows: int = 5_000_000,
+                   output: Optional[str] = None,
+                   trace_memory: bool = True) -> Dict[str, Any]:
+    """Benchmark every pipeline stage on seeded synthetic data.
+    
+    Data is written to a temporary SQLite database and loaded back through
+    DataLoader, then each stage is timed and memory-profiled. Pattern
+    analysis on a single in-memory frame is skipped above
+    `max_in_memory_rows`; the streamed variant always runs. Peak memory
+    needs a second, traced run of every stage; `trace_memory=False` skips
+    it and reports only peak RSS.
+    """
+    generator = SyntheticDataGenerator(n_customers, transactions_per_customer, seed)
+    n_rows = generator.n_transactions
+    stages: List[Dict[str, Any]] = []
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = db.create_engine(f"sqlite:///{Path(tmp) / 'benchmark.db'}")
+        scratch = db.create_engine(f"sqlite:///{Path(tmp) / 'traced.db'}")
+        _measure(stages, 'generate', n_rows, lambda: generator.write_sql(engine, chunksize),
+                 trace_memory, trace=lambda: generator.write_sql(scratch, chunksize))
+        scratch.dispose()
+        loader = DataLoader(engine=engine)
+        
+        def measure(name: str, rows: int, func: Callable):
+            return _measure(stages, name, rows, func, trace_memory)
+        
+        customers = measure('load_customer_features', n_customers, loader.load_customer_features)
+        if n_rows <= max_in_memory_rows:
+            transactions = measure('load_transactions', n_rows,
+                                   lambda: pd.concat(loader.stream_transactions(chunksize=chunksize)))
+        
+        preprocessor = DataPreprocessor()
+        processed = measure('preprocess', n_customers, lambda: preprocessor.preprocess_data(customers))
+        segmented = measure('segmentation_fit_predict', n_customers,
+                            lambda: CustomerSegmentation().fit_predict(processed.copy()))
+        model = PredictionModel()
+        measure('prediction_train', n_customers, lambda: model.train(processed))
+        measure('prediction_predict', n_customers, lambda: model.predict(processed))
+        
+        analyzer = PatternAnalyzer()
+        if n_rows <= max_in_memory_rows:
+            measure('analyze_patterns', n_rows, lambda: analyzer.analyze_patterns(transactions))
+        measure('analyze_pattern_chunks', n_rows,
+                lambda: analyzer.analyze_pattern_chunks(loader.stream_transactions(chunksize=chunksize)))
+        measure('generate_insights', n_customers,
+                lambda: CustomerInsights().generate_insights(segmented))
+        engine.dispose()
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'n_customers': n_customers,
+            'transactions_per_customer': transactions_per_customer,
+            'n_transactions': n_rows,
+            'seed': seed,
+            'trace_memory': trace_memory
+        },
+        'stages': stages
+    }
+    if output is not None:
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=4)
+    return report
+
+async def _timed_queries(connection: DatabaseConnection, query: str, customer_ids: np.ndarray,
+                         concurrency: int) -> List[float]:
+    """Run one query per id with at most `concurrency` in flight; return latencies in seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def timed(customer_id: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await connection.execute_query_async(query, {'customer_id': customer_id})
+            return time.perf_counter() - start
+    
+    return await asyncio.gather(*(timed(int(c)) for c in customer_ids))
+
+def run_database_benchmark(n_customers: int = 2000, transactions_per_customer: int = 10,
+                           concurrency: Sequence[int] = (1, 4, 16), n_queries: int = 400,
+                           pool_size: int = 8, seed: int = 42,
+                           output: Optional[str] = None) -> Dict[str, Any]:
+    """Measure query throughput and latency through the pooled layer under concurrent load.
+    
+    Issues `n_queries` per-customer aggregate queries at each concurrency
+    level, and times the customers/customer_patterns/transactions loads run
+    back to back against `DataLoader.load_tables`.
+    """
+    generator = SyntheticDataGenerator(n_customers, transactions_per_customer, seed)
+    query = "SELECT COUNT(*) AS n, SUM(amount) AS total FROM transactions WHERE customer_id = :customer_id"
+    levels = []
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'benchmark.db'}"
+        engine = get_engine(url, pool_size=pool_size, max_overflow=0)
+        generator.write_sql(engine)
+        connection = DatabaseConnection(engine=engine)
+        customer_ids = np.random.default_rng(seed).integers(1, n_customers + 1, n_queries)
+        
+        for level in concurrency:
+            start = time.perf_counter()
+            latencies = np.array(asyncio.run(_timed_queries(connection, query, customer_ids, level)))
+            elapsed = time.perf_counter() - start
+            levels.append({
+                'concurrency': level,
+                'queries': n_queries,
+                'seconds': round(elapsed, 6),
+                'queries_per_sec': round(n_queries / elapsed, 1),
+                'latency_p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+                'latency_p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 3),
+                'latency_p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3)
+            })
+        
+        loader = DataLoader(connection=connection)
+        days = (pd.Timestamp.now() - generator.start_date).days + 1
+        start = time.perf_counter()
+        for table in ('customers', 'customer_patterns'):
+            connection.query_frame(f"SELECT * FROM {table}")
+        loader.load_transactions(days=days)
+        serial = time.perf_counter() - start
+        start = time.perf_counter()
+        loader.load_tables(days=days)
+        concurrent = time.perf_counter() - start
+        engine.dispose()
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': _git_commit(),
+            'n_customers': n_customers,
+            'n_transactions': generator.n_transactions,
+            'pool_size': pool_size,
+            'seed': seed
+        },
+        'concurrency': levels,
+        'load_tables': {'serial_seconds': round(serial, 6), 'concurrent_seconds': round(concurrent, 6)}
+    }
+    if output is not None:
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=4)
+    return report
+
+def run_import_benchmark(targets: Optional[Dict[str, str]] = None, repeats: int = 5,
+                         output: Optional[str] = None) -> Dict[str, Any]:
+    """Time cold imports of the packages, each in a new interpreter.
+    
+    Reports the best of `repeats` runs per target and which heavy
+    dependencies (sklearn, SQLAlchemy, pandas, ...) the import pulled in.
+    """
+    root = Path(__file__).resolve().parents[2]
+    results = []
+    for name, statement in (targets or IMPORT_TARGETS).items():
+        probe = _IMPORT_PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+        runs = [
+            json.loads(subprocess.check_output([sys.executable, '-c', probe], cwd=root, text=True))
+            for _ in range(repeats)
+        ]
+        results.append({
+            'target': name,
+            'statement': statement,
+            'seconds': round(min(run['seconds'] for run in runs), 6),
+            'heavy_modules': runs[0]['modules']
+        })
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'repeats': repeats
+        },
+        'imports': results
+    }
+    if output is not None:
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=4)
+    return report
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark the CustomerInsightPro pipeline.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='5k')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    parser.add_argument('--output', default=None,
+                        help='JSON report path (default: results/benchmarks/<scale>_<timestamp>.json)')
+    parser.add_argument('--database', action='store_true',
+                        help='benchmark concurrent queries through the pooled database layer instead')
+    parser.add_argument('--imports', action='store_true',
+                        help='benchmark cold import time of the packages instead')
+    parser.add_argument('--no-trace-memory', dest='trace_memory', action='store_false',
+                        help='skip the second, tracemalloc run of each stage and report only peak RSS')
+    args = parser.parse_args(argv)
+    
+    if args.imports:
+        output = args.output or f"results/benchmarks/imports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        report = run_import_benchmark(output=output)
+        for result in report['imports']:
+            print(f"{result['target']:<14}{result['seconds']:>10.3f}s  {', '.join(result['heavy_modules']) or '-'}")
+        print(f"Report written to {output}")
+        return
+    
+    if args.database:
+        output = args.output or f"results/benchmarks/database_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        report = run_database_benchmark(seed=args.seed, output=output)
+        for level in report['concurrency']:
+            print(f"concurrency {level['concurrency']:<4}{level['queries_per_sec']:>10.1f} q/s"
+                  f"{level['latency_p95_ms']:>10.2f} ms p95")
+        print(f"Report written to {output}")
+        return
+    
+    n_customers, per_customer = SCALES[args.scale]
+    output = args.output or f"results/benchmarks/{args.scale}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    report = run_benchmarks(n_customers, per_customer, args.seed, args.chunksize, output=output,
+                            trace_memory=args.trace_memory)
+    for stage in report['stages']:
+        if stage['peak_memory_mb'] is not None:
+            memory = f"{stage['peak_memory_mb']:>10.1f} MB"
+        else:
+            memory = f"{stage['peak_rss_growth_mb'] or 0:>+10.1f} MB RSS"
+        print(f"{stage['stage']:<28}{stage['seconds']:>10.3f}s{memory}")
+    print(f"Report written to {output}")
+
+if __name__ == '__main__':
+    main()
+
+# src/utils/profiling.py
+import json
+import sys
+import time
+import functools
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+from pathlib import Path
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, if the platform reports it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+class StageRecorder:
+    """Bounded ring buffer of stage measurements with percentile summaries."""
+    
+    def __init__(self, maxlen: int = 1000):
+        self.records = deque(maxlen=maxlen)
+    
+    def record(self, measurement: Dict[str, Any]):
+        self.records.append(measurement)
+    
+    def clear(self):
+        self.records.clear()
+    
+    def summary(self, percentiles: Tuple[int, ...] = (50, 95, 99)) -> Dict[str, Dict[str, float]]:
+        """Summarize wall time, CPU time, peak RSS growth and throughput per stage."""
+        by_stage: Dict[str, List[Dict[str, Any]]] = {}
+        for record in self.records:
+            by_stage.setdefault(record['stage'], []).append(record)
+        
+        summary = {}
+        for stage, records in by_stage.items():
+            wall = np.array([r['wall_seconds'] for r in records])
+            stats = {
+                'calls': len(records),
+                'total_wall_seconds': float(wall.sum()),
+                'mean_cpu_seconds': float(np.mean([r['cpu_seconds'] for r in records]))
+            }
+            for p in percentiles:
+                stats[f'wall_p{p}'] = float(np.percentile(wall, p))
+            growth = [r['peak_rss_growth_mb'] for r in records if r['peak_rss_growth_mb'] is not None]
+            stats['max_peak_rss_growth_mb'] = max(growth) if growth else None
+            throughput = [r['rows_per_sec'] for r in records if r['rows_per_sec'] is not None]
+            stats['median_rows_per_sec'] = float(np.median(throughput)) if throughput else None
+            summary[stage] = stats
+        return summary
+    
+    def export(self, path: str) -> str:
+        """Append the buffered measurements to a JSON-lines metrics file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a') as f:
+            for record in self.records:
+                f.write(json.dumps(record, default=str) + '\n')
+        return str(path)
+
+# Process-wide recorder used by the instrumented entry points
+recorder = StageRecorder()
+
+@contextmanager
+def profile_stage(stage: str, rows: Optional[int] = None,
+                  stage_recorder: Optional[StageRecorder] = None) -> Iterator[Dict[str, Any]]:
+    """Measure wall time, CPU time, peak RSS growth and rows/sec for a block.
+    
+    The OS only reports the process's peak RSS so far, so the stage's own
+    figure is `peak_rss_growth_mb`, how far the block raised that peak;
+    `process_peak_rss_mb` is the process-wide peak after the block. The
+    yielded dict can be updated inside the block, e.g. to set `rows` once
+    it is known.
+    """
+    measurement = {'stage': stage, 'rows': rows}
+    rss_before = peak_rss_mb()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield measurement
+    finally:
+        wall = time.perf_counter() - wall_start
+        rss_after = peak_rss_mb()
+        rows = measurement['rows']
+        measurement.update({
+            'timestamp': time.time(),
+            'wall_seconds': wall,
+            'cpu_seconds': time.process_time() - cpu_start,
+            'peak_rss_growth_mb': rss_after - rss_before if rss_after is not None else None,
+            'process_peak_rss_mb': rss_after,
+            'rows_per_sec': rows / wall if rows and wall > 0 else None
+        })
+        (stage_recorder or recorder).record(measurement)
+
+def _count_rows(value) -> Optional[int]:
+    if hasattr(value, 'shape') and len(getattr(value, 'shape', ())) > 0:
+        return int(value.shape[0])
+    return None
+
+def profiled(stage: Optional[str] = None) -> Callable:
+    """Decorate a method or function so each call is recorded as a stage.
+    
+    Rows are taken from the first DataFrame/array argument, or from the
+    result if no argument has a length.
+    """
+    def decorator(func: Callable) -> Callable:
+        name = stage or func.__qualname__
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows = next((n for n in map(_count_rows, list(args) + list(kwargs.values())) if n is not None), None)
+            with profile_stage(name, rows) as measurement:
+                result = func(*args, **kwargs)
+                if measurement['rows'] is None:
+                    measurement['rows'] = _count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+# src/utils/query_cache.py
+import os
+import re
+import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+import pyarrow as pa
+from typing import Dict, Any, Callable, List, Mapping, Optional, Tuple
+from pathlib import Path
+
+def cache_key(query: str, params: Optional[Mapping[str, Any]] = None,
+              namespace: Optional[str] = None) -> str:
+    """Hash whitespace-normalized SQL together with its sorted parameters.
+    
+    `namespace` identifies the database the query runs against, so equal
+    queries on different databases get different keys.
+    """
+    sql = re.sub(r'\s+', ' ', str(query)).strip()
+    payload = json.dumps([namespace, sql, sorted((params or {}).items())], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class QueryCache:
+    """Two-tier cache of query results keyed by database, normalized SQL and parameters.
+    
+    Results live in an in-memory LRU bounded by `max_bytes`; with a
+    `directory`, they are also written through to Arrow IPC files, bounded
+    by `max_disk_bytes`, which outlive evictions and the process. Every
+    entry records the `transactions` high-water mark it was read at and is
+    dropped once that mark moves or the entry is older than `ttl_seconds`.
+    The mark itself is re-read at most every `high_water_mark_ttl` seconds,
+    so a hit needs no database round trip and new transactions show up
+    within that interval; marks are tracked per namespace, so one cache can
+    serve several databases. Disk reads and writes happen outside the lock.
+    """
+    
+    def __init__(self, max_bytes: int = 256 * 2 ** 20,
+                 directory: Optional[str] = None,
+                 max_disk_bytes: int = 2 * 2 ** 30,
+                 ttl_seconds: float = 24 * 3600,
+                 high_water_mark_ttl: float = 1.0):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.high_water_mark_ttl = high_water_mark_ttl
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._high_water_marks: Dict[Optional[str], Tuple[int, float]] = {}
+        self._stats = {
+            'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+            'evictions': 0, 'disk_evictions': 0, 'invalidations': 0
+        }
+    
+    def get(self, key: str, high_water_mark: int) -> Optional[pd.DataFrame]:
+        """Return the cached frame for `key` if it is still valid, else None."""
+        stale = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_valid(entry, high_water_mark):
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return entry['frame'].copy(deep=False)
+                self._drop(key)
+                stale = True
+        
+        entry = self._read_disk(key)
+        if entry is not None and not self._is_valid(entry, high_water_mark):
+            self._disk_path(key).unlink(missing_ok=True)
+            entry, stale = None, True
+        with self._lock:
+            if entry is not None:
+                self._stats['disk_hits'] += 1
+                self._insert(key, entry)
+                return entry['frame'].copy(deep=False)
+            self._stats['invalidations'] += int(stale)
+            self._stats['misses'] += 1
+            return None
+    
+    def put(self, key: str, frame: pd.DataFrame, high_water_mark: int):
+        """Store a query result read at `high_water_mark`."""
+        entry = {
+            'frame': frame.copy(deep=False),
+            'high_water_mark': high_water_mark,
+            'created_at': time.time(),
+            'nbytes': int(frame.memory_usage(deep=True).sum())
+        }
+        with self._lock:
+            self._insert(key, entry)
+        if self.directory is not None:
+            self._write_disk(key, entry)
+    
+    def high_water_mark(self, read: Callable[[], int], namespace: Optional[str] = None) -> int:
+        """Return the last mark from `read` for `namespace`, calling it again once `high_water_mark_ttl` has passed."""
+        now = time.monotonic()
+        with self._lock:
+            high_water_mark, read_at = self._high_water_marks.get(namespace, (None, float('-inf')))
+            if now - read_at < self.high_water_mark_ttl:
+                return high_water_mark
+        high_water_mark = read()
+        with self._lock:
+            self._high_water_marks[namespace] = (high_water_mark, now)
+        return high_water_mark
+    
+    def get_or_load(self, query: str, params: Optional[Mapping[str, Any]],
+                    high_water_mark: int, load: Callable[[], pd.DataFrame],
+                    namespace: Optional[str] = None) -> pd.DataFrame:
+        """Return the cached result of `query` against `namespace`, running `load` on a miss."""
+        key = cache_key(query, params, namespace)
+        frame = self.get(key, high_water_mark)
+        if frame is None:
+            frame = load()
+            self.put(key, frame, high_water_mark)
+        return frame
+    
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self.directory is not None:
+                for path in self.directory.glob('*.arrow'):
+                    path.unlink(missing_ok=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss, eviction and size counters for tuning the cache."""
+        with self._lock:
+            lookups = self._stats['memory_hits'] + self._stats['disk_hits'] + self._stats['misses']
+            hits = self._stats['memory_hits'] + self._stats['disk_hits']
+            return {
+                **self._stats,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'memory_bytes': self._bytes,
+                'disk_bytes': sum(stat.st_size for _, stat in self._disk_files())
+            }
+    
+    def _is_valid(self, entry: Dict[str, Any], high_water_mark: int) -> bool:
+        return (entry['high_water_mark'] == high_water_mark
+                and time.time() - entry['created_at'] < self.ttl_seconds)
+    
+    def _insert(self, key: str, entry: Dict[str, Any]):
+        """Add to the memory tier, evicting least recently used entries past `max_bytes`."""
+        self._drop(key)
+        if entry['nbytes'] > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry['nbytes']
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted['nbytes']
+            self._stats['evictions'] += 1
+    
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry['nbytes']
+    
+    def _disk_path(self, key: str) -> Path:
+        return self.directory / f'{key}.arrow'
+    
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.directory is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with pa.memory_map(str(path)) as source:
+                table = pa.ipc.open_file(source).read_all()
+            os.utime(path)
+        except FileNotFoundError:
+            # Never written, or evicted by another writer meanwhile
+            return None
+        metadata = table.schema.metadata or {}
+        frame = table.to_pandas()
+        return {
+            'frame': frame,
+            'high_water_mark': int(metadata[b'high_water_mark']),
+            'created_at': float(metadata[b'created_at']),
+            'nbytes': int(frame.memory_usage(deep=True).sum())
+        }
+    
+    def _disk_files(self) -> List[Tuple[Path, os.stat_result]]:
+        """Cached files with their stats, skipping any removed while listing."""
+        if self.directory is None:
+            return []
+        files = []
+        for path in self.directory.glob('*.arrow'):
+            try:
+                files.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        return files
+    
+    def _write_disk(self, key: str, entry: Dict[str, Any]):
+        """Atomically write an entry, then trim the oldest files past `max_disk_bytes`."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(entry['frame'].reset_index(drop=True), preserve_index=False)
+        # Keep the b'pandas' entry so dtypes such as categories round-trip
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            'high_water_mark': str(entry['high_water_mark']),
+            'created_at': repr(entry['created_at'])
+        })
+        path = self._disk_path(key)
+        # Concurrent writers of one key each write their own file before the swap
+        tmp_path = path.with_suffix(f'.arrow.{os.getpid()}.{threading.get_ident()}.tmp')
+        with pa.OSFile(str(tmp_path), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        
+        files = sorted(self._disk_files(), key=lambda item: item[1].st_mtime)
+        total = sum(stat.st_size for _, stat in files)
+        for old, stat in files:
+            if total <= self.max_disk_bytes or old == path:
+                break
+            total -= stat.st_size
+            try:
+                old.unlink()
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                self._stats['disk_evictions'] += 1
+
+# src/utils/lazy.py
+import sys
+import importlib
+from typing import Any, Callable, Dict, List, Tuple
+
+def lazy_exports(package: str, exports: Dict[str, str]) -> Tuple[Callable[[str], Any], Callable[[], List[str]]]:
+    """Build module-level `__getattr__` and `__dir__` that import submodules on first use.
+    
+    `exports` maps each public name to the submodule defining it, so
+    `package.Name` imports `package.submodule` (and the sklearn, SQLAlchemy
+    or pandas imports it carries) only when the name is first looked up.
+    The resolved object is then cached in the package namespace.
+    """
+    def __getattr__(name: str) -> Any:
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(f'{package}.{exports[name]}'), name)
+        setattr(sys.modules[package], name, value)
+        return value
+    
+    def __dir__() -> List[str]:
+        return sorted(set(vars(sys.modules[package])) | set(exports))
+    
+    return __getattr__, __dir__
+
+# src/utils/results.py
+import json
+import numbers
+from datetime import datetime, date
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, Any, List, Optional, Tuple
+from pathlib import Path
+
+METRICS_LOG = 'runs.jsonl'
+# Where runs were logged before, shared with other writers' records
+LEGACY_METRICS_LOG = 'metrics.jsonl'
+
+def _metric_value(value: Any) -> Any:
+    """Convert a scalar result to a JSON value; NaN becomes null."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, (datetime, date, pd.Timestamp)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, bool, numbers.Number)):
+        return value
+    if isinstance(value, (list, tuple)) and all(not isinstance(v, (dict, list, tuple)) for v in value):
+        return [_metric_value(v) for v in value]
+    return str(value)
+
+def _as_frame(value: Any) -> Optional[pd.DataFrame]:
+    """Return tabular results as a DataFrame, or None for scalar results."""
+    if isinstance(value, pd.DataFrame):
+        return value
+    if isinstance(value, pd.Series):
+        return value.to_frame(name=value.name if value.name is not None else 'value')
+    if isinstance(value, np.ndarray) and value.ndim > 0:
+        return pd.DataFrame(value.reshape(len(value), -1))
+    return None
+
+def _flatten(results: Dict[str, Any], prefix: str = '') -> Tuple[Dict[str, Any], Dict[str, pd.DataFrame]]:
+    """Split nested results into dotted scalar metrics and tables."""
+    metrics, tables = {}, {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            nested_metrics, nested_tables = _flatten(value, f'{name}.')
+            metrics.update(nested_metrics)
+            tables.update(nested_tables)
+        elif (frame := _as_frame(value)) is not None:
+            tables[name] = frame
+        else:
+            metrics[name] = _metric_value(value)
+    return metrics, tables
+
+class ResultsWriter:
+    """Write pipeline results stage by stage as they are produced.
+    
+    Tables (DataFrames, Series and arrays) go to compressed Parquet files
+    under `<directory>/runs/<run_id>/<stage>/`; a table written several
+    times in one stage is appended as further row groups, so large results
+    can be streamed chunk by chunk. Scalars are flattened to dotted keys and
+    appended as one JSON line per stage to `<directory>/runs.jsonl`,
+    which every run shares so runs can be queried and diffed.
+    """
+    
+    def __init__(self, directory: str = 'results', run_id: Optional[str] = None,
+                 compression: str = 'zstd'):
+        self.directory = Path(directory)
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        self.run_dir = self.directory / 'runs' / self.run_id
+        self.compression = compression
+        self._writers: Dict[Tuple[str, str], pq.ParquetWriter] = {}
+        self._tables: Dict[str, Dict[str, str]] = {}
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+    
+    def __enter__(self) -> 'ResultsWriter':
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def append(self, stage: str, name: str, data: Any):
+        """Append rows to a stage's table, creating its Parquet file on first use."""
+        frame = _as_frame(data)
+        if frame is None:
+            raise TypeError(f"Cannot write {type(data).__name__} as table {stage}/{name}")
+        table = pa.Table.from_pandas(frame, preserve_index=not isinstance(frame.index, pd.RangeIndex))
+        
+        writer = self._writers.get((stage, name))
+        if writer is None:
+            path = self.run_dir / stage / f'{name}.parquet'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            writer = pq.ParquetWriter(path, table.schema, compression=self.compression)
+            self._writers[(stage, name)] = writer
+            self._tables.setdefault(stage, {})[name] = str(path.relative_to(self.directory))
+        elif not table.schema.equals(writer.schema, check_metadata=False):
+            table = table.cast(writer.schema)
+        writer.write_table(table)
+    
+    def write_stage(self, stage: str, results: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Finish a stage: write its tables, close them and log its metrics."""
+        metrics, tables = _flatten(results or {})
+        for name, frame in tables.items():
+            self.append(stage, name, frame)
+        for key in [key for key in self._writers if key[0] == stage]:
+            self._writers.pop(key).close()
+        
+        record = {
+            'run_id': self.run_id,
+            'stage': stage,
+            'timestamp': datetime.now().isoformat(),
+            'metrics': metrics,
+            'tables': self._tables.pop(stage, {})
+        }
+        with open(self.directory / METRICS_LOG, 'a') as f:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        return record
+    
+    def close(self):
+        """Finish every stage that still has open tables."""
+        for stage in list(dict.fromkeys(stage for stage, _ in self._writers)):
+            self.write_stage(stage)
+
+def _read_log(directory: str) -> List[Dict[str, Any]]:
+    """Run records from the metrics log, skipping lines other writers appended."""
+    records = []
+    for name in (LEGACY_METRICS_LOG, METRICS_LOG):
+        path = Path(directory) / name
+        if path.exists():
+            with open(path, 'r') as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+    return [r for r in records if isinstance(r.get('metrics'), dict) and 'run_id' in r]
+
+def list_runs(directory: str = 'results') -> List[str]:
+    """Return the logged run ids, oldest first."""
+    return list(dict.fromkeys(record['run_id'] for record in _read_log(directory)))
+
+def read_metrics(directory: str = 'results', run_id: Optional[str] = None,
+                 stage: Optional[str] = None) -> pd.DataFrame:
+    """Return logged metrics as rows of run_id, stage, timestamp, metric and value."""
+    rows = [
+        {'run_id': record['run_id'], 'stage': record['stage'], 'timestamp': record['timestamp'],
+         'metric': metric, 'value': value}
+        for record in _read_log(directory)
+        if (run_id is None or record['run_id'] == run_id) and (stage is None or record['stage'] == stage)
+        for metric, value in record['metrics'].items()
+    ]
+    return pd.DataFrame(rows, columns=['run_id', 'stage', 'timestamp', 'metric', 'value'])
+
+def read_table(directory: str, run_id: str, stage: str, name: str,
+               columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read a table written by ResultsWriter, optionally only some columns."""
+    return pd.read_parquet(Path(directory) / 'runs' / run_id / stage / f'{name}.parquet', columns=columns)
+
+def diff_runs(directory: str = 'results', base: Optional[str] = None,
+              run: Optional[str] = None) -> pd.DataFrame:
+    """Compare the metrics of two runs, by default the last two.
+    
+    Returns one row per (stage, metric) present in either run with the base
+    and run values and, for numeric metrics, the absolute change.
+    """
+    runs = list_runs(directory)
+    if base is None or run is None:
+        if len(runs) < 2:
+            raise ValueError(f"Need two runs to diff, found {len(runs)} in {directory}")
+        base, run = base or runs[-2], run or runs[-1]
+    
+    def values(run_id: str) -> pd.Series:
+        metrics = read_metrics(directory, run_id)
+        # A stage logged twice in one run keeps its latest metrics
+        return metrics.drop_duplicates(['stage', 'metric'], keep='last').set_index(['stage', 'metric'])['value']
+    
+    diff = pd.concat({'base': values(base), 'run': values(run)}, axis=1)
+    change = pd.Series(np.nan, index=diff.index)
+    both = diff['base'].map(_is_number) & diff['run'].map(_is_number)
+    change[both] = diff.loc[both, 'run'].astype(float) - diff.loc[both, 'base'].astype(float)
+    diff['change'] = change
+    # Logged nulls, NaN and metrics absent from a run all count as missing
+    diff['changed'] = [
+        _is_missing(a) != _is_missing(b) or (not _is_missing(a) and a != b)
+        for a, b in zip(diff['base'], diff['run'])
+    ]
+    return diff
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
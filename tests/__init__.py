@@ -5,7 +5,10 @@
 import pytest
 import pandas as pd
 import numpy as np
-from src.data import DataLoader, DataPreprocessor
+import sqlalchemy as db
+from src.data import DataLoader, DataPreprocessor, FeatureStore, SyntheticDataGenerator
+from src.data.schema import parse_schema
+from src.models import TemporalState
 
 @pytest.fixture
 def sample_data():
@@ -31,11 +34,289 @@ def test_data_preprocessor_feature_creation(sample_data):
     
     assert 'days_since_last_purchase' in processed_data.columns
 
+@pytest.fixture
+def transaction_db(tmp_path):
+    """Create a SQLite stand-in database with a transactions table."""
+    engine = db.create_engine(f"sqlite:///{tmp_path / 'insights.db'}")
+    rng = np.random.default_rng(0)
+    transactions = pd.DataFrame({
+        'transaction_id': range(1, 51),
+        'customer_id': rng.integers(1, 11, 50),
+        'date': pd.date_range('2023-01-01', periods=50, freq='12h'),
+        'amount': rng.integers(500, 20000, 50) / 100,
+        'product_category': rng.choice(['A', 'B', 'C'], 50),
+        'channel': rng.choice(['online', 'store'], 50)
+    })
+    transactions.to_sql('transactions', engine, index=False)
+    pd.DataFrame({
+        'customer_id': range(1, 13),
+        'segment': ['Segment_1', 'Segment_2'] * 6,
+        'lifetime_value': np.linspace(100, 1200, 12)
+    }).to_sql('customers', engine, index=False)
+    return engine, transactions
+
+def test_stream_transactions_chunks(transaction_db):
+    engine, transactions = transaction_db
+    loader = DataLoader(engine=engine)
+    chunks = list(loader.stream_transactions(
+        columns=['customer_id', 'date', 'amount'],
+        start_date=pd.Timestamp('2023-01-05'),
+        end_date=pd.Timestamp('2023-01-20'),
+        chunksize=7
+    ))
+    
+    assert all(len(chunk) <= 7 for chunk in chunks)
+    streamed = pd.concat(chunks, ignore_index=True)
+    assert list(streamed.columns) == ['customer_id', 'date', 'amount']
+    assert streamed['date'].dtype.kind == 'M'
+    assert streamed['amount'].dtype == np.float64
+    expected = transactions[(transactions['date'] >= '2023-01-05') & (transactions['date'] < '2023-01-20')]
+    assert len(streamed) == len(expected)
+
+def test_stream_transactions_rejects_unknown_columns(transaction_db):
+    engine, _ = transaction_db
+    loader = DataLoader(engine=engine)
+    with pytest.raises(ValueError):
+        next(loader.stream_transactions(columns=['amount; DROP TABLE transactions']))
+
+@pytest.mark.parametrize('use_view', [False, True])
+def test_load_customer_features_push_down(transaction_db, use_view):
+    engine, transactions = transaction_db
+    with engine.begin() as conn:
+        conn.execute(db.text("""
+        CREATE VIEW customer_segments AS
+        SELECT
+            c.customer_id,
+            COUNT(t.transaction_id) as total_transactions,
+            SUM(t.amount) as total_spent,
+            AVG(t.amount) as avg_transaction,
+            MAX(t.date) as last_purchase
+        FROM customers c
+        LEFT JOIN transactions t ON c.customer_id = t.customer_id
+        GROUP BY c.customer_id
+        """))
+    loader = DataLoader(engine=engine)
+    features = loader.load_customer_features(as_of=pd.Timestamp('2023-03-01'), use_view=use_view)
+    features = features.set_index('customer_id').sort_index()
+    
+    grouped = transactions.groupby('customer_id')
+    assert len(features) == 12
+    assert features.loc[11:, 'purchase_frequency'].tolist() == [0, 0]
+    assert features.loc[11:, 'total_spent'].tolist() == [0.0, 0.0]
+    pd.testing.assert_series_equal(
+        features.loc[grouped.groups.keys(), 'total_spent'], grouped['amount'].sum(),
+        check_names=False, check_index_type=False
+    )
+    expected_days = (pd.Timestamp('2023-03-01') - grouped['date'].max()).dt.days
+    assert (features.loc[expected_days.index, 'days_since_last_purchase'] == expected_days).all()
+
+def test_feature_store_incremental_refresh(transaction_db, tmp_path):
+    engine, transactions = transaction_db
+    loader = DataLoader(engine=engine)
+    store = FeatureStore(tmp_path / 'store')
+    
+    assert store.refresh(loader) == 12
+    assert store.high_water_mark == 50
+    assert store.refresh(loader) == 0
+    
+    pd.DataFrame({
+        'transaction_id': [51, 52],
+        'customer_id': [3, 12],
+        'date': pd.to_datetime(['2023-02-10', '2023-02-11']),
+        'amount': [10.0, 20.0],
+        'product_category': ['A', 'B'],
+        'channel': ['online', 'store']
+    }).to_sql('transactions', engine, index=False, if_exists='append')
+    assert not store.is_fresh(loader.transaction_high_water_mark())
+    assert store.refresh(loader) == 2
+    
+    as_of = pd.Timestamp('2023-03-01')
+    stored = store.read(as_of=as_of).set_index('customer_id').sort_index()
+    expected = loader.query_customer_features().pipe(
+        lambda df: df.assign(days_since_last_purchase=(as_of - df.pop('last_purchase')).dt.days)
+    ).set_index('customer_id').sort_index()
+    pd.testing.assert_frame_equal(stored[expected.columns], expected, check_dtype=False)
+    
+    cached_loader = DataLoader(engine=engine, feature_store=store)
+    assert cached_loader.load_customer_features(as_of=as_of)['purchase_frequency'].sum() == 52
+
+def test_sample_transactions_is_nested_and_counts_strata(transaction_db):
+    engine, transactions = transaction_db
+    loader = DataLoader(engine=engine)
+    small = loader.sample_transactions(0.2, seed=7)
+    large = loader.sample_transactions(0.6, seed=7)
+    
+    assert 0 < len(small) < len(large) < len(transactions)
+    assert set(small['transaction_id']) <= set(large['transaction_id'])
+    counts = loader.transaction_counts('product_category')
+    pd.testing.assert_series_equal(
+        counts.sort_index(), transactions['product_category'].value_counts().sort_index(),
+        check_names=False
+    )
+    with pytest.raises(ValueError):
+        loader.sample_transactions(0)
+
+def test_schema_types_compact_transactions(tmp_path):
+    engine = db.create_engine(f"sqlite:///{tmp_path / 'typed.db'}")
+    generator = SyntheticDataGenerator(n_customers=500, transactions_per_customer=20, seed=3)
+    generator.write_sql(engine)
+    loader = DataLoader(engine=engine)
+    
+    typed = loader.load_transactions(days=(pd.Timestamp.now() - generator.start_date).days + 1)
+    raw = pd.read_sql("SELECT * FROM transactions", engine)
+    assert typed['transaction_id'].dtype == np.int32
+    assert isinstance(typed['product_category'].dtype, pd.CategoricalDtype)
+    assert isinstance(typed['channel'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(typed['date'])
+    assert raw.memory_usage(deep=True).sum() >= 3 * typed.memory_usage(deep=True).sum()
+    
+    features = loader.load_customer_features()
+    assert isinstance(features['segment'].dtype, pd.CategoricalDtype)
+    assert features['customer_id'].dtype == np.int32
+
+def test_parse_schema_maps_sql_types():
+    tables = parse_schema()
+    assert tables['transactions']['amount'] == 'float64'
+    assert tables['customers']['segment'] == 'category'
+    assert 'name' not in tables['customers']
+    assert tables['customer_patterns']['last_purchase_date'].startswith('datetime64')
+
+def test_feature_store_keeps_pandas_dtypes(tmp_path):
+    features = pd.DataFrame({
+        'customer_id': [1, 2, 3],
+        'segment': pd.Categorical(['a', 'b', 'a']),
+        'referrals': pd.array([1, None, 3], dtype='Int64')
+    })
+    store = FeatureStore(tmp_path / 'store')
+    store.write(features, high_water_mark=7)
+    
+    pd.testing.assert_frame_equal(store.read(), features)
+    assert store.high_water_mark == 7
+
+def test_temporal_state_refreshes_past_high_water_mark(tmp_path):
+    engine = db.create_engine(f"sqlite:///{tmp_path / 'temporal.db'}")
+    generator = SyntheticDataGenerator(n_customers=40, transactions_per_customer=6, seed=8)
+    generator.write_sql(engine)
+    loader = DataLoader(engine=engine)
+    state = TemporalState()
+    
+    assert state.refresh(loader, chunksize=50) == generator.n_transactions
+    assert state.refresh(loader) == 0
+    last = pd.read_sql("SELECT * FROM transactions ORDER BY transaction_id DESC LIMIT 1", engine)
+    new = last.assign(transaction_id=last['transaction_id'] + 1,
+                      date=pd.to_datetime(last['date']) + pd.Timedelta(days=400))
+    new.to_sql('transactions', engine, index=False, if_exists='append')
+    
+    assert state.refresh(loader) == 1
+    features = state.customer_features().set_index('customer_id')
+    assert features.loc[int(new['customer_id'].iloc[0]), 'days_since_last_purchase'] == 0
+    assert features['transactions_90d'].sum() == 1
+
+def test_temporal_state_refresh_folds_each_row_once(transaction_db):
+    engine, transactions = transaction_db
+    
+    class FailingLoader(DataLoader):
+        def stream_transactions(self, **kwargs):
+            chunks = super().stream_transactions(**kwargs)
+            yield next(chunks)
+            chunks.close()
+            # A row committed mid-refresh, then a dropped connection
+            extra = transactions.iloc[[-1]].assign(transaction_id=51)
+            extra.to_sql('transactions', engine, index=False, if_exists='append')
+            raise ConnectionError("stream interrupted")
+    
+    state = TemporalState()
+    with pytest.raises(ConnectionError):
+        state.refresh(FailingLoader(engine=engine), chunksize=20)
+    assert state.high_water_mark == 20
+    
+    assert state.refresh(DataLoader(engine=engine), chunksize=20) == 31
+    assert state.high_water_mark == 51
+    assert state.day_transactions.sum() == 51
+    assert state.purchase_days.sum() == transactions.assign(day=transactions['date'].dt.floor('D')) \
+        .drop_duplicates(['customer_id', 'day']).shape[0]
+
+def test_data_preprocessor_reads_feature_store(transaction_db, tmp_path):
+    engine, transactions = transaction_db
+    loader = DataLoader(engine=engine)
+    store = FeatureStore(tmp_path / 'store')
+    store.refresh(loader)
+    customers = pd.DataFrame({'customer_id': range(1, 13)})
+    preprocessor = DataPreprocessor(feature_store=store, loader=loader)
+    processed = preprocessor.preprocess_data(customers)
+    
+    assert set(preprocessor.numeric_features) <= set(processed.columns)
+    assert processed[preprocessor.numeric_features].isna().sum().sum() == 0
+    
+    # A store behind the database is refreshed before its features are joined
+    transactions.tail(1).assign(transaction_id=51, customer_id=12, amount=10.0) \
+        .to_sql('transactions', engine, index=False, if_exists='append')
+    processed = preprocessor.preprocess_data(customers).set_index('customer_id')
+    mean, scale = preprocessor.scaler.mean_[0], preprocessor.scaler.scale_[0]
+    assert store.high_water_mark == 51
+    assert processed.loc[12, 'total_spent'] * scale + mean == pytest.approx(10.0)
+    # Without a loader the store's freshness is unknown, so nothing is joined
+    assert 'total_spent' not in DataPreprocessor(feature_store=store).preprocess_data(customers)
+    
+    # Freshness is checked once per pass, and only the requested customers are read
+    refreshes = []
+    refresh = store.refresh
+    store.refresh = lambda loader: refreshes.append(loader) or refresh(loader)
+    chunks = list(preprocessor.transform_chunks([customers.iloc[:4], customers.iloc[4:8], customers.iloc[8:]]))
+    assert len(refreshes) == 1 and sum(len(c) for c in chunks) == 12
+    preprocessor.preprocess_data(customers)
+    assert len(refreshes) == 2
+    subset = store.read(columns=['customer_id', 'days_since_last_purchase'], customer_ids=[3, 12])
+    assert sorted(subset['customer_id']) == [3, 12]
+    assert list(subset.columns) == ['customer_id', 'days_since_last_purchase']
+
+def test_data_preprocessor_fit_transform_split(sample_data, tmp_path):
+    preprocessor = DataPreprocessor().fit(sample_data)
+    scoring = pd.DataFrame({
+        'customer_id': [6, 7],
+        'total_spent': [None, 3000.0],
+        'purchase_frequency': [12.0, None],
+        'avg_transaction': [150.0, 150.0],
+        'last_purchase_date': ['2023-01-01', None]
+    })
+    transformed = preprocessor.transform(scoring)
+    
+    # Fill values and scaling come from the training data, not the scoring batch
+    expected_spent = (sample_data['total_spent'].median() - preprocessor.scaler.mean_[0]) / preprocessor.scaler.scale_[0]
+    assert transformed.loc[0, 'total_spent'] == pytest.approx(expected_spent)
+    assert scoring['total_spent'].isna().sum() == 1
+    
+    restored = DataPreprocessor.load(preprocessor.save(tmp_path / 'preprocessor.json'))
+    pd.testing.assert_frame_equal(restored.transform(scoring), transformed)
+    chunked = pd.concat(preprocessor.transform_chunks([scoring.iloc[:1], scoring.iloc[1:]]))
+    pd.testing.assert_frame_equal(chunked, transformed)
+
+def test_synthetic_generator_matches_schema():
+    generator = SyntheticDataGenerator(n_customers=40, transactions_per_customer=5, seed=7)
+    tables = generator.generate()
+    
+    assert list(tables['customers'].columns) == [
+        'customer_id', 'name', 'email', 'join_date', 'segment', 'lifetime_value'
+    ]
+    assert list(tables['transactions'].columns) == [
+        'transaction_id', 'customer_id', 'date', 'amount', 'product_category', 'channel'
+    ]
+    assert len(tables['transactions']) == 200
+    assert tables['transactions']['customer_id'].between(1, 40).all()
+    assert tables['transactions']['date'].is_monotonic_increasing
+    
+    chunked = pd.concat(SyntheticDataGenerator(40, 5, seed=7).transactions(chunksize=1_000_000))
+    pd.testing.assert_frame_equal(chunked, tables['transactions'])
+
 # tests/test_models.py
 import pytest
 import pandas as pd
 import numpy as np
-from src.models import CustomerSegmentation, PredictionModel, PatternAnalyzer
+from src.data import DataPreprocessor
+from src.models import (
+    CustomerSegmentation, PredictionModel, PatternAnalyzer, PatternState,
+    CardinalitySketch, StreamingSegmentation, SegmentationSearch, ScoringService, TemporalState
+)
 
 @pytest.fixture
 def sample_customer_data():
@@ -54,6 +335,7 @@ def test_customer_segmentation(sample_customer_data):
     
     assert 'segment' in result.columns
     assert len(result['segment'].unique()) == 3
+    assert isinstance(result['segment'].dtype, pd.CategoricalDtype)
 
 def test_prediction_model(sample_customer_data):
     # Add target variable for testing
@@ -67,10 +349,291 @@ def test_prediction_model(sample_customer_data):
     assert 0 <= metrics['train_score'] <= 1
     assert 0 <= metrics['test_score'] <= 1
 
+@pytest.fixture
+def sample_transactions():
+    """Create sample transaction data for testing."""
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({
+        'transaction_id': range(1, 201),
+        'customer_id': rng.integers(1, 31, 200),
+        'date': pd.to_datetime('2023-01-01') + pd.to_timedelta(rng.integers(0, 60 * 24, 200), unit='h'),
+        'amount': rng.integers(100, 50000, 200) / 100,
+        'product_category': rng.choice(['A', 'B', 'C', 'D'], 200)
+    })
+
+def test_pattern_analyzer_chunks_match_full(sample_transactions):
+    analyzer = PatternAnalyzer()
+    expected = analyzer.analyze_patterns(sample_transactions)
+    chunks = [sample_transactions.iloc[i:i + 37] for i in range(0, 200, 37)]
+    result = analyzer.analyze_pattern_chunks(chunks)
+    
+    for key, value in expected['temporal'].items():
+        assert result['temporal'][key] == pytest.approx(value)
+    for key, value in expected['monetary'].items():
+        assert result['monetary'][key] == pytest.approx(value)
+    pd.testing.assert_frame_equal(
+        result['categorical']['top_categories'],
+        expected['categorical']['top_categories'],
+        check_dtype=False
+    )
+
+def test_pattern_analyzer_incremental_matches_full(sample_transactions):
+    expected = PatternAnalyzer().analyze_patterns(sample_transactions)
+    analyzer = PatternAnalyzer(incremental=True)
+    analyzer.analyze_patterns(sample_transactions.iloc[:120])
+    result = analyzer.analyze_patterns(sample_transactions.iloc[120:])
+    
+    assert result['temporal'] == pytest.approx(expected['temporal'])
+    assert result['monetary']['avg_transaction_value'] == pytest.approx(expected['monetary']['avg_transaction_value'])
+    assert result['monetary']['spending_std'] == pytest.approx(expected['monetary']['spending_std'])
+    assert result['monetary']['median_transaction_value'] == pytest.approx(
+        expected['monetary']['median_transaction_value'], rel=0.01
+    )
+    pd.testing.assert_frame_equal(
+        result['categorical']['highest_value_categories'],
+        expected['categorical']['highest_value_categories'],
+        check_dtype=False
+    )
+
+def test_pattern_state_merge(sample_transactions):
+    left = PatternState().update(sample_transactions.iloc[:80])
+    right = PatternState().update(sample_transactions.iloc[80:])
+    merged = left.merge(right)
+    single = PatternState().update(sample_transactions)
+    
+    assert merged.amount_stats.count == single.amount_stats.count
+    assert merged.amount_stats.variance == pytest.approx(sample_transactions['amount'].var())
+    pd.testing.assert_series_equal(merged.category_cardinality(), single.category_cardinality())
+
+def test_temporal_state_matches_full_history(sample_transactions):
+    ordered = sample_transactions.sort_values('date')
+    state = TemporalState(windows=(7, 30))
+    analyzer = PatternAnalyzer(incremental=True, temporal=state)
+    for start in range(0, 200, 50):
+        analyzer.analyze_patterns(ordered.iloc[start:start + 50].sample(frac=1, random_state=start))
+    features = state.customer_features().set_index('customer_id').sort_index()
+    
+    days = sample_transactions.assign(day=sample_transactions['date'].dt.floor('D'))
+    as_of = days['day'].max()
+    gaps = days.drop_duplicates(['customer_id', 'day']).sort_values('day').groupby('customer_id')['day'].diff().dt.days
+    recent = days[days['day'] > as_of - pd.Timedelta(days=30)].groupby('customer_id')['amount']
+    
+    assert state.late_rows == state.expired_rows == 0
+    np.testing.assert_array_equal(
+        features['days_since_last_purchase'], (as_of - days.groupby('customer_id')['day'].max()).dt.days
+    )
+    np.testing.assert_allclose(features['days_between_purchases'], gaps.groupby(days['customer_id']).mean())
+    np.testing.assert_allclose(features['interval_std'], gaps.groupby(days['customer_id']).std())
+    np.testing.assert_array_equal(features['transactions_30d'], recent.count().reindex(features.index, fill_value=0))
+    np.testing.assert_allclose(features['spend_30d'], recent.sum().reindex(features.index, fill_value=0), rtol=1e-6)
+    
+    rolling = analyzer.summarize_state()['rolling']
+    last_week = days[days['day'] > as_of - pd.Timedelta(days=7)]
+    assert rolling['7d']['avg_daily_transactions'] == pytest.approx(len(last_week) / 7)
+    assert rolling['7d']['active_customers'] == last_week['customer_id'].nunique()
+
+def test_temporal_state_ring_expires_old_days():
+    state = TemporalState(windows=(7, 30))
+    state.update(pd.DataFrame({
+        'customer_id': [1, 1, 2],
+        'date': pd.to_datetime(['2024-01-01', '2024-01-20', '2024-01-25']),
+        'amount': [10.0, 20.0, 5.0]
+    }))
+    features = state.customer_features().set_index('customer_id')
+    assert features.loc[1, 'transactions_30d'] == 2 and features.loc[1, 'transactions_7d'] == 1
+    assert features.loc[1, 'days_between_purchases'] == 19
+    assert np.isnan(features.loc[2, 'days_between_purchases'])
+    
+    state.update(pd.DataFrame({
+        'customer_id': [2, 1],
+        'date': pd.to_datetime(['2024-03-01', '2024-01-10']),
+        'amount': [7.0, 1.0]
+    }))
+    features = state.customer_features().set_index('customer_id')
+    assert state.expired_rows == 1 and state.late_rows == 1
+    assert features.loc[1, 'transactions_30d'] == 0
+    assert features.loc[2, 'spend_30d'] == 7.0
+    assert features.loc[2, 'days_between_purchases'] == 36
+    assert features.loc[1, 'days_since_last_purchase'] == 41
+    assert state.daily()['transactions'].sum() == 1
+
+def test_temporal_state_daily_after_last_day():
+    state = TemporalState(windows=(7,))
+    state.update(pd.DataFrame({
+        'customer_id': [1, 2, 1],
+        'date': pd.to_datetime(['2024-01-01', '2024-01-03', '2024-01-03']),
+        'amount': [4.0, 10.0, 15.0]
+    }))
+    daily = state.daily(as_of='2024-01-05')
+    
+    assert daily.index[-1] == pd.Timestamp('2024-01-05')
+    assert daily.loc['2024-01-03', 'transactions'] == 2 and daily.loc['2024-01-03', 'revenue'] == 25.0
+    assert daily.loc['2024-01-04':, 'transactions'].tolist() == [0, 0]
+    assert daily.loc['2024-01-05', 'transactions_7d'] == 3
+    assert state.daily(as_of='2024-01-20')['transactions'].sum() == 0
+
+def test_pattern_analyzer_approximate_intervals():
+    rng = np.random.default_rng(4)
+    n = 200_000
+    transactions = pd.DataFrame({
+        'amount': rng.lognormal(3.5, 0.6, n),
+        'product_category': rng.choice(['A', 'B', 'C', 'D'], n, p=[0.4, 0.3, 0.2, 0.1])
+    })
+    analyzer = PatternAnalyzer()
+    exact = analyzer._analyze_monetary_patterns(transactions)
+    approx = analyzer.analyze_patterns_approximate(transactions, target_error=0.02)
+    
+    assert approx['sampling']['target_met']
+    assert approx['sampling']['rows'] < n
+    for metric in ['avg_transaction_value', 'median_transaction_value', 'spending_std']:
+        interval = approx['monetary'][metric]
+        assert interval['lower'] <= exact[metric] <= interval['upper']
+        assert interval['relative_error'] <= 0.02
+    top = approx['categorical']['top_categories']
+    assert list(top.index) == ['A', 'B', 'C']
+    assert top.loc['A', 'count'] == (transactions['product_category'] == 'A').sum()
+    
+    budgeted = analyzer.analyze_patterns_approximate(transactions, target_error=1e-6, time_budget=0.5)
+    assert not budgeted['sampling']['target_met']
+    assert budgeted['sampling']['fraction'] < 1
+
+def test_cardinality_sketch_estimate():
+    sketch = CardinalitySketch().update(np.arange(50_000))
+    sketch.merge(CardinalitySketch().update(np.arange(25_000, 75_000)))
+    
+    assert sketch.estimate() == pytest.approx(75_000, rel=0.05)
+
+def test_streaming_segmentation_warm_start(sample_customer_data, tmp_path):
+    chunks = [sample_customer_data.iloc[i:i + 25] for i in range(0, 100, 25)]
+    segmentation = StreamingSegmentation(n_clusters=3, batch_size=25).fit(chunks)
+    result = segmentation.assign(sample_customer_data)
+    
+    assert isinstance(result['segment'].dtype, pd.CategoricalDtype)
+    assert list(result['segment'].cat.categories) == ['Segment_1', 'Segment_2', 'Segment_3']
+    assert 'segment' not in sample_customer_data.columns
+    
+    path = segmentation.save_centroids(tmp_path / 'centroids.npy')
+    restored = StreamingSegmentation(n_clusters=3, centroids_path=path)
+    np.testing.assert_array_equal(restored.predict(sample_customer_data), result['segment'])
+    restored.partial_fit(chunks[0])
+    assert restored.centroids.shape == (3, 4)
+
+def test_segmentation_search(sample_customer_data, tmp_path):
+    search = SegmentationSearch(k_values=[2, 3, 4], seeds=[0, 1], n_jobs=2, silhouette_sample_size=50)
+    result = search.search(sample_customer_data)
+    
+    scores = result['scores']
+    assert len(scores) == 6
+    assert {'n_clusters', 'seed', 'inertia', 'silhouette'} <= set(scores.columns)
+    assert result['best_params']['n_clusters'] == scores.iloc[0]['n_clusters']
+    best = result['best_model']
+    labels = best.predict(sample_customer_data)
+    features = sample_customer_data[best.feature_columns].to_numpy(dtype=np.float64)
+    np.testing.assert_array_equal(labels.codes, best.model.predict(features))
+    loaded = CustomerSegmentation.load(best.save(tmp_path / 'best'))
+    assert loaded.n_clusters == result['best_params']['n_clusters']
+    assert list(loaded.predict(sample_customer_data)) == list(labels)
+    
+    repeated = search.search(sample_customer_data)
+    pd.testing.assert_frame_equal(repeated['scores'], scores)
+
+@pytest.fixture
+def trained_model(sample_customer_data):
+    sample_customer_data['lifetime_value'] = (
+        sample_customer_data['total_spent'] * 2 + np.random.normal(0, 50, 100)
+    )
+    model = PredictionModel()
+    model.train(sample_customer_data)
+    return model
+
+def test_compiled_forest_matches_sklearn(trained_model, sample_customer_data):
+    forest = trained_model.compile()
+    X = sample_customer_data[trained_model.features].to_numpy()
+    
+    np.testing.assert_allclose(forest.predict(X), trained_model.predict(sample_customer_data))
+    assert forest.predict(X[0]).shape == (1,)
+
+def test_scoring_service_batches_concurrent_requests(trained_model, sample_customer_data):
+    X = sample_customer_data[trained_model.features].to_numpy()
+    expected = trained_model.predict(sample_customer_data)
+    with ScoringService(trained_model.compile(), max_batch_size=32, max_wait_ms=5) as service:
+        futures = [service.submit(row) for row in X]
+        scores = [future.result(timeout=5) for future in futures]
+        metrics = service.metrics()
+    
+    np.testing.assert_allclose(scores, expected)
+    assert metrics['requests'] == 100
+    assert metrics['batches'] < 100
+    assert metrics['latency_p99_ms'] > 0
+
+def test_prediction_model_save_and_load(trained_model, sample_customer_data, tmp_path):
+    preprocessor = DataPreprocessor()
+    preprocessor.preprocess_data(sample_customer_data)
+    config_path = tmp_path / 'config.yaml'
+    config_path.write_text('models: {}')
+    
+    first = trained_model.save(tmp_path / 'ltv', preprocessor=preprocessor)
+    latest = trained_model.save(tmp_path / 'ltv', preprocessor=preprocessor)
+    assert first.endswith('v1') and latest.endswith('v2')
+    
+    loaded = PredictionModel.load(tmp_path / 'ltv')
+    assert loaded.manifest['version'] == 2
+    assert isinstance(loaded.compiled.threshold, np.memmap)
+    assert isinstance(loaded.compiled.children, np.memmap)
+    np.testing.assert_allclose(loaded.predict(sample_customer_data), trained_model.predict(sample_customer_data))
+    np.testing.assert_allclose(loaded.scaler.mean_, preprocessor.scaler.mean_)
+    with pytest.raises(ValueError):
+        PredictionModel.load(tmp_path / 'ltv', config_path=config_path)
+
+def test_prediction_model_update_retires_oldest_trees(trained_model, sample_customer_data):
+    kept = trained_model.model.estimators_[20:]
+    recent = sample_customer_data.sample(n=50, random_state=1)
+    metrics = trained_model.update(recent, n_new_trees=20)
+    
+    estimators = trained_model.model.estimators_
+    assert metrics['n_trees'] == len(estimators) == 100
+    assert metrics['trees_added'] == metrics['trees_retired'] == 20
+    assert all(old is new for old, new in zip(kept, estimators[:80]))
+    assert metrics['holdout_rows'] == 20 + 10
+    assert trained_model.compiled is None
+    X = sample_customer_data[trained_model.features].to_numpy()
+    np.testing.assert_allclose(trained_model.compile().predict(X), trained_model.predict(sample_customer_data))
+
+def test_prediction_model_hist_gradient_boosting(sample_customer_data, tmp_path):
+    sample_customer_data['lifetime_value'] = sample_customer_data['total_spent'] * 2
+    model = PredictionModel(backend='hist_gradient_boosting')
+    model.train(sample_customer_data)
+    X = sample_customer_data[model.features].to_numpy()
+    
+    np.testing.assert_allclose(model.compile().predict(X), model.predict(sample_customer_data))
+    model.save(tmp_path / 'hgb')
+    loaded = PredictionModel.load(tmp_path / 'hgb')
+    assert loaded.backend == 'hist_gradient_boosting'
+    np.testing.assert_allclose(loaded.predict(sample_customer_data), model.predict(sample_customer_data))
+    gaps = sample_customer_data.copy()
+    gaps.loc[::3, 'total_spent'] = np.nan
+    np.testing.assert_allclose(loaded.predict(gaps), model.predict(gaps))
+    with pytest.raises(ValueError):
+        model.update(sample_customer_data)
+
+def test_customer_segmentation_save_and_load(sample_customer_data, tmp_path):
+    segmentation = CustomerSegmentation(n_clusters=3)
+    labelled = segmentation.fit_predict(sample_customer_data.copy())
+    path = segmentation.save(tmp_path / 'segments')
+    loaded = CustomerSegmentation.load(path)
+    
+    assert loaded.n_clusters == 3
+    assert list(loaded.predict(sample_customer_data)) == list(labelled['segment'])
+
 # tests/test_analysis.py
 import pytest
 import pandas as pd
-from src.analysis import PerformanceAnalyzer, CustomerInsights
+import numpy as np
+from src.analysis import PerformanceAnalyzer, CustomerInsights, ScenarioScorer
+from src.data import DataPreprocessor
+from src.models import CustomerSegmentation, PredictionModel
+from src.utils import profiling
+from src.utils.profiling import StageRecorder, profile_stage
 
 @pytest.fixture
 def sample_analysis_data():
@@ -98,4 +661,468 @@ def test_customer_insights(sample_analysis_data):
     
     assert 'segmentation' in results
     assert 'behavior' in results
-    assert 'value' in results
\ No newline at end of file
+    assert 'value' in results
+
+def test_customer_insights_transaction_chunks():
+    transactions = pd.DataFrame({
+        'transaction_id': range(1, 7),
+        'amount': [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+        'product_category': ['A', 'B', 'A', 'B', 'B', 'C'],
+        'channel': ['online', 'store', 'online', 'online', 'store', 'online']
+    })
+    insights = CustomerInsights()
+    result = insights.analyze_transaction_chunks([transactions.iloc[:4], transactions.iloc[4:]])
+    
+    assert result['category_preferences']['top_category'] == 'B'
+    assert result['category_preferences']['category_concentration'] == pytest.approx(110 / 210 * 100)
+    assert result['channel_usage'] == {'primary_channel': 'online', 'channel_diversity': 2}
+
+def test_customer_insights_estimate_customer_value():
+    rng = np.random.default_rng(5)
+    customers = pd.DataFrame({
+        'segment': rng.choice(['Segment_1', 'Segment_2', 'Segment_3'], 50_000),
+        'lifetime_value': rng.normal(2000, 400, 50_000)
+    })
+    exact = CustomerInsights()._analyze_customer_value(customers)
+    approx = CustomerInsights().estimate_customer_value(customers, target_error=0.05)
+    
+    assert approx['sampling']['target_met']
+    for metric, value in exact.items():
+        assert approx[metric]['lower'] <= value <= approx[metric]['upper']
+
+def test_performance_analyzer_uses_recorded_stages(tmp_path):
+    recorder = StageRecorder(maxlen=3)
+    for rows in [1000, 2000, 3000, 4000]:
+        with profile_stage('score', rows, stage_recorder=recorder):
+            sum(range(rows))
+    analyzer = PerformanceAnalyzer(history_size=2, recorder=recorder)
+    for _ in range(3):
+        metrics = analyzer.calculate_metrics(pd.DataFrame({'customer_id': [1]}))
+    
+    assert len(recorder.records) == 3
+    assert len(analyzer.metrics_history) == 2
+    expected = sum(r['wall_seconds'] for r in recorder.records) / 9000 * 1000
+    assert metrics['processing_time'] == pytest.approx(expected)
+    summary = analyzer.stage_summary()['score']
+    assert summary['calls'] == 3
+    assert summary['wall_p50'] <= summary['wall_p99']
+    assert all(r['peak_rss_growth_mb'] <= r['process_peak_rss_mb'] for r in recorder.records)
+    assert summary['max_peak_rss_growth_mb'] >= 0
+    
+    path = analyzer.export_metrics(tmp_path / 'stage_metrics.jsonl')
+    with open(path) as f:
+        assert len(f.readlines()) == 5
+
+def test_profiled_entry_points_record_stages():
+    profiling.recorder.clear()
+    insights_data = pd.DataFrame({
+        'customer_id': [1, 2],
+        'segment': ['Segment_1', 'Segment_2'],
+        'total_spent': [10.0, 20.0],
+        'purchase_frequency': [1, 2],
+        'avg_transaction': [10.0, 10.0],
+        'lifetime_value': [100.0, 200.0]
+    })
+    CustomerInsights().generate_insights(insights_data)
+    
+    record = profiling.recorder.records[-1]
+    assert record['stage'] == 'CustomerInsights.generate_insights'
+    assert record['rows'] == 2
+    assert record['cpu_seconds'] >= 0
+
+def test_customer_insights_fused_matches_default():
+    rng = np.random.default_rng(3)
+    data = pd.DataFrame({
+        'customer_id': range(1, 201),
+        'transaction_id': range(1001, 1201),
+        'segment': rng.choice(['Segment_1', 'Segment_2', 'Segment_3'], 200),
+        'total_spent': rng.normal(1000, 200, 200),
+        'purchase_frequency': rng.normal(10, 2, 200),
+        'avg_transaction': rng.normal(100, 20, 200),
+        'lifetime_value': rng.normal(2000, 400, 200),
+        'days_between_purchases': rng.gamma(2, 10, 200),
+        'amount': rng.normal(50, 10, 200),
+        'product_category': rng.choice(['A', 'B', 'C'], 200),
+        'channel': rng.choice(['online', 'store'], 200)
+    })
+    data.loc[::17, 'total_spent'] = np.nan
+    data.loc[::23, 'lifetime_value'] = np.nan
+    
+    expected = CustomerInsights().generate_insights(data)
+    result = CustomerInsights(fused=True).generate_insights(data)
+    
+    assert result['segmentation']['segment_distribution'].keys() == expected['segmentation']['segment_distribution'].keys()
+    for column, values in expected['segmentation']['segment_distribution'].items():
+        assert result['segmentation']['segment_distribution'][column] == pytest.approx(values)
+    assert result['segmentation']['dominant_segment'] == expected['segmentation']['dominant_segment']
+    assert result['behavior']['purchase_patterns'] == pytest.approx(expected['behavior']['purchase_patterns'])
+    assert result['behavior']['category_preferences']['top_category'] == expected['behavior']['category_preferences']['top_category']
+    assert result['behavior']['channel_usage'] == expected['behavior']['channel_usage']
+    assert result['value'] == pytest.approx(expected['value'])
+
+def test_scenario_scorer_matches_refeaturized_scoring():
+    rng = np.random.default_rng(6)
+    customers = pd.DataFrame({
+        'customer_id': range(300),
+        'total_spent': rng.gamma(2, 500, 300),
+        'purchase_frequency': rng.poisson(10, 300).astype(float),
+        'avg_transaction': rng.gamma(2, 50, 300),
+        'days_since_last_purchase': rng.integers(0, 200, 300).astype(float)
+    })
+    customers.loc[::25, 'avg_transaction'] = np.nan
+    customers['lifetime_value'] = customers['total_spent'] * 1.5 + rng.normal(0, 100, 300)
+    preprocessor = DataPreprocessor().fit(customers)
+    processed = preprocessor.transform(customers)
+    segmentation = CustomerSegmentation(n_clusters=3)
+    segmentation.fit_predict(processed.copy())
+    model = PredictionModel()
+    model.train(processed)
+    
+    scenarios = {'control': {}, 'lapse': {'days_since_last_purchase': 60},
+                 'spend_up': {'total_spent': 300, 'avg_transaction': -500}}
+    result = ScenarioScorer(segmentation, model, preprocessor, chunksize=100).score(customers, scenarios)
+    
+    base_segments = segmentation.predict(processed)
+    base_values = model.predict(processed)
+    assert (result['base']['segment'] == base_segments).all()
+    for name, deltas in scenarios.items():
+        changed = customers.copy()
+        for column, delta in deltas.items():
+            changed[column] = (changed[column].fillna(preprocessor.numeric_fill_[column]) + delta).clip(lower=0)
+        scored = preprocessor.transform(changed)
+        expected = pd.crosstab(base_segments, segmentation.predict(scored), dropna=False)
+        
+        np.testing.assert_array_equal(result['migrations'][name].to_numpy(), expected.to_numpy())
+        assert result['summary'].loc[name, 'ltv_shift_total'] == pytest.approx((model.predict(scored) - base_values).sum())
+        assert result['summary'].loc[name, 'migrated'] == len(customers) - np.trace(expected.to_numpy())
+    
+    relative = ScenarioScorer(segmentation, model, preprocessor).score(
+        customers, pd.DataFrame({'total_spent': [0.0, 0.5]}, index=['same', 'half_more']), relative=True
+    )
+    assert relative['summary'].loc['same', 'migrated'] == 0
+    assert relative['summary'].loc['same', 'ltv_shift_total'] == pytest.approx(0)
+    control = ScenarioScorer(segmentation, model, preprocessor).score(customers, {'control': {}})
+    assert list(control['summary'].index) == ['control'] and list(control['migrations']) == ['control']
+    with pytest.raises(ValueError):
+        ScenarioScorer(segmentation, model, preprocessor).score(customers, {'bad': {'lifetime_value': 1}})
+
+# tests/test_utils.py
+import asyncio
+import json
+import threading
+import pytest
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from src.data import DataLoader, SyntheticDataGenerator
+from src.utils import DatabaseConnection, QueryCache, get_engine
+from src.utils.query_cache import cache_key
+from src.models import PredictionModel
+from src.utils import save_results
+from src.utils.results import ResultsWriter, diff_runs, list_runs, read_metrics, read_table
+from src.utils.profiling import StageRecorder, profile_stage
+from src.analysis import PerformanceAnalyzer
+from src.utils.benchmark import IMPORT_TARGETS, run_benchmarks, run_database_benchmark, run_import_benchmark
+
+def test_run_benchmarks_writes_report(tmp_path):
+    output = tmp_path / 'bench.json'
+    report = run_benchmarks(n_customers=60, transactions_per_customer=5, output=output)
+    
+    stages = [stage['stage'] for stage in report['stages']]
+    for expected in ['load_customer_features', 'preprocess', 'segmentation_fit_predict',
+                     'prediction_train', 'prediction_predict', 'analyze_patterns', 'generate_insights']:
+        assert expected in stages
+    with open(output) as f:
+        assert json.load(f)['meta']['n_transactions'] == 300
+    assert all(stage['seconds'] >= 0 for stage in report['stages'])
+    assert all(stage['peak_memory_mb'] > 0 for stage in report['stages'])
+    untraced = run_benchmarks(n_customers=60, transactions_per_customer=5, trace_memory=False)
+    assert all(stage['peak_memory_mb'] is None for stage in untraced['stages'])
+
+def test_database_connection_shares_pool_and_returns_columns(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = get_engine(url, pool_size=4)
+    pd.DataFrame({'customer_id': [1, 2, 3], 'amount': [1.5, 2.5, 3.5]}).to_sql('transactions', engine, index=False)
+    connection = DatabaseConnection(engine=engine)
+    
+    assert get_engine(url, pool_size=4) is engine
+    assert DataLoader(connection=connection).engine is engine
+    result = connection.execute_query(
+        "SELECT customer_id, amount FROM transactions WHERE amount > :low", {'low': 2}
+    )
+    np.testing.assert_array_equal(result['customer_id'], [2, 3])
+    np.testing.assert_allclose(result['amount'], [2.5, 3.5])
+    
+    frames = asyncio.run(connection.gather_frames({
+        'all': "SELECT * FROM transactions",
+        'big': ("SELECT * FROM transactions WHERE amount > :low", {'low': 3})
+    }))
+    assert len(frames['all']) == 3 and len(frames['big']) == 1
+
+def test_sqlite_statement_timeout(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path / 'slow.db'}", statement_timeout_ms=50)
+    slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    with pytest.raises(db.exc.OperationalError):
+        DatabaseConnection(engine=engine).execute_query(slow)
+
+def test_load_tables_concurrently(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path / 'tables.db'}")
+    generator = SyntheticDataGenerator(n_customers=50, transactions_per_customer=4, seed=1)
+    generator.write_sql(engine)
+    
+    tables = DataLoader(engine=engine).load_tables(days=(pd.Timestamp.now() - generator.start_date).days + 1)
+    assert len(tables['customers']) == 50
+    assert len(tables['customer_patterns']) == 50
+    assert len(tables['transactions']) == 200
+
+def test_run_database_benchmark_reports_latency():
+    report = run_database_benchmark(n_customers=40, transactions_per_customer=3,
+                                    concurrency=(1, 4), n_queries=20)
+    assert [level['concurrency'] for level in report['concurrency']] == [1, 4]
+    assert all(level['latency_p95_ms'] >= level['latency_p50_ms'] > 0 for level in report['concurrency'])
+    assert report['load_tables']['concurrent_seconds'] > 0
+
+def test_import_benchmark_keeps_heavy_dependencies_lazy(tmp_path):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.normal(10, 2, (50, 5)), columns=[
+        'purchase_frequency', 'avg_transaction', 'days_since_last_purchase', 'total_spent', 'lifetime_value'
+    ])
+    model = PredictionModel()
+    model.train(data)
+    path = model.save(str(tmp_path / 'model'))
+    score = (
+        'import numpy as np\n'
+        'from src.models import PredictionModel\n'
+        f'PredictionModel.load({path!r}).compiled.predict(np.ones((4, 4)))'
+    )
+    report = run_import_benchmark({**IMPORT_TARGETS, 'score_saved_model': score}, repeats=1)
+    imports = {result['target']: result for result in report['imports']}
+    
+    assert imports['packages']['heavy_modules'] == []
+    assert 'sklearn' not in imports['score_saved_model']['heavy_modules']
+    assert not {'sklearn', 'sqlalchemy'} & set(imports['scoring']['heavy_modules'])
+    assert imports['scoring']['seconds'] < 0.5 * imports['everything']['seconds']
+
+def test_query_cache_invalidates_on_new_transactions(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    generator = SyntheticDataGenerator(n_customers=30, transactions_per_customer=4, seed=2)
+    generator.write_sql(engine)
+    cache = QueryCache(directory=str(tmp_path / 'cache'))
+    loader = DataLoader(engine=engine, cache=cache)
+    days = (pd.Timestamp.now() - generator.start_date).days + 1
+    
+    statements = []
+    db.event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    first = loader.load_transactions(days=days)
+    queried = len(statements)
+    second = loader.load_transactions(days=days)
+    pd.testing.assert_frame_equal(first, second)
+    assert cache.stats()['memory_hits'] == 1 and cache.stats()['misses'] == 1
+    # The high-water mark read for the miss is reused by the hit
+    assert len(statements) == queried
+    
+    # A fresh cache over the same directory is served from disk
+    disk_cache = QueryCache(directory=str(tmp_path / 'cache'))
+    pd.testing.assert_frame_equal(DataLoader(engine=engine, cache=disk_cache).load_transactions(days=days), first)
+    assert disk_cache.stats()['disk_hits'] == 1
+    
+    new = first.tail(1).assign(transaction_id=first['transaction_id'].max() + 1)
+    new.to_sql('transactions', engine, index=False, if_exists='append')
+    cache.high_water_mark_ttl = 0
+    assert len(loader.load_transactions(days=days)) == len(first) + 1
+    assert cache.stats()['invalidations'] == 1
+
+def test_query_cache_separates_databases(tmp_path):
+    runs = []
+    for seed in (2, 3):
+        engine = get_engine(f"sqlite:///{tmp_path / f'cache_{seed}.db'}")
+        generator = SyntheticDataGenerator(n_customers=20 + seed, transactions_per_customer=4, seed=seed)
+        generator.write_sql(engine)
+        days = (pd.Timestamp.now() - generator.start_date).days + 1
+        # Separate caches over one directory share the disk tier
+        loader = DataLoader(engine=engine, cache=QueryCache(directory=str(tmp_path / 'cache')))
+        runs.append((loader.engine, days, loader.load_transactions(days=days)))
+    assert len(runs[0][2]) != len(runs[1][2])
+    
+    shared = QueryCache(directory=str(tmp_path / 'cache'))
+    for engine, days, frame in runs:
+        served = DataLoader(engine=engine, cache=shared).load_transactions(days=days)
+        pd.testing.assert_frame_equal(served, frame)
+    assert shared.stats()['disk_hits'] == 2 and shared.stats()['misses'] == 0
+
+def test_query_cache_lookups_do_not_wait_for_disk_writes(tmp_path, monkeypatch):
+    frame = pd.DataFrame({'value': np.arange(100)})
+    cache = QueryCache(directory=str(tmp_path / 'cache'))
+    cache.put('cached', frame, high_water_mark=1)
+    started, release = threading.Event(), threading.Event()
+    write_disk = cache._write_disk
+    
+    def slow_write(key, entry):
+        started.set()
+        release.wait(5)
+        write_disk(key, entry)
+    
+    monkeypatch.setattr(cache, '_write_disk', slow_write)
+    writer = threading.Thread(target=cache.put, args=('slow', frame, 1))
+    writer.start()
+    started.wait(5)
+    found = []
+    reader = threading.Thread(target=lambda: found.append(cache.get('cached', high_water_mark=1)))
+    reader.start()
+    reader.join(1)
+    release.set()
+    writer.join()
+    
+    assert len(found) == 1 and found[0] is not None
+    assert (tmp_path / 'cache' / 'slow.arrow').exists()
+
+def test_query_cache_disk_tier_keeps_pandas_dtypes(tmp_path):
+    frame = pd.DataFrame({
+        'segment': pd.Categorical(['a', 'b', 'a']),
+        'visits': pd.array([1, None, 3], dtype='Int64')
+    })
+    QueryCache(directory=str(tmp_path / 'cache')).put('key', frame, high_water_mark=1)
+    cached = QueryCache(directory=str(tmp_path / 'cache')).get('key', high_water_mark=1)
+    
+    pd.testing.assert_frame_equal(cached, frame)
+
+def test_query_cache_evicts_by_bytes():
+    frame = pd.DataFrame({'value': np.arange(1000, dtype=np.float64)})
+    cache = QueryCache(max_bytes=int(frame.memory_usage(deep=True).sum() * 2.5))
+    for i in range(3):
+        cache.put(cache_key('SELECT :i', {'i': i}), frame, high_water_mark=1)
+    
+    assert cache.get(cache_key('SELECT  :i', {'i': 0}), high_water_mark=1) is None
+    assert cache.get(cache_key('SELECT :i', {'i': 2}), high_water_mark=1) is not None
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 2
+    assert stats['memory_bytes'] <= cache.max_bytes
+
+def test_results_writer_streams_tables_and_diffs_runs(tmp_path):
+    directory = str(tmp_path / 'results')
+    top = pd.DataFrame({'amount': [30.0, 20.0]}, index=pd.Index(['Books', 'Toys'], name='product_category'))
+    with ResultsWriter(directory, run_id='first') as writer:
+        writer.append('score', 'customers', pd.DataFrame({'customer_id': [1, 2], 'value': [1.0, 2.0]}))
+        writer.append('score', 'customers', pd.DataFrame({'customer_id': [3], 'value': [3.0]}))
+        writer.write_stage('score', {'rows': 3})
+        writer.write_stage('patterns', {'monetary': {'avg': np.float64(5.0), 'std': np.nan, 'skew': None},
+                                        'categorical': {'top': top}})
+    save_results({'patterns': {'monetary': {'avg': 6.5, 'std': np.nan, 'skew': 0.5}, 'note': 'rerun'}},
+                 filename='second.json', directory=directory)
+    
+    assert list_runs(directory) == ['first', 'second']
+    assert read_table(directory, 'first', 'score', 'customers')['customer_id'].tolist() == [1, 2, 3]
+    pd.testing.assert_frame_equal(read_table(directory, 'first', 'patterns', 'categorical.top'), top)
+    metrics = read_metrics(directory, run_id='first').set_index('metric')['value']
+    assert metrics['rows'] == 3 and metrics['monetary.avg'] == 5.0
+    
+    diff = diff_runs(directory)
+    assert diff.loc[('patterns', 'monetary.avg'), 'change'] == pytest.approx(1.5)
+    assert diff.loc[('patterns', 'note'), 'changed']
+    assert pd.isna(diff.loc[('patterns', 'note'), 'base'])
+    assert not diff.loc[('patterns', 'monetary.std'), 'changed']
+    assert diff.loc[('patterns', 'monetary.skew'), 'changed']
+    assert diff.loc[('score', 'rows'), 'changed']
+    
+    # Runs with only numeric metrics load as floats, so nulls come back as NaN
+    for run_id, std in [('third', np.nan), ('fourth', np.nan), ('fifth', 2.0)]:
+        with ResultsWriter(directory, run_id=run_id) as writer:
+            writer.write_stage('patterns', {'avg': 1.0, 'std': std})
+    assert not diff_runs(directory, 'third', 'fourth')['changed'].any()
+    assert diff_runs(directory, 'fourth', 'fifth')['changed'].tolist() == [False, True]
+
+def test_results_log_ignores_profiler_records(tmp_path):
+    directory = tmp_path / 'results'
+    with ResultsWriter(str(directory), run_id='only') as writer:
+        writer.write_stage('score', {'rows': 3})
+    analyzer = PerformanceAnalyzer(recorder=StageRecorder())
+    with profile_stage('load', rows=10, stage_recorder=analyzer.recorder):
+        pass
+    # The profiler's previous default shared this file name
+    analyzer.export_metrics(directory / 'metrics.jsonl')
+    analyzer.export_metrics(directory / 'runs.jsonl')
+    
+    assert list_runs(str(directory)) == ['only']
+    assert read_metrics(str(directory))['metric'].tolist() == ['rows']
+
+# tests/test_pipeline.py
+import multiprocessing
+import pytest
+import pandas as pd
+import numpy as np
+import sqlalchemy as db
+from datetime import datetime
+from src.data import DataLoader, DataPreprocessor, SyntheticDataGenerator
+from src.data.data_loader import derive_recency
+from src.models import PatternAnalyzer
+from src.pipeline import PipelineRunner
+from src.utils.database import get_engine
+from src.utils.results import ResultsWriter, read_metrics, read_table
+
+@pytest.fixture
+def pipeline_db(tmp_path):
+    """Write a small synthetic dataset to a SQLite file the workers can open."""
+    url = f"sqlite:///{tmp_path / 'pipeline.db'}"
+    engine = db.create_engine(url)
+    SyntheticDataGenerator(n_customers=300, transactions_per_customer=8, seed=3).write_sql(engine)
+    engine.dispose()
+    return url
+
+def test_partition_filter_covers_every_customer(pipeline_db):
+    loader = DataLoader(engine=db.create_engine(pipeline_db))
+    parts = [loader.query_customer_features(partition=(p, 3)) for p in range(3)]
+    ids = pd.concat(parts)['customer_id']
+    
+    assert ids.is_unique
+    assert set(ids) == set(loader.query_customer_features()['customer_id'])
+    assert all((part['customer_id'] % 3 == p).all() for p, part in enumerate(parts))
+    with pytest.raises(ValueError):
+        loader.query_customer_features(partition=(3, 3))
+
+def test_pipeline_runner_matches_single_process(pipeline_db, tmp_path):
+    as_of = datetime(2024, 1, 1)
+    sink = ResultsWriter(str(tmp_path / 'results'), run_id='run')
+    result = PipelineRunner(engine_url=pipeline_db, n_jobs=2, n_partitions=3, n_clusters=3,
+                            train_sample_size=200).run(as_of=as_of, work_dir=str(tmp_path), sink=sink)
+    
+    loader = DataLoader(engine=db.create_engine(pipeline_db))
+    features = derive_recency(loader.query_customer_features(), as_of)
+    reference = DataPreprocessor().fit(features)
+    customers = result['customers']
+    
+    assert len(customers) == len(features)
+    assert set(customers['segment'].unique()) <= {'Segment_1', 'Segment_2', 'Segment_3'}
+    assert customers['predicted_value'].notna().all()
+    np.testing.assert_allclose(result['preprocessor'].scaler.mean_, reference.scaler.mean_, rtol=1e-3)
+    np.testing.assert_allclose(result['preprocessor'].scaler.scale_, reference.scaler.scale_, rtol=1e-2)
+    
+    expected = PatternAnalyzer(incremental=True).analyze_patterns(pd.concat(loader.stream_transactions()))
+    assert result['patterns']['temporal'] == pytest.approx(expected['temporal'])
+    assert result['patterns']['monetary']['avg_transaction_value'] == pytest.approx(
+        expected['monetary']['avg_transaction_value']
+    )
+    
+    metrics = read_metrics(str(tmp_path / 'results'), run_id='run')
+    assert list(dict.fromkeys(metrics['stage'])) == ['load', 'train', 'score', 'patterns', 'insights']
+    written = read_table(str(tmp_path / 'results'), 'run', 'score', 'customers')
+    assert len(written) == len(customers)
+    assert written['customer_id'].sort_values().tolist() == customers['customer_id'].sort_values().tolist()
+    assert len(read_table(str(tmp_path / 'results'), 'run', 'cluster', 'centroids')) == 3
+
+def _pooled_connections(url):
+    return get_engine(url).pool.checkedin()
+
+def test_pipeline_workers_do_not_inherit_parent_pool(pipeline_db, tmp_path):
+    engine = get_engine(pipeline_db)
+    with engine.connect() as conn:
+        conn.execute(db.text("SELECT 1"))
+    assert engine.pool.checkedin() == 1
+    
+    result = PipelineRunner(engine_url=pipeline_db, n_jobs=2, n_partitions=2, n_clusters=2,
+                            train_sample_size=100).run(analyze_patterns=False, work_dir=str(tmp_path))
+    assert len(result['customers']) == 300
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        assert pool.apply(_pooled_connections, (pipeline_db,)) == 0
+    with engine.connect() as conn:
+        assert conn.execute(db.text("SELECT COUNT(*) FROM customers")).scalar() == 300
+